@@ -0,0 +1,633 @@
+"""
+Benchmarks for mtsespy
+
+Run with pytest-benchmark, saving results for each release in
+benchmarks/results so that later runs can be compared against them
+
+    $ python -m pytest benchmarks --benchmark-storage=benchmarks/results --benchmark-save=1.1.0
+    $ python -m pytest benchmarks --benchmark-storage=benchmarks/results --benchmark-compare --benchmark-compare-fail=mean:20%
+"""
+
+import itertools
+import multiprocessing
+from array import array
+from math import log2
+from time import perf_counter_ns
+
+import numpy as np
+import pytest
+
+import mtsespy as mts
+
+FREQUENCIES = 440.0 * 2 ** ((np.arange(128) - 69) / 19)
+
+
+@pytest.fixture
+def master():
+    mts.reinitialize()
+    with mts.Master() as master:
+        yield master
+
+
+@pytest.fixture
+def client(master):
+    with mts.Client() as c:
+        yield c
+
+
+# Per-call latency of every scalar binding
+
+CLIENT_CALLS = {
+    "has_master": (),
+    "should_filter_note": (69, 0),
+    "note_to_frequency": (69, 0),
+    "retuning_in_semitones": (69, 0),
+    "retuning_as_ratio": (69, 0),
+    "frequency_to_note": (440.0, 0),
+    "frequency_to_note_and_channel": (440.0,),
+    "get_scale_name": (),
+    "get_period_ratio": (),
+    "get_period_semitones": (),
+    "get_map_size": (),
+    "get_map_start_key": (),
+    "get_ref_key": (),
+    "has_received_mts_sysex": (),
+    "client_should_update_library": (),
+}
+
+CLIENT_METHODS = {
+    "has_master": (),
+    "should_filter_note": (69, 0),
+    "note_to_frequency": (69, 0),
+    "retuning_in_semitones": (69, 0),
+    "retuning_as_ratio": (69, 0),
+    "frequency_to_note": (440.0, 0),
+    "frequency_to_note_and_channel": (440.0,),
+}
+
+CLIENT_PROPERTIES = [
+    "scale_name",
+    "period_ratio",
+    "period_semitones",
+    "map_size",
+    "map_start_key",
+    "ref_key",
+    "has_received_mts_sysex",
+    "should_update_library",
+]
+
+MASTER_CALLS = {
+    "set_note_tuning": (441.0, 69),
+    "set_scale_name": ("benchmark",),
+    "filter_note": (True, 60, -1),
+    "clear_note_filter": (),
+    "set_multi_channel": (True, 0),
+    "set_multi_channel_note_tuning": (441.0, 69, 0),
+    "filter_note_multi_channel": (True, 60, 0),
+    "clear_note_filter_multi_channel": (0,),
+    "set_period_ratio": (2.0,),
+    "set_map_size": (12,),
+    "set_map_start_key": (60,),
+    "set_ref_key": (69,),
+    "get_num_clients": (),
+    "has_ipc": (),
+    "can_register_master": (),
+    "master_should_update_library": (),
+}
+
+
+@pytest.mark.benchmark(group="client call")
+@pytest.mark.parametrize("name", CLIENT_CALLS)
+def test_client_call(benchmark, client, name):
+    benchmark(getattr(mts, name), client, *CLIENT_CALLS[name])
+
+
+@pytest.mark.benchmark(group="client method")
+@pytest.mark.parametrize("name", CLIENT_METHODS)
+def test_client_method(benchmark, client, name):
+    benchmark(getattr(client, name), *CLIENT_METHODS[name])
+
+
+@pytest.mark.benchmark(group="client method")
+@pytest.mark.parametrize("name", CLIENT_PROPERTIES)
+def test_client_property(benchmark, client, name):
+    benchmark(getattr, client, name)
+
+
+@pytest.mark.benchmark(group="master call")
+@pytest.mark.parametrize("name", MASTER_CALLS)
+def test_master_call(benchmark, master, name):
+    benchmark(getattr(mts, name), *MASTER_CALLS[name])
+
+
+@pytest.mark.benchmark(group="call statistics")
+@pytest.mark.parametrize("enabled", [False, True])
+def test_note_to_frequency_stats(benchmark, client, enabled):
+    mts.enable_stats(enabled)
+    try:
+        benchmark(mts.note_to_frequency, client, 69, 0)
+    finally:
+        mts.enable_stats(False)
+        mts.reset_stats()
+
+
+# Scalar loops against batched calls over all 16 x 128 notes
+
+
+@pytest.mark.benchmark(group="all notes")
+def test_note_to_frequency_loop(benchmark, client):
+    def loop():
+        return [mts.note_to_frequency(client, n, c) for c in range(16) for n in range(128)]
+
+    benchmark(loop)
+
+
+@pytest.mark.benchmark(group="all notes")
+def test_note_to_frequency_array(benchmark, client):
+    out = np.empty((16, 128))
+    benchmark(mts.note_to_frequency_array, client, out=out)
+
+
+@pytest.mark.benchmark(group="all notes")
+def test_should_filter_note_array(benchmark, client):
+    benchmark(mts.should_filter_note_array, client)
+
+
+@pytest.mark.benchmark(group="all notes")
+def test_refresh(benchmark, client):
+    benchmark(client.refresh)
+
+
+@pytest.mark.benchmark(group="all notes")
+def test_tables_read(benchmark, client):
+    tables = client.tables()
+    out = np.empty((17, 128))
+    benchmark(tables.read, out)
+
+
+@pytest.mark.benchmark(group="all notes")
+def test_tables_view_sum(benchmark, client):
+    frequencies = client.tables().frequencies()
+    benchmark(frequencies.sum)
+
+
+@pytest.mark.benchmark(group="nearest notes")
+def test_frequency_to_note_loop(benchmark, client):
+    freqs = np.geomspace(20.0, 10000.0, 1000).tolist()
+    benchmark(lambda: [mts.frequency_to_note(client, f, 0) for f in freqs])
+
+
+@pytest.mark.benchmark(group="nearest notes")
+def test_frequency_to_note_array(benchmark, client):
+    freqs = np.geomspace(20.0, 10000.0, 1000)
+    benchmark(mts.frequency_to_note_array, client, freqs, 0)
+
+
+# Keyboard mapping of every note
+
+
+@pytest.fixture
+def mapped_client(client):
+    mts.set_note_tunings(FREQUENCIES)
+    mts.set_map_size(19)
+    mts.set_map_start_key(60)
+    mts.set_ref_key(69)
+    return client
+
+
+@pytest.mark.benchmark(group="key mapping")
+def test_key_mapping_loop(benchmark, mapped_client):
+    def loop():
+        map_size = mapped_client.map_size
+        map_start_key = mapped_client.map_start_key
+        return [
+            (
+                *divmod(n - map_start_key, map_size),
+                not mapped_client.should_filter_note(n, 0),
+                100 * mapped_client.retuning_in_semitones(n, 0),
+            )
+            for n in range(128)
+        ]
+
+    benchmark(loop)
+
+
+@pytest.mark.benchmark(group="key mapping")
+def test_key_mapping_array(benchmark, mapped_client):
+    benchmark(mts.key_mapping_array, mapped_client)
+
+
+@pytest.mark.benchmark(group="key mapping")
+def test_snapshot_key_mapping(benchmark, mapped_client):
+    snapshot = mapped_client.snapshot()
+    benchmark(snapshot.key_mapping)
+
+
+# set_note_tunings inputs
+
+
+SET_NOTE_TUNINGS_INPUTS = {
+    "list": FREQUENCIES.tolist(),
+    "float64 array": FREQUENCIES,
+    "float32 array": FREQUENCIES.astype(np.float32),
+    "array.array": array("d", FREQUENCIES),
+    "strided array": np.repeat(FREQUENCIES, 2)[::2],
+}
+
+
+@pytest.mark.benchmark(group="set_note_tunings")
+@pytest.mark.parametrize("kind", SET_NOTE_TUNINGS_INPUTS)
+def test_set_note_tunings(benchmark, master, kind):
+    benchmark(mts.set_note_tunings, SET_NOTE_TUNINGS_INPUTS[kind])
+
+
+@pytest.mark.benchmark(group="set_note_tunings")
+def test_set_note_tuning_loop(benchmark, master):
+    freqs = FREQUENCIES.tolist()
+
+    def loop():
+        for n, f in enumerate(freqs):
+            mts.set_note_tuning(f, n)
+
+    benchmark(loop)
+
+
+@pytest.mark.benchmark(group="set_note_tunings")
+def test_set_all_multi_channel_note_tunings(benchmark, master):
+    benchmark(mts.set_all_multi_channel_note_tunings, np.tile(FREQUENCIES, (16, 1)))
+
+
+# SysEx throughput
+
+
+@pytest.mark.benchmark(group="sysex")
+def test_parse_midi_data_bulk_dump(benchmark, client):
+    msg = mts.encode_bulk_tuning_dump(FREQUENCIES)
+    benchmark.extra_info["bytes"] = len(msg)
+    benchmark(mts.parse_midi_data, client, msg)
+
+
+@pytest.mark.benchmark(group="sysex")
+def test_parse_midi_data_single_note(benchmark, client):
+    msg = mts.encode_single_note_tuning([69], [441.0])
+    benchmark.extra_info["bytes"] = len(msg)
+    benchmark(mts.parse_midi_data, client, msg)
+
+
+@pytest.mark.benchmark(group="sysex")
+def test_sysex_stream_feed(benchmark, client):
+    data = b"".join(
+        mts.encode_single_note_tuning([n], [f]) for n, f in enumerate(FREQUENCIES)
+    )
+    stream = mts.SysExStream(client)
+    benchmark.extra_info["bytes"] = len(data)
+    benchmark(stream.feed, data)
+
+
+@pytest.mark.benchmark(group="sysex")
+def test_encode_bulk_tuning_dump(benchmark):
+    benchmark(mts.encode_bulk_tuning_dump, FREQUENCIES)
+
+
+@pytest.mark.benchmark(group="sysex")
+def test_decode_mts_sysex(benchmark):
+    benchmark(mts.decode_mts_sysex, mts.encode_bulk_tuning_dump(FREQUENCIES))
+
+
+# Note filter masks against one call per note
+
+
+@pytest.mark.benchmark(group="filter mask")
+def test_filter_note_loop(benchmark, master):
+    masks = np.random.default_rng(0).random((2, 16, 128)) < 0.5
+
+    def loop():
+        loop.i ^= 1
+        for c in range(16):
+            for n in range(128):
+                mts.filter_note(bool(masks[loop.i, c, n]), n, c)
+
+    loop.i = 0
+    benchmark(loop)
+
+
+@pytest.mark.benchmark(group="filter mask")
+def test_set_filter_mask(benchmark, master):
+    masks = np.random.default_rng(0).random((2, 16, 128)) < 0.5
+
+    def toggle():
+        toggle.i ^= 1
+        mts.set_filter_mask(masks[toggle.i])
+
+    toggle.i = 0
+    benchmark(toggle)
+
+
+@pytest.mark.benchmark(group="filter mask")
+def test_get_filter_mask(benchmark, client):
+    out = np.empty((16, 128), dtype=bool)
+    benchmark(mts.get_filter_mask, client, out=out)
+
+
+# Recording and replaying master writes
+
+
+@pytest.mark.benchmark(group="recording")
+@pytest.mark.parametrize("recording", [False, True])
+def test_set_note_tunings_recorded(benchmark, master, tmp_path, recording):
+    tables = [FREQUENCIES, FREQUENCIES * 1.01]
+
+    def toggle():
+        toggle.i ^= 1
+        mts.set_note_tunings(tables[toggle.i])
+
+    toggle.i = 0
+    if recording:
+        with mts.Recorder(tmp_path / "bench.mtslog"):
+            benchmark(toggle)
+    else:
+        benchmark(toggle)
+
+
+@pytest.mark.benchmark(group="recording")
+def test_replay_glide(benchmark, master, tmp_path):
+    path = tmp_path / "glide.mtslog"
+    with mts.Recorder(path), mts.GlideScheduler() as glides:
+        glides.glide_to(FREQUENCIES * 1.5, duration=0.2)
+        glides.wait()
+    benchmark(mts.replay, path, speed=None)
+
+
+# Voice allocation for synths without MTS-ESP support
+
+
+@pytest.mark.benchmark(group="voice allocation")
+def test_voice_allocator_note_on_off(benchmark, client):
+    mts.set_note_tunings(FREQUENCIES)
+    voices = mts.VoiceAllocator(client, channels=range(1, 16))
+
+    def play():
+        voices.note_on(60, 0, 100)
+        voices.note_off(60, 0)
+
+    benchmark(play)
+
+
+@pytest.mark.benchmark(group="voice allocation")
+def test_python_note_on_off(benchmark, client):
+    # The per-note conversion the allocator replaces
+    mts.set_note_tunings(FREQUENCIES)
+
+    def play():
+        f = mts.note_to_frequency(client, 60, 0)
+        semitones = 69 + 12 * log2(f / 440.0)
+        note = round(semitones)
+        return note, 8192 + round((semitones - note) / 2.0 * 8192)
+
+    benchmark(play)
+
+
+@pytest.mark.benchmark(group="voice allocation")
+def test_voice_allocator_process(benchmark, client):
+    # 1000 note ons and offs for chords of up to 8 notes, per call
+    mts.set_note_tunings(FREQUENCIES)
+    voices = mts.VoiceAllocator(client, channels=range(1, 16))
+    notes = 48 + np.arange(500) % 37
+    events = np.zeros((1000, 3), dtype=np.int32)
+    events[0::2] = np.column_stack([np.full(500, 0x90), notes, np.full(500, 100)])
+    events[1::2] = np.column_stack([np.full(500, 0x80), np.roll(notes, 8), np.zeros(500)])
+    data = events.astype(np.uint8).tobytes()
+    benchmark(voices.process, data)
+
+
+# Generating tunings
+
+
+@pytest.mark.benchmark(group="tunings")
+@pytest.mark.parametrize("cached", [False, True])
+def test_keyboard_frequencies(benchmark, master, cached):
+    scale = mts.edo_scale(19)
+
+    def generate():
+        if not cached:
+            mts.keyboard_frequencies.cache_clear()
+        mts.set_note_tunings(mts.keyboard_frequencies(scale, ref_key=60))
+
+    benchmark(generate)
+
+
+@pytest.mark.benchmark(group="tunings")
+def test_ji_lattice_scale(benchmark):
+    def generate():
+        mts.ji_lattice_scale.cache_clear()
+        mts.ji_lattice_scale((3, 5, 7), ((-2, 2), (-1, 1), (-1, 1)))
+
+    benchmark(generate)
+
+
+@pytest.mark.benchmark(group="tunings")
+@pytest.mark.parametrize("cached", [False, True])
+def test_isomorphic_frequencies(benchmark, master, cached):
+    notes = 11 + np.arange(8) + 10 * np.arange(8)[:, None]
+
+    def generate():
+        if not cached:
+            mts.isomorphic_frequencies.cache_clear()
+        mts.set_note_tunings(mts.isomorphic_frequencies(31, (5, 13), notes))
+
+    benchmark(generate)
+
+
+# Rendering MIDI files
+
+
+@pytest.mark.benchmark(group="render")
+def test_render_notes(benchmark, tmp_path):
+    # 10000 notes in a chord sequence, with a tuning change every 100
+    sysex = mts.encode_bulk_tuning_dump(FREQUENCIES)
+    length = len(sysex) - 1
+    sysex_event = b"\x00\xf0" + bytes([0x80 | length >> 7, length & 0x7F]) + sysex[1:]
+    body = b""
+    for i in range(100):
+        body += sysex_event
+        for j in range(100):
+            note = 36 + (i + j) % 64
+            body += b"\x00\x90" + bytes([note, 100]) + b"\x60\x80" + bytes([note, 0])
+    body += b"\x00\xff\x2f\x00"
+    path = tmp_path / "bench.mid"
+    path.write_bytes(
+        b"MThd\x00\x00\x00\x06\x00\x00\x00\x01\x01\xe0"
+        + b"MTrk"
+        + len(body).to_bytes(4, "big")
+        + body
+    )
+
+    def render():
+        return sum(len(notes) for notes in mts.render_notes(path, FREQUENCIES))
+
+    assert benchmark(render) == 10000
+
+
+# Switching between two master states, 19-EDO and 22-EDO on all channels
+# with the notes above 2 kHz filtered
+
+
+def _preset_states():
+    states = []
+    for divisions in (19, 22):
+        frequencies = 440.0 * 2 ** ((np.arange(128) - 69) / divisions)
+        states.append((divisions, frequencies, np.flatnonzero(frequencies > 2000.0)))
+    return states
+
+
+@pytest.mark.benchmark(group="presets")
+def test_individual_calls(benchmark, master):
+    states = _preset_states()
+
+    def switch():
+        for divisions, frequencies, filtered in states:
+            mts.clear_note_filter()
+            for channel in range(16):
+                mts.set_multi_channel(True, channel)
+                mts.set_multi_channel_note_tunings(frequencies, channel)
+                mts.clear_note_filter_multi_channel(channel)
+                for note in filtered:
+                    mts.filter_note_multi_channel(True, int(note), channel)
+            mts.set_scale_name(f"{divisions}-EDO")
+            mts.set_period_ratio(2.0)
+            mts.set_map_size(divisions)
+            mts.set_map_start_key(60)
+            mts.set_ref_key(69)
+
+    benchmark(switch)
+
+
+@pytest.mark.benchmark(group="presets")
+def test_preset_bank_activate(benchmark, master, tmp_path):
+    bank = mts.PresetBank(2)
+    for i, (divisions, frequencies, filtered) in enumerate(_preset_states()):
+        bank.set(
+            i,
+            multi_channel_frequencies=np.tile(frequencies, (16, 1)),
+            multi_channel_filter=np.isin(np.arange(128), filtered),
+            multi_channel=np.ones(16, dtype=bool),
+            scale_name=f"{divisions}-EDO",
+            map_size=divisions,
+            map_start_key=60,
+            ref_key=69,
+        )
+    bank.save(tmp_path / "bench.mtsbank")
+    with mts.PresetBank.load(tmp_path / "bench.mtsbank") as bank:
+
+        def switch():
+            bank.activate(0)
+            bank.activate(1)
+
+        benchmark(switch)
+
+
+# Client lifetime
+
+
+@pytest.mark.benchmark(group="client lifetime")
+def test_client_context_manager(benchmark):
+    def use_client():
+        with mts.Client():
+            pass
+
+    benchmark(use_client)
+
+
+@pytest.mark.benchmark(group="client lifetime")
+def test_pooled_client_context_manager(benchmark):
+    pool = mts.ClientPool()
+
+    def use_client():
+        with mts.Client(pool=pool):
+            pass
+
+    try:
+        benchmark(use_client)
+    finally:
+        pool.close()
+
+
+@pytest.mark.benchmark(group="client lifetime")
+def test_register_and_deregister_client(benchmark):
+    benchmark(lambda: mts.deregister_client(mts.register_client()))
+
+
+# Master to client propagation across processes
+
+
+def _watch_note(connection):
+    """
+    Report when a client in this process sees note 69 change to each requested frequency.
+    """
+    with mts.Client() as c:
+        connection.send("ready")
+        for target in iter(connection.recv, None):
+            deadline = perf_counter_ns() + 10**9
+            while mts.note_to_frequency(c, 69, 0) != target:
+                if perf_counter_ns() > deadline:
+                    connection.send(None)
+                    break
+            else:
+                connection.send(perf_counter_ns())
+
+
+@pytest.mark.benchmark(group="propagation")
+def test_cross_process_propagation(benchmark, master):
+    """
+    Time from the master setting a note to a client in another process seeing it.
+
+    The round is timed until the client process has replied, and the median
+    one-way latency, from perf_counter timestamps in both processes, is
+    stored in the extra info.
+    """
+    context = multiprocessing.get_context("spawn")
+    parent, child = context.Pipe()
+    process = context.Process(target=_watch_note, args=(child,))
+    process.start()
+    try:
+        assert parent.recv() == "ready"
+        latencies = []
+        # Quarter hertz steps are exact in the float32 used by set_note_tuning
+        targets = (441.0 + 0.25 * i for i in itertools.count())
+
+        def propagate():
+            target = next(targets)
+            parent.send(target)
+            start = perf_counter_ns()
+            mts.set_note_tuning(target, 69)
+            seen = parent.recv()
+            if seen is None:
+                pytest.skip("IPC between processes not available")
+            latencies.append(seen - start)
+
+        benchmark.pedantic(propagate, rounds=200, warmup_rounds=5)
+        benchmark.extra_info["median_one_way_latency_ns"] = float(np.median(latencies))
+    finally:
+        parent.send(None)
+        process.join(5)
+
+
+# Commands sent to a master server from another process
+
+
+@pytest.mark.benchmark(group="master server")
+def test_master_server_commands(benchmark):
+    """
+    Time for a producer to send 1000 note tunings to a master server and have them applied.
+    """
+    mts.reinitialize()
+    with mts.MasterServer() as server, server.connect() as proxy:
+
+        def send():
+            for i in range(1000):
+                proxy.set_note_tuning(FREQUENCIES[i % 128], i % 128)
+            proxy.sync()
+
+        benchmark.pedantic(send, rounds=20, warmup_rounds=2)
+        stats = proxy.stats()
+        benchmark.extra_info["writes_per_command"] = stats["writes"] / stats["commands"]
@@ -81,10 +81,11 @@ def tune(scale, tuning_map, base_freq=261.625565):
         Frequency in Hz to assign to 1.0 frequency ratio. Defaults to middle
         C frequency.
     """
-    with mts.Master():
-        for (i, j), n in MIDI_NOTE_MAP.items():
-            octave, degree = tuning_map[i, j]
-            mts.set_note_tuning(2**octave * scale[degree] * base_freq, n)
+    with mts.Master() as master:
+        with master.batch() as batch:
+            for (i, j), n in MIDI_NOTE_MAP.items():
+                octave, degree = tuning_map[i, j]
+                batch.set_note_tuning(2**octave * scale[degree] * base_freq, n)
         signal.pause()
 
 
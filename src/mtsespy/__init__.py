@@ -1,2 +1,30 @@
+from ._libmts import preload as _preload
+
+_preload()
+
 from ._mtsespy import *
-from .context_managers import Client, Master, MasterExistsError
+from .context_managers import (
+    Client,
+    ClientPool,
+    Master,
+    MasterBatch,
+    MasterExistsError,
+    client_pool,
+)
+from .streams import SysExStream
+from .scala import scala_files_to_frequencies
+from .glide import GlideScheduler
+from .watch import TuningChange, watch
+from .recording import LogEvent, Recorder, read_log, replay
+from .render import NOTE_DTYPE, read_midi_file, render_notes
+from .tunings import (
+    STANDARD_FREQUENCIES,
+    edo_scale,
+    isomorphic_frequencies,
+    ji_lattice_scale,
+    keyboard_frequencies,
+    rank2_scale,
+)
+from .voices import VoiceAllocator
+from .presets import PRESET_DTYPE, PresetBank
+from .server import MasterProxy, MasterServer
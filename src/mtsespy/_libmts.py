@@ -0,0 +1,53 @@
+"""
+Selecting the libMTS dynamic library used by the extension module
+
+libMTSClient and libMTSMaster load libMTS from a fixed path for each OS. Setting
+the MTSESPY_LIBMTS environment variable, before mtsespy is imported, to the
+path of another library exporting the libMTS functions under that path as its
+soname (install name on macOS), or to "standin" for the stand-in built with
+the MTSESPY_LIBMTS_STANDIN CMake option, loads it first so their dlopen calls
+return it instead.
+"""
+
+import ctypes
+import os
+import sys
+from pathlib import Path
+
+DEFAULT_PATH = {
+    "linux": Path("/usr/local/lib/libMTS.so"),
+    "darwin": Path("/Library/Application Support/MTS-ESP/libMTS.dylib"),
+    "win32": Path("/Program Files/Common Files/MTS-ESP/LIBMTS.dll"),
+}[sys.platform]
+
+STANDIN_PATH = Path(__file__).with_name(
+    "libMTS-standin.dylib" if sys.platform == "darwin" else "libMTS-standin.so"
+)
+
+_library = None
+
+
+def libmts_path():
+    """
+    Path of the libMTS library the extension module uses.
+    """
+    path = os.environ.get("MTSESPY_LIBMTS")
+    if not path:
+        return DEFAULT_PATH
+    if path == "standin":
+        return STANDIN_PATH
+    return Path(path)
+
+
+def preload():
+    """
+    Load the library named by MTSESPY_LIBMTS, if set.
+    """
+    path = libmts_path()
+    if path == DEFAULT_PATH:
+        return
+    if not path.exists():
+        raise FileNotFoundError(f"libMTS stand-in '{path}' not found")
+    global _library
+    # Kept local so its symbols do not interpose on the extension module's
+    _library = ctypes.CDLL(str(path), mode=os.RTLD_LOCAL if hasattr(os, "RTLD_LOCAL") else 0)
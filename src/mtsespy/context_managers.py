@@ -2,30 +2,40 @@
 Context managers for MTS-ESP clients and master
 """
 
+import atexit
+import os
 import signal
 import sys
 import threading
-from pathlib import Path
-from functools import partial
+import weakref
+from functools import partial, wraps
+from time import monotonic, perf_counter_ns
 
 import mtsespy as mts
+from ._libmts import libmts_path
+from ._mtsespy import _MasterBatch, _record_call
+
+
+_checked_dso = None
 
 
 def _check_dso():
     """
     Check the MTS-ESP dynamic shared object is installed and has IPC.
+
+    Once a check passes it is not repeated for the same path.
     """
-    dso_path = {
-        "linux": Path("/usr/local/lib/libMTS.so"),
-        "darwin": Path("/Library/Application Support/MTS-ESP/libMTS.dylib"),
-        "win32": Path("/Program Files/Common Files/MTS-ESP/LIBMTS.dll"),
-    }[sys.platform]
+    global _checked_dso
+    dso_path = libmts_path()
+    if dso_path == _checked_dso:
+        return
     if not dso_path.exists():
         msg = f"MTS-ESP dynamic shared object '{dso_path}' not found.\n\n{dso_path.name} can be downloaded from https://github.com/ODDSound/MTS-ESP/tree/main/libMTS"
         raise FileNotFoundError(msg)
     if not mts.has_ipc():
         msg = f"IPC not available for MTS-ESP.\n\nEither '{dso_path}' does not support IPC or IPC is disabled in MTS-ESP.conf"
         raise RuntimeError(msg)
+    _checked_dso = dso_path
 
 
 def _deregister_handler(signum, frame, name):
@@ -33,7 +43,29 @@ def _deregister_handler(signum, frame, name):
     sys.exit(128 + signum)
 
 
+def _timed(name):
+    """
+    Record calls to the decorated function in call statistics, when enabled.
+    """
+
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            if not mts.stats_enabled():
+                return f(*args, **kwargs)
+            start = perf_counter_ns()
+            try:
+                return f(*args, **kwargs)
+            finally:
+                _record_call(name, perf_counter_ns() - start)
+
+        return wrapper
+
+    return decorator
+
+
 class _SignalHandler:
+    @_timed("_SignalHandler.set_handlers")
     def set_handlers(self, name):
         # Store existing signal handlers
         # Can only register signal handlers on main thread
@@ -45,6 +77,7 @@ class _SignalHandler:
             for x in self._handlers:
                 signal.signal(x, handler)
 
+    @_timed("_SignalHandler.restore_handlers")
     def restore_handlers(self):
         # Restore original signal handlers
         if threading.current_thread() is threading.main_thread():
@@ -55,19 +88,150 @@ class _SignalHandler:
 class Client(_SignalHandler):
     """
     Context manager to automatically register and deregister client.
+
+    If `pool` is a `ClientPool`, an idle client is leased from it, or
+    registered if there is none, and is returned to the pool on exit instead
+    of being deregistered. A leased client is not a fresh registration: it
+    keeps any local tuning set by `parse_midi_data` during earlier leases, and
+    `has_received_mts_sysex` stays true once any lease has sent it SysEx.
     """
 
-    def __init__(self):
-        _check_dso()
-        self._client = mts.register_client()
+    def __init__(self, pool=None):
+        self._pool = pool
+        if pool is None:
+            _check_dso()
+            self._client = mts.register_client()
+        else:
+            self._client = pool.acquire()
 
     def __enter__(self):
-        self.set_handlers(name="client")
+        if self._pool is None:
+            self.set_handlers(name="client")
         return self._client
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.restore_handlers()
-        mts.deregister_client(self._client)
+        if self._pool is None:
+            self.restore_handlers()
+            mts.deregister_client(self._client)
+        else:
+            self._pool.release(self._client)
+
+
+class ClientPool:
+    """
+    Registered clients kept for reuse across short-lived leases.
+
+    `acquire` returns an idle client, registering a new one only when none is
+    idle, and `release` returns it to the pool. Clients idle for longer than
+    `idle_timeout` seconds, or beyond the `max_idle` most recently used, are
+    deregistered the next time the pool is used or its length taken. `close`
+    deregisters every idle client, and is called at exit for the pool
+    `mtsespy.client_pool`. Safe to use from several threads, and in children
+    forked while the pool is in use, which start with no idle clients.
+
+    A leased client is not a fresh registration. It keeps the state libMTS
+    holds for it from earlier leases: any local tuning set by
+    `parse_midi_data`, which stays in use until a master connects, and
+    `has_received_mts_sysex`. Use `Client()` without a pool where that
+    matters. Idle clients count towards `get_num_clients`.
+    """
+
+    def __init__(self, idle_timeout=60.0, max_idle=16):
+        if idle_timeout < 0:
+            raise ValueError("idle_timeout must not be negative")
+        if max_idle < 0:
+            raise ValueError("max_idle must not be negative")
+        self.idle_timeout = idle_timeout
+        self.max_idle = max_idle
+        self._lock = threading.Lock()
+        # (client, time released), most recently released last
+        self._idle = []
+        _pools.add(self)
+
+    def _after_fork_in_child(self):
+        # Another thread may have held the lock when the process forked, and
+        # clients registered by the parent are not the child's to deregister
+        self._lock = threading.Lock()
+        self._idle = []
+
+    def __len__(self):
+        with self._lock:
+            expired = self._evict(monotonic())
+            n = len(self._idle)
+        self._deregister(expired)
+        return n
+
+    def acquire(self):
+        """
+        Lease a client, registering a new one if none is idle.
+        """
+        client = None
+        with self._lock:
+            expired = self._evict(monotonic())
+            if self._idle:
+                client = self._idle.pop()[0]
+        self._deregister(expired)
+        if client is not None:
+            return client
+        _check_dso()
+        return mts.register_client()
+
+    def release(self, client):
+        """
+        Return a leased client to the pool.
+        """
+        now = monotonic()
+        with self._lock:
+            idle = self._idle
+            idle.append((client, now))
+            if len(idle) <= self.max_idle and now - idle[0][1] <= self.idle_timeout:
+                return
+            expired = self._evict(now)
+        self._deregister(expired)
+
+    def lease(self):
+        """
+        Context manager leasing a client from the pool.
+        """
+        return Client(pool=self)
+
+    def close(self):
+        """
+        Deregister all idle clients.
+        """
+        with self._lock:
+            expired = [client for client, _ in self._idle]
+            self._idle.clear()
+        self._deregister(expired)
+
+    def _evict(self, now):
+        # Called with the lock held; returns the clients to deregister
+        n = max(len(self._idle) - self.max_idle, 0)
+        while n < len(self._idle) and now - self._idle[n][1] > self.idle_timeout:
+            n += 1
+        expired = [client for client, _ in self._idle[:n]]
+        del self._idle[:n]
+        return expired
+
+    @staticmethod
+    def _deregister(clients):
+        for client in clients:
+            mts.deregister_client(client)
+
+
+_pools = weakref.WeakSet()
+
+
+def _after_fork_in_child():
+    for pool in list(_pools):
+        pool._after_fork_in_child()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+client_pool = ClientPool()
+atexit.register(client_pool.close)
 
 
 class Master(_SignalHandler):
@@ -76,6 +240,7 @@ class Master(_SignalHandler):
 
     If a master already exists then `MasterExistsError` is raised.  Signal
     handlers are added to call `deregister_master` on SIGINT or SIGTERM.
+    Entering returns the `Master`, whose `batch` method starts a `MasterBatch`.
     """
 
     def __init__(self):
@@ -86,12 +251,45 @@ class Master(_SignalHandler):
         mts.register_master()
 
     def __enter__(self):
-        return None
+        return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.restore_handlers()
         mts.deregister_master()
 
+    def batch(self):
+        """
+        Buffer tuning and note filter writes until the returned batch exits.
+        """
+        return MasterBatch()
+
+
+class MasterBatch(_MasterBatch):
+    """
+    Context manager to buffer master writes and commit them together.
+
+    Has the methods `set_note_tuning`, `set_note_tunings`,
+    `set_multi_channel_note_tuning`, `set_multi_channel_note_tunings`,
+    `filter_note`, `clear_note_filter`, `filter_note_multi_channel` and
+    `clear_note_filter_multi_channel`, taking the same arguments as the module
+    functions. Writes are buffered until the block exits without an exception,
+    then only notes whose tuning or filter differs from what this process last
+    wrote are sent to MTS-ESP. A tuning table with many changed notes is sent
+    in one bulk call. If the block raises, the buffered writes are discarded.
+
+    Registering or reinitializing the master resets MTS-ESP to 12-TET with no
+    notes filtered, which is taken as the starting point for the comparison.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.discard()
+
 
 class MasterExistsError(Exception):
     pass
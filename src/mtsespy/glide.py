@@ -0,0 +1,47 @@
+"""
+Glides between master tunings, run on a background thread
+"""
+
+from ._mtsespy import _GlideScheduler
+
+
+class GlideScheduler(_GlideScheduler):
+    """
+    Ramp master tunings smoothly from their current values to targets.
+
+    A C++ thread updates MTS-ESP at a fixed control rate without taking the
+    GIL. Each note moves in pitch, so frequencies are interpolated
+    geometrically, with the elapsed fraction of the glide shaped by a curve:
+    'linear', 'smooth' (smoothstep), 'ease_in' or 'ease_out'.
+
+    Glides start from the tuning this process last set, or 12-TET for notes
+    it has not set since the master was registered. Calling `glide_to` on a
+    table which is already gliding retargets it from wherever it has got to.
+    Writes made by other functions to a gliding table are overwritten on the
+    next tick. Deregistering or reinitializing the master cancels the glides
+    of every scheduler.
+
+    Parameters
+    ----------
+    rate : float, optional
+        Control rate in Hz. Defaults to 1000.
+
+    Examples
+    --------
+    >>> with mts.Master(), mts.GlideScheduler() as glides:
+    ...     glides.glide_to(freqs, duration=2.0, curve="smooth")
+    ...     glides.wait()
+
+    `glide_to(frequencies_in_hz, duration, curve="linear", midichannel=None)`
+    takes a (128,) array for the global table, a (128,) array with
+    `midichannel` for one multi-channel table, or a (16, 128) array for all
+    multi-channel tables. `stats()` returns a dict with the number of ticks,
+    the achieved rate in Hz, the number of missed deadlines and the largest
+    lateness of a tick in seconds.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
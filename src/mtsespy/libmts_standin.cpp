@@ -0,0 +1,392 @@
+// Stand-in for the ODDSound libMTS dynamic library, for testing without it.
+//
+// Implements the functions libMTSMaster and libMTSClient look up in libMTS,
+// keeping the master's state in a POSIX shared memory object so that masters
+// and clients in different processes see each other, as with the real
+// library's IPC. Clients read the tuning tables in shared memory directly.
+// The shared memory object is named by the MTSESPY_LIBMTS_SHM environment
+// variable, defaulting to /mtsespy-libmts, so separate test runs can use
+// separate objects.
+//
+// Built when the MTSESPY_LIBMTS_STANDIN CMake option is on. The library's
+// soname is the path libMTSClient and libMTSMaster load libMTS from, so once
+// it is loaded (see mtsespy/_libmts.py) their dlopen calls return it.
+
+#include <atomic>
+#include <chrono>
+#include <cmath>
+#include <cstdint>
+#include <cstdlib>
+#include <cstring>
+#include <thread>
+
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+
+#define MTS_EXPORT extern "C" __attribute__((visibility("default")))
+
+namespace
+{
+
+// Matches the libMTS version libMTSMaster and libMTSClient were written for
+const int version_number = 0x00010003;
+const uint32_t ready_magic = 0x4D545345;
+
+struct SharedState
+{
+    std::atomic<uint32_t> ready;
+    std::atomic<int32_t> has_master;
+    std::atomic<int32_t> num_clients;
+    // Odd while the scale name is being written
+    std::atomic<uint32_t> name_sequence;
+    double tuning[128];
+    double multi_channel_tuning[16][128];
+    std::atomic<bool> note_filter[16][128];
+    std::atomic<bool> multi_channel_filter[16][128];
+    std::atomic<bool> multi_channel[16];
+    char scale_name[256];
+    std::atomic<double> period_ratio;
+    std::atomic<signed char> map_size;
+    std::atomic<signed char> map_start_key;
+    std::atomic<signed char> ref_key;
+};
+
+SharedState *state = nullptr;
+
+void set_scale_name(const char *name)
+{
+    state->name_sequence.fetch_add(1, std::memory_order_acq_rel);
+    std::strncpy(state->scale_name, name ? name : "", sizeof(state->scale_name) - 1);
+    state->scale_name[sizeof(state->scale_name) - 1] = '\0';
+    state->name_sequence.fetch_add(1, std::memory_order_release);
+}
+
+// The state a master starts from, as seen by clients
+void reset_tuning()
+{
+    for (int i = 0; i < 128; i++)
+    {
+        state->tuning[i] = 440.0 * std::exp2((i - 69) / 12.0);
+    }
+    for (int c = 0; c < 16; c++)
+    {
+        std::memcpy(state->multi_channel_tuning[c], state->tuning, sizeof(state->tuning));
+        state->multi_channel[c] = false;
+        for (int i = 0; i < 128; i++)
+        {
+            state->multi_channel_filter[c][i] = false;
+        }
+    }
+    for (auto &row : state->note_filter)
+    {
+        for (auto &f : row)
+        {
+            f = false;
+        }
+    }
+    set_scale_name("12-TET");
+    state->period_ratio = 2.0;
+    state->map_size = -1;
+    state->map_start_key = -1;
+    state->ref_key = -1;
+}
+
+__attribute__((constructor)) void open_shared_state()
+{
+    const char *name = std::getenv("MTSESPY_LIBMTS_SHM");
+    name = name && *name ? name : "/mtsespy-libmts";
+    bool created = true;
+    int fd = shm_open(name, O_RDWR | O_CREAT | O_EXCL, 0600);
+    if (fd < 0)
+    {
+        created = false;
+        fd = shm_open(name, O_RDWR, 0600);
+    }
+    if (fd < 0)
+    {
+        return;
+    }
+    if (created && ftruncate(fd, sizeof(SharedState)) != 0)
+    {
+        close(fd);
+        return;
+    }
+    // Another process may have created the object but not yet sized it
+    struct stat st;
+    while (fstat(fd, &st) == 0 && st.st_size < static_cast<off_t>(sizeof(SharedState)))
+    {
+        std::this_thread::sleep_for(std::chrono::milliseconds(1));
+    }
+    void *p = mmap(nullptr, sizeof(SharedState), PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+    close(fd);
+    if (p == MAP_FAILED)
+    {
+        return;
+    }
+    SharedState *s = static_cast<SharedState *>(p);
+    if (created)
+    {
+        state = s;
+        reset_tuning();
+        s->ready.store(ready_magic, std::memory_order_release);
+        return;
+    }
+    while (s->ready.load(std::memory_order_acquire) != ready_magic)
+    {
+        std::this_thread::sleep_for(std::chrono::milliseconds(1));
+    }
+    state = s;
+}
+
+bool valid_note(char midinote) { return static_cast<unsigned char>(midinote) < 128; }
+
+bool valid_channel(signed char midichannel) { return midichannel >= 0 && midichannel < 16; }
+
+} // namespace
+
+// Master side
+
+MTS_EXPORT void MTS_RegisterMaster(void *)
+{
+    if (state)
+    {
+        reset_tuning();
+        state->has_master = 1;
+    }
+}
+
+MTS_EXPORT void MTS_DeregisterMaster()
+{
+    if (state)
+    {
+        state->has_master = 0;
+        reset_tuning();
+    }
+}
+
+MTS_EXPORT void MTS_Reinitialize()
+{
+    if (state)
+    {
+        state->has_master = 0;
+        state->num_clients = 0;
+        reset_tuning();
+    }
+}
+
+MTS_EXPORT bool MTS_HasMaster() { return state && state->has_master; }
+
+MTS_EXPORT bool MTS_HasIPC() { return state != nullptr; }
+
+MTS_EXPORT int MTS_GetVersionNumber() { return version_number; }
+
+MTS_EXPORT int MTS_GetNumClients() { return state ? static_cast<int>(state->num_clients) : 0; }
+
+MTS_EXPORT void MTS_SetNoteTunings(const double *freqs)
+{
+    if (state && freqs)
+    {
+        std::memcpy(state->tuning, freqs, sizeof(state->tuning));
+    }
+}
+
+MTS_EXPORT void MTS_SetNoteTuning(double freq, char midinote)
+{
+    if (state && valid_note(midinote))
+    {
+        state->tuning[static_cast<int>(midinote)] = freq;
+    }
+}
+
+MTS_EXPORT void MTS_SetScaleName(const char *name)
+{
+    if (state)
+    {
+        set_scale_name(name);
+    }
+}
+
+MTS_EXPORT void MTS_SetPeriodRatio(double periodRatio)
+{
+    if (state)
+    {
+        state->period_ratio = periodRatio;
+    }
+}
+
+MTS_EXPORT void MTS_SetMapSize(signed char size)
+{
+    if (state)
+    {
+        state->map_size = size;
+    }
+}
+
+MTS_EXPORT void MTS_SetMapStartKey(signed char key)
+{
+    if (state)
+    {
+        state->map_start_key = key;
+    }
+}
+
+MTS_EXPORT void MTS_SetRefKey(signed char key)
+{
+    if (state)
+    {
+        state->ref_key = key;
+    }
+}
+
+MTS_EXPORT void MTS_FilterNote(bool doFilter, char midinote, signed char midichannel)
+{
+    if (!state || !valid_note(midinote))
+    {
+        return;
+    }
+    // Channel -1 sets the note on every channel, which later calls for one
+    // channel can override, as in libMTS
+    if (midichannel == -1)
+    {
+        for (auto &row : state->note_filter)
+        {
+            row[static_cast<int>(midinote)] = doFilter;
+        }
+    }
+    else if (valid_channel(midichannel))
+    {
+        state->note_filter[midichannel][static_cast<int>(midinote)] = doFilter;
+    }
+}
+
+MTS_EXPORT void MTS_ClearNoteFilter()
+{
+    if (state)
+    {
+        for (auto &row : state->note_filter)
+        {
+            for (auto &f : row)
+            {
+                f = false;
+            }
+        }
+    }
+}
+
+MTS_EXPORT void MTS_SetMultiChannel(bool set, signed char midichannel)
+{
+    if (state && valid_channel(midichannel))
+    {
+        state->multi_channel[midichannel] = set;
+    }
+}
+
+MTS_EXPORT void MTS_SetMultiChannelNoteTunings(const double *freqs, signed char midichannel)
+{
+    if (state && freqs && valid_channel(midichannel))
+    {
+        std::memcpy(state->multi_channel_tuning[midichannel], freqs, sizeof(state->tuning));
+    }
+}
+
+MTS_EXPORT void MTS_SetMultiChannelNoteTuning(double freq, char midinote, signed char midichannel)
+{
+    if (state && valid_note(midinote) && valid_channel(midichannel))
+    {
+        state->multi_channel_tuning[midichannel][static_cast<int>(midinote)] = freq;
+    }
+}
+
+MTS_EXPORT void MTS_FilterNoteMultiChannel(bool doFilter, char midinote, signed char midichannel)
+{
+    if (state && valid_note(midinote) && valid_channel(midichannel))
+    {
+        state->multi_channel_filter[midichannel][static_cast<int>(midinote)] = doFilter;
+    }
+}
+
+MTS_EXPORT void MTS_ClearNoteFilterMultiChannel(signed char midichannel)
+{
+    if (state && valid_channel(midichannel))
+    {
+        for (auto &f : state->multi_channel_filter[midichannel])
+        {
+            f = false;
+        }
+    }
+}
+
+// Client side
+
+MTS_EXPORT void MTS_RegisterClient()
+{
+    if (state)
+    {
+        state->num_clients++;
+    }
+}
+
+MTS_EXPORT void MTS_DeregisterClient()
+{
+    if (state && state->num_clients > 0)
+    {
+        state->num_clients--;
+    }
+}
+
+MTS_EXPORT bool MTS_ShouldFilterNote(char midinote, signed char midichannel)
+{
+    if (!state || !valid_note(midinote))
+    {
+        return false;
+    }
+    return state->note_filter[midichannel & 15][static_cast<int>(midinote)];
+}
+
+MTS_EXPORT bool MTS_ShouldFilterNoteMultiChannel(char midinote, signed char midichannel)
+{
+    return state && valid_note(midinote) && valid_channel(midichannel) &&
+           state->multi_channel_filter[midichannel][static_cast<int>(midinote)];
+}
+
+MTS_EXPORT const double *MTS_GetTuningTable() { return state ? state->tuning : nullptr; }
+
+MTS_EXPORT const double *MTS_GetMultiChannelTuningTable(signed char midichannel)
+{
+    return state && valid_channel(midichannel) ? state->multi_channel_tuning[midichannel] : nullptr;
+}
+
+MTS_EXPORT bool MTS_UseMultiChannelTuning(signed char midichannel)
+{
+    return state && valid_channel(midichannel) && state->multi_channel[midichannel];
+}
+
+MTS_EXPORT const char *MTS_GetScaleName()
+{
+    thread_local char name[sizeof(SharedState::scale_name)];
+    if (!state)
+    {
+        return "";
+    }
+    uint32_t before;
+    uint32_t after;
+    do
+    {
+        before = state->name_sequence.load(std::memory_order_acquire);
+        std::memcpy(name, state->scale_name, sizeof(name));
+        std::atomic_thread_fence(std::memory_order_acquire);
+        after = state->name_sequence.load(std::memory_order_relaxed);
+    } while ((before & 1) || before != after);
+    name[sizeof(name) - 1] = '\0';
+    return name;
+}
+
+MTS_EXPORT double MTS_GetPeriodRatio() { return state ? state->period_ratio.load() : 2.0; }
+
+MTS_EXPORT signed char MTS_GetMapSize() { return state ? state->map_size.load() : -1; }
+
+MTS_EXPORT signed char MTS_GetMapStartKey() { return state ? state->map_start_key.load() : -1; }
+
+MTS_EXPORT signed char MTS_GetRefKey() { return state ? state->ref_key.load() : -1; }
@@ -1,184 +1,3704 @@
 #include <pybind11/pybind11.h>
+#include <pybind11/numpy.h>
+#include <pybind11/stl.h>
+#include <algorithm>
+#include <array>
+#include <atomic>
+#include <bit>
+#include <chrono>
+#include <cmath>
+#include <condition_variable>
+#include <cstdint>
+#include <cstdio>
+#include <cstring>
+#include <exception>
+#include <map>
+#include <memory>
+#include <mutex>
+#include <optional>
+#include <string>
+#include <thread>
+#include <type_traits>
+#include <tuple>
+#include <unordered_map>
+#include <utility>
+#include <vector>
+#if defined(_WIN32)
+#define WIN32_LEAN_AND_MEAN
+#include <windows.h>
+#else
+#include <dlfcn.h>
+#endif
 #include "libMTSClient.h"
 #include "libMTSMaster.h"
+#include "sysex.h"
+#include "Tunings.h"
 
 namespace py = pybind11;
 
+// Notes of one or more channels sorted by frequency, for nearest note lookups
+// by binary search. Notes sharing a frequency are stored once, as the lowest
+// channel and note, which is the one libMTS's linear search would find.
+struct NoteIndex
+{
+    std::vector<double> frequencies;
+    std::vector<int> notes;
+    std::vector<int> channels;
+
+    NoteIndex(const double (&table)[16][128], const bool (&filter_mask)[16][128], uint16_t channel_mask)
+    {
+        struct Entry
+        {
+            double frequency;
+            int channel;
+            int note;
+        };
+        std::vector<Entry> entries;
+        for (int i = 0; i < 16; i++)
+        {
+            if (!(channel_mask & (1 << i)))
+            {
+                continue;
+            }
+            for (int j = 0; j < 128; j++)
+            {
+                if (!filter_mask[i][j])
+                {
+                    entries.push_back(Entry{table[i][j], i, j});
+                }
+            }
+        }
+        std::sort(entries.begin(), entries.end(),
+                  [](const Entry &a, const Entry &b)
+                  {
+                      return std::tie(a.frequency, a.channel, a.note) < std::tie(b.frequency, b.channel, b.note);
+                  });
+        for (const Entry &e : entries)
+        {
+            if (frequencies.empty() || frequencies.back() != e.frequency)
+            {
+                frequencies.push_back(e.frequency);
+                notes.push_back(e.note);
+                channels.push_back(e.channel);
+            }
+        }
+    }
+
+    // Position of the note nearest to freq. An exact match wins, otherwise
+    // the nearer of the neighbouring notes in log frequency, as in libMTS.
+    size_t nearest(double freq) const
+    {
+        size_t upper = std::lower_bound(frequencies.begin(), frequencies.end(), freq) - frequencies.begin();
+        if (upper == 0)
+        {
+            return 0;
+        }
+        if (upper == frequencies.size() || frequencies[upper] == freq)
+        {
+            return upper == frequencies.size() ? upper - 1 : upper;
+        }
+        size_t lower = upper - 1;
+        return freq < std::sqrt(frequencies[lower] * frequencies[upper]) ? lower : upper;
+    }
+};
+
+// Keyboard mapping of one channel's notes: the period and scale degree of each
+// note counted from the map start key, whether the note is mapped, and its
+// retuning from 12-TET in cents. Without a mapping, periods and degrees are -1
+// and no note is mapped. Filtered notes keep their place in the mapping but
+// are not mapped.
+struct KeyMapping
+{
+    int periods[128];
+    int degrees[128];
+    bool mapped[128];
+    double cents[128];
+
+    KeyMapping(const double (&frequencies)[128], const bool (&filter_mask)[128], int map_size, int map_start_key)
+    {
+        bool has_mapping = map_size > 0 && map_start_key >= 0 && map_start_key <= 127;
+        for (int i = 0; i < 128; i++)
+        {
+            if (has_mapping)
+            {
+                int offset = i - map_start_key;
+                int degree = offset % map_size;
+                degree += degree < 0 ? map_size : 0;
+                periods[i] = (offset - degree) / map_size;
+                degrees[i] = degree;
+            }
+            else
+            {
+                periods[i] = -1;
+                degrees[i] = -1;
+            }
+            mapped[i] = has_mapping && !filter_mask[i];
+            cents[i] = 1200.0 * std::log2(frequencies[i] / 440.0) - 100.0 * (i - 69);
+        }
+    }
+};
+
+// Values built lazily from a snapshot, keyed by a channel or mask of channels.
+// Copies of a cache start out empty.
+template <typename T>
+class SnapshotCache
+{
+  public:
+    SnapshotCache() = default;
+    SnapshotCache(const SnapshotCache &) {}
+    SnapshotCache &operator=(const SnapshotCache &) { return *this; }
+
+    template <typename F>
+    std::shared_ptr<const T> get(uint16_t key, F build)
+    {
+        std::lock_guard<std::mutex> lock(mutex_);
+        auto &value = values_[key];
+        if (!value)
+        {
+            value = std::make_shared<const T>(build());
+        }
+        return value;
+    }
+
+  private:
+    std::mutex mutex_;
+    std::unordered_map<uint16_t, std::shared_ptr<const T>> values_;
+};
+
+// Look up a function in the libMTS library libMTSClient has already loaded,
+// for the parts of libMTS its API does not expose
+template <typename Function>
+Function libmts_function(const char *name)
+{
+#if defined(_WIN32)
+    HMODULE handle = GetModuleHandleW(L"LIBMTS.dll");
+    return handle ? reinterpret_cast<Function>(GetProcAddress(handle, name)) : nullptr;
+#else
+    void *handle = dlopen("/Library/Application Support/MTS-ESP/libMTS.dylib", RTLD_NOW | RTLD_NOLOAD);
+    if (!handle)
+    {
+        handle = dlopen("/usr/local/lib/libMTS.so", RTLD_NOW | RTLD_NOLOAD);
+    }
+    return handle ? reinterpret_cast<Function>(dlsym(handle, name)) : nullptr;
+#endif
+}
+
+// libMTSClient decides which channels to search in frequency_to_note_and_channel
+// with MTS_UseMultiChannelTuning
+bool use_multi_channel_tuning(int midichannel)
+{
+    using function = bool (*)(signed char);
+    static function f = libmts_function<function>("MTS_UseMultiChannelTuning");
+    return f && f(static_cast<signed char>(midichannel));
+}
+
+// The master's tuning tables in libMTS, which clients read while a master is
+// connected. Table 0 is the global table and table 1 + c the multi-channel
+// table for channel c. Null if libMTS is not loaded.
+const double *libmts_tuning_table(int table)
+{
+    using global_function = const double *(*)();
+    using channel_function = const double *(*)(signed char);
+    static global_function global = libmts_function<global_function>("MTS_GetTuningTable");
+    static channel_function channel = libmts_function<channel_function>("MTS_GetMultiChannelTuningTable");
+    if (table == 0)
+    {
+        return global ? global() : nullptr;
+    }
+    return channel ? channel(static_cast<signed char>(table - 1)) : nullptr;
+}
+
+// Everything a client can see of the current tuning, copied out of libMTS.
+// Snapshots are never modified once published, so a new snapshot is made
+// whenever the tuning changes.
+struct TuningSnapshot
+{
+    double frequencies[16][128];
+    bool filter_mask[16][128];
+    bool multi_channel[16];
+    std::string scale_name;
+    double period_ratio;
+    int map_size;
+    int map_start_key;
+    int ref_key;
+    uint64_t generation = 0;
+    SnapshotCache<NoteIndex> note_indexes;
+    SnapshotCache<KeyMapping> key_mappings;
+
+    std::shared_ptr<const NoteIndex> note_index(uint16_t channel_mask)
+    {
+        return note_indexes.get(channel_mask,
+                                [&] { return NoteIndex(frequencies, filter_mask, channel_mask); });
+    }
+
+    std::shared_ptr<const KeyMapping> key_mapping(int midichannel)
+    {
+        return key_mappings.get(midichannel,
+                                [&]
+                                {
+                                    return KeyMapping(frequencies[midichannel], filter_mask[midichannel], map_size,
+                                                      map_start_key);
+                                });
+    }
+
+    void read(MTSClient *client)
+    {
+        for (int i = 0; i < 16; i++)
+        {
+            for (int j = 0; j < 128; j++)
+            {
+                frequencies[i][j] = MTS_NoteToFrequency(client, j, i);
+                filter_mask[i][j] = MTS_ShouldFilterNote(client, j, i);
+            }
+        }
+        bool online = MTS_HasMaster(client);
+        for (int i = 0; i < 16; i++)
+        {
+            multi_channel[i] = online && use_multi_channel_tuning(i);
+        }
+        scale_name = MTS_GetScaleName(client);
+        period_ratio = MTS_GetPeriodRatio(client);
+        map_size = MTS_GetMapSize(client);
+        map_start_key = MTS_GetMapStartKey(client);
+        ref_key = MTS_GetRefKey(client);
+    }
+
+    bool same_tuning(const TuningSnapshot &other) const
+    {
+        return std::memcmp(frequencies, other.frequencies, sizeof(frequencies)) == 0 &&
+               std::memcmp(filter_mask, other.filter_mask, sizeof(filter_mask)) == 0 &&
+               std::memcmp(multi_channel, other.multi_channel, sizeof(multi_channel)) == 0 &&
+               scale_name == other.scale_name && period_ratio == other.period_ratio &&
+               map_size == other.map_size && map_start_key == other.map_start_key &&
+               ref_key == other.ref_key;
+    }
+};
+
+struct ClientState
+{
+    // libMTSClient caches retunings inside the client struct, so calls on the
+    // same client from different threads are serialised
+    std::mutex mutex;
+    std::shared_ptr<TuningSnapshot> snapshot;
+    TuningSnapshot scratch;
+};
+
 struct MTSClientWrapper
 {
     MTSClient *ptr;
+    std::shared_ptr<ClientState> state;
+
+    std::unique_lock<std::mutex> lock() const { return std::unique_lock<std::mutex>(state->mutex); }
 };
 
 MTSClientWrapper register_client()
 {
     MTSClient *m = MTS_RegisterClient();
-    return MTSClientWrapper{m};
+    return MTSClientWrapper{m, std::make_shared<ClientState>()};
+}
+
+void deregister_client(const MTSClientWrapper &client)
+{
+    auto lock = client.lock();
+    MTS_DeregisterClient(client.ptr);
+}
+
+// Scalar client calls check their arguments once, here, before taking the
+// client lock. libMTS would otherwise wrap notes and channels out of range.
+void check_client_note(int midinote)
+{
+    if (midinote < 0 || midinote > 127)
+    {
+        throw py::value_error("midinote must be in range [0, 127], got " + std::to_string(midinote));
+    }
 }
 
-void deregister_client(MTSClientWrapper client) { MTS_DeregisterClient(client.ptr); }
+void check_client_channel(int midichannel)
+{
+    if (midichannel < -1 || midichannel > 15)
+    {
+        throw py::value_error("midichannel must be in range [-1, 15], got " + std::to_string(midichannel));
+    }
+}
 
-bool has_master(MTSClientWrapper client) { return MTS_HasMaster(client.ptr); }
+bool has_master(const MTSClientWrapper &client)
+{
+    auto lock = client.lock();
+    return MTS_HasMaster(client.ptr);
+}
 
-bool should_filter_note(MTSClientWrapper client, int midinote, int midichannel)
+bool should_filter_note(const MTSClientWrapper &client, int midinote, int midichannel)
 {
+    check_client_note(midinote);
+    check_client_channel(midichannel);
+    auto lock = client.lock();
     return MTS_ShouldFilterNote(client.ptr, midinote, midichannel);
 }
 
-double note_to_frequency(MTSClientWrapper client, int midinote, int midichannel)
+double note_to_frequency(const MTSClientWrapper &client, int midinote, int midichannel)
 {
+    check_client_note(midinote);
+    check_client_channel(midichannel);
+    auto lock = client.lock();
     return MTS_NoteToFrequency(client.ptr, midinote, midichannel);
 }
 
-double retuning_in_semitones(MTSClientWrapper client, int midinote, int midichannel)
+double retuning_in_semitones(const MTSClientWrapper &client, int midinote, int midichannel)
 {
+    check_client_note(midinote);
+    check_client_channel(midichannel);
+    auto lock = client.lock();
     return MTS_RetuningInSemitones(client.ptr, midinote, midichannel);
 }
 
-double retuning_as_ratio(MTSClientWrapper client, int midinote, int midichannel)
+double retuning_as_ratio(const MTSClientWrapper &client, int midinote, int midichannel)
 {
+    check_client_note(midinote);
+    check_client_channel(midichannel);
+    auto lock = client.lock();
     return MTS_RetuningAsRatio(client.ptr, midinote, midichannel);
 }
 
-int frequency_to_note(MTSClientWrapper client, double freq, int midichannel)
+int frequency_to_note(const MTSClientWrapper &client, double freq, int midichannel)
 {
+    check_client_channel(midichannel);
+    auto lock = client.lock();
     return MTS_FrequencyToNote(client.ptr, freq, midichannel);
 }
 
-py::tuple frequency_to_note_and_channel(MTSClientWrapper client, double freq)
+std::pair<int, int> frequency_to_note_and_channel(const MTSClientWrapper &client, double freq)
 {
+    auto lock = client.lock();
     signed char midichannel = 0;
     int note;
     note = MTS_FrequencyToNoteAndChannel(client.ptr, freq, &midichannel);
-    return py::make_tuple(note, (int)midichannel);
+    return std::make_pair(note, (int)midichannel);
 }
 
-const char *get_scale_name(MTSClientWrapper client) { return MTS_GetScaleName(client.ptr); }
+std::string get_scale_name(const MTSClientWrapper &client)
+{
+    auto lock = client.lock();
+    return MTS_GetScaleName(client.ptr);
+}
 
-bool client_should_update_library(MTSClientWrapper client)
+bool client_should_update_library(const MTSClientWrapper &client)
 {
+    auto lock = client.lock();
     return MTS_Client_ShouldUpdateLibrary(client.ptr);
 }
 
-double get_period_ratio(MTSClientWrapper client) { return MTS_GetPeriodRatio(client.ptr); }
+double get_period_ratio(const MTSClientWrapper &client)
+{
+    auto lock = client.lock();
+    return MTS_GetPeriodRatio(client.ptr);
+}
+
+double get_period_semitones(const MTSClientWrapper &client)
+{
+    auto lock = client.lock();
+    return MTS_GetPeriodSemitones(client.ptr);
+}
+
+int get_map_size(const MTSClientWrapper &client)
+{
+    auto lock = client.lock();
+    return MTS_GetMapSize(client.ptr);
+}
+
+int get_map_start_key(const MTSClientWrapper &client)
+{
+    auto lock = client.lock();
+    return MTS_GetMapStartKey(client.ptr);
+}
 
-double get_period_semitones(MTSClientWrapper client) { return MTS_GetPeriodSemitones(client.ptr); }
+int get_ref_key(const MTSClientWrapper &client)
+{
+    auto lock = client.lock();
+    return MTS_GetRefKey(client.ptr);
+}
 
-int get_map_size(MTSClientWrapper client) { return MTS_GetMapSize(client.ptr); }
+bool has_received_mts_sysex(const MTSClientWrapper &client)
+{
+    auto lock = client.lock();
+    return MTS_HasReceivedMTSSysEx(client.ptr);
+}
 
-int get_map_start_key(MTSClientWrapper client) { return MTS_GetMapStartKey(client.ptr); }
+// Batched client queries
+//
+// Each batched query evaluates a client function for every combination of the
+// given midi channels and notes in a single C++ loop. The result has shape
+// channels.shape + notes.shape, so the defaults (all 16 channels and all 128
+// notes) give a (16, 128) array indexed as result[channel, note].
 
-int get_ref_key(MTSClientWrapper client) { return MTS_GetRefKey(client.ptr); }
+using index_array = py::array_t<int, py::array::c_style | py::array::forcecast>;
 
-bool has_received_mts_sysex(MTSClientWrapper client) { return MTS_HasReceivedMTSSysEx(client.ptr); }
+struct MidiIndices
+{
+    const int *data;
+    py::ssize_t size;
+    std::vector<py::ssize_t> shape;
+};
 
-void set_note_tuning(float frequency_in_hz, int midinote)
+const int *midi_range()
 {
-    MTS_SetNoteTuning(frequency_in_hz, midinote);
+    static const std::vector<int> range = []
+    {
+        std::vector<int> r(128);
+        for (int i = 0; i < 128; i++)
+        {
+            r[i] = i;
+        }
+        return r;
+    }();
+    return range.data();
 }
 
-void set_note_tunings(py::list frequencies_in_hz)
+MidiIndices midi_indices(const std::optional<index_array> &values, int default_size, int lo, int hi,
+                         const char *name)
 {
-    double f[128];
-    for (int i = 0; i < 128; i++)
+    if (!values)
+    {
+        return MidiIndices{midi_range(), default_size, {default_size}};
+    }
+    const int *data = values->data();
+    for (py::ssize_t i = 0; i < values->size(); i++)
     {
-        f[i] = frequencies_in_hz[i].cast<double>();
+        if (data[i] < lo || data[i] > hi)
+        {
+            throw py::value_error(std::string(name) + " must be in range [" + std::to_string(lo) + ", " +
+                                  std::to_string(hi) + "], got " + std::to_string(data[i]));
+        }
     }
-    MTS_SetNoteTunings(f);
+    return MidiIndices{data, values->size(),
+                       std::vector<py::ssize_t>(values->shape(), values->shape() + values->ndim())};
 }
 
-void filter_note(bool doFilter, int midinote, int midichannel)
+template <typename T>
+using out_array = std::optional<py::array_t<T, py::array::c_style>>;
+
+template <typename T, typename F>
+py::array_t<T> batch_query(const MTSClientWrapper &client, const std::optional<index_array> &notes,
+                           const std::optional<index_array> &channels, out_array<T> out, F query)
 {
-    MTS_FilterNote(doFilter, midinote, midichannel);
+    MidiIndices n = midi_indices(notes, 128, 0, 127, "midinote");
+    MidiIndices c = midi_indices(channels, 16, -1, 15, "midichannel");
+    std::vector<py::ssize_t> shape = c.shape;
+    shape.insert(shape.end(), n.shape.begin(), n.shape.end());
+
+    py::array_t<T> result;
+    if (out)
+    {
+        if (std::vector<py::ssize_t>(out->shape(), out->shape() + out->ndim()) != shape)
+        {
+            throw py::value_error("out array has wrong shape for given notes and channels");
+        }
+        result = *out;
+    }
+    else
+    {
+        result = py::array_t<T>(shape);
+    }
+
+    T *r = result.mutable_data();
+    py::gil_scoped_release release;
+    auto lock = client.lock();
+    for (py::ssize_t i = 0; i < c.size; i++)
+    {
+        for (py::ssize_t j = 0; j < n.size; j++)
+        {
+            r[i * n.size + j] = query(client.ptr, n.data[j], c.data[i]);
+        }
+    }
+    return result;
+}
+
+py::array_t<bool> should_filter_note_array(const MTSClientWrapper &client, std::optional<index_array> notes,
+                                           std::optional<index_array> channels, out_array<bool> out)
+{
+    return batch_query<bool>(client, notes, channels, out, MTS_ShouldFilterNote);
+}
+
+py::array_t<double> note_to_frequency_array(const MTSClientWrapper &client, std::optional<index_array> notes,
+                                            std::optional<index_array> channels, out_array<double> out)
+{
+    return batch_query<double>(client, notes, channels, out, MTS_NoteToFrequency);
 }
 
-void set_multi_channel(bool set, int midichannel) { MTS_SetMultiChannel(set, midichannel); }
+py::array_t<double> retuning_in_semitones_array(const MTSClientWrapper &client, std::optional<index_array> notes,
+                                                std::optional<index_array> channels, out_array<double> out)
+{
+    return batch_query<double>(client, notes, channels, out, MTS_RetuningInSemitones);
+}
 
-void set_multi_channel_note_tunings(py::list frequencies_in_hz, int midichannel)
+py::array_t<double> retuning_as_ratio_array(const MTSClientWrapper &client, std::optional<index_array> notes,
+                                            std::optional<index_array> channels, out_array<double> out)
 {
-    double f[128];
-    for (int i = 0; i < 128; i++)
+    return batch_query<double>(client, notes, channels, out, MTS_RetuningAsRatio);
+}
+
+// Re-read the client's tuning, publishing a new snapshot if anything changed.
+// The steady state, where nothing has changed, allocates nothing.
+bool refresh(const MTSClientWrapper &client)
+{
+    auto lock = client.lock();
+    ClientState &state = *client.state;
+    state.scratch.read(client.ptr);
+    if (state.snapshot && state.scratch.same_tuning(*state.snapshot))
     {
-        f[i] = frequencies_in_hz[i].cast<double>();
+        return false;
     }
-    MTS_SetMultiChannelNoteTunings(f, midichannel);
+    auto snapshot = std::make_shared<TuningSnapshot>(state.scratch);
+    snapshot->generation = state.snapshot ? state.snapshot->generation + 1 : 0;
+    state.snapshot = snapshot;
+    return true;
 }
 
-void set_multi_channel_note_tuning(float frequency_in_hz, int midinote, int midichannel)
+std::shared_ptr<TuningSnapshot> snapshot(const MTSClientWrapper &client)
 {
-    MTS_SetMultiChannelNoteTuning(frequency_in_hz, midinote, midichannel);
+    {
+        auto lock = client.lock();
+        if (client.state->snapshot)
+        {
+            return client.state->snapshot;
+        }
+    }
+    refresh(client);
+    auto lock = client.lock();
+    return client.state->snapshot;
 }
 
-void filter_note_multi_channel(bool doFilter, int midinote, int midichannel)
+// Live access to the master's tuning tables in libMTS, without copying. The
+// tables belong to libMTS rather than a client, so stay valid after the client
+// that gave access to them is deregistered. libMTS has no sequence counter for
+// its tables, so consistent reads are made by copying until two passes agree.
+struct TuningTables
 {
-    MTS_FilterNoteMultiChannel(doFilter, midinote, midichannel);
+    bool online() const
+    {
+        using function = bool (*)();
+        static function f = libmts_function<function>("MTS_HasMaster");
+        return f && f() && libmts_tuning_table(0);
+    }
+
+    static const double *table(int index)
+    {
+        const double *t = libmts_tuning_table(index);
+        if (!t)
+        {
+            throw std::runtime_error("libMTS tuning tables not available");
+        }
+        return t;
+    }
+
+    // Copy all 17 tables into out, returning the number of passes taken
+    int read(double (*out)[128], int max_passes) const
+    {
+        const double *tables[17];
+        for (int t = 0; t < 17; t++)
+        {
+            tables[t] = table(t);
+        }
+        for (int t = 0; t < 17; t++)
+        {
+            std::memcpy(out[t], tables[t], sizeof(out[t]));
+        }
+        for (int pass = 2; pass <= max_passes; pass++)
+        {
+            bool stable = true;
+            for (int t = 0; t < 17; t++)
+            {
+                double check[128];
+                std::memcpy(check, tables[t], sizeof(check));
+                if (std::memcmp(check, out[t], sizeof(check)) != 0)
+                {
+                    std::memcpy(out[t], check, sizeof(check));
+                    stable = false;
+                }
+            }
+            if (stable)
+            {
+                return pass;
+            }
+        }
+        throw std::runtime_error("tuning tables changed on every pass");
+    }
+};
+
+py::array_t<double> tuning_tables_frequencies(py::object self, std::optional<int> midichannel)
+{
+    int index = 0;
+    if (midichannel)
+    {
+        if (*midichannel < 0 || *midichannel > 15)
+        {
+            throw py::value_error("midichannel must be in range [0, 15], got " + std::to_string(*midichannel));
+        }
+        index = 1 + *midichannel;
+    }
+    py::array_t<double> view(128, TuningTables::table(index), self);
+    view.attr("flags").attr("writeable") = false;
+    return view;
 }
 
-void clear_note_filter_multi_channel(int midichannel)
+py::array_t<double> tuning_tables_read(const TuningTables &tables, out_array<double> out, int max_passes)
 {
-    MTS_ClearNoteFilterMultiChannel(midichannel);
+    if (max_passes < 2)
+    {
+        throw py::value_error("max_passes must be at least 2");
+    }
+    py::array_t<double> result = out ? py::array_t<double>(*out) : py::array_t<double>({17, 128});
+    if (result.ndim() != 2 || result.shape(0) != 17 || result.shape(1) != 128)
+    {
+        throw py::value_error("out array must have shape (17, 128)");
+    }
+    auto data = reinterpret_cast<double (*)[128]>(result.mutable_data());
+    {
+        py::gil_scoped_release release;
+        tables.read(data, max_passes);
+    }
+    return result;
 }
 
-void parse_midi_data(MTSClientWrapper client, const py::buffer buffer)
+// Vectorised nearest note lookups
+//
+// These give the same notes as frequency_to_note and
+// frequency_to_note_and_channel, using a binary search over an index of the
+// snapshot's notes sorted by frequency in place of libMTS's linear search.
+// Without explicit channels, the channel search covers the same channels as
+// libMTS: those using multi-channel tuning, or only channel 0 if none are.
+// Indexes are built on first use and kept with the snapshot, so they are only
+// rebuilt when the tuning changes.
+
+using frequency_array = py::array_t<double, py::array::c_style | py::array::forcecast>;
+
+py::tuple nearest_notes(TuningSnapshot &snapshot, frequency_array frequencies, uint16_t channel_mask,
+                        bool return_channels)
 {
-    py::buffer_info info = buffer.request();
-    MTS_ParseMIDIData(client.ptr, (signed char *)info.ptr, info.size);
+    std::vector<py::ssize_t> shape(frequencies.shape(), frequencies.shape() + frequencies.ndim());
+    py::array_t<int> notes(shape);
+    py::array_t<int> channels(shape);
+    py::array_t<double> cents(shape);
+    const double *f = frequencies.data();
+    int *n = notes.mutable_data();
+    int *c = channels.mutable_data();
+    double *d = cents.mutable_data();
+    {
+        py::gil_scoped_release release;
+        std::shared_ptr<const NoteIndex> index = snapshot.note_index(channel_mask);
+        for (py::ssize_t i = 0; i < frequencies.size(); i++)
+        {
+            if (index->frequencies.empty())
+            {
+                n[i] = 0;
+                c[i] = 0;
+                d[i] = std::nan("");
+                continue;
+            }
+            size_t k = index->nearest(f[i]);
+            n[i] = index->notes[k];
+            c[i] = index->channels[k];
+            d[i] = 1200.0 * std::log2(f[i] / index->frequencies[k]);
+        }
+    }
+    if (return_channels)
+    {
+        return py::make_tuple(notes, channels, cents);
+    }
+    return py::make_tuple(notes, cents);
+}
+
+uint16_t channel_mask(const std::optional<index_array> &channels)
+{
+    MidiIndices c = midi_indices(channels, 16, 0, 15, "midichannel");
+    uint16_t mask = 0;
+    for (py::ssize_t i = 0; i < c.size; i++)
+    {
+        mask |= 1 << c.data[i];
+    }
+    return mask;
+}
+
+py::tuple snapshot_frequency_to_note(TuningSnapshot &snapshot, frequency_array frequencies, int midichannel)
+{
+    if (midichannel < 0 || midichannel > 15)
+    {
+        throw py::value_error("midichannel must be in range [0, 15], got " + std::to_string(midichannel));
+    }
+    return nearest_notes(snapshot, frequencies, 1 << midichannel, false);
+}
+
+py::tuple snapshot_frequency_to_note_and_channel(TuningSnapshot &snapshot, frequency_array frequencies,
+                                                 std::optional<index_array> channels)
+{
+    uint16_t mask = 0;
+    if (channels)
+    {
+        mask = channel_mask(channels);
+    }
+    else
+    {
+        // As libMTS, search the channels using multi-channel tuning, or
+        // channel 0 if there are none
+        for (int i = 0; i < 16; i++)
+        {
+            mask |= snapshot.multi_channel[i] << i;
+        }
+        mask = mask ? mask : 1;
+    }
+    return nearest_notes(snapshot, frequencies, mask, true);
+}
+
+py::tuple frequency_to_note_array(const MTSClientWrapper &client, frequency_array frequencies, int midichannel)
+{
+    std::shared_ptr<TuningSnapshot> s;
+    {
+        py::gil_scoped_release release;
+        refresh(client);
+        s = snapshot(client);
+    }
+    return snapshot_frequency_to_note(*s, frequencies, midichannel);
+}
+
+py::tuple frequency_to_note_and_channel_array(const MTSClientWrapper &client, frequency_array frequencies,
+                                              std::optional<index_array> channels)
+{
+    std::shared_ptr<TuningSnapshot> s;
+    {
+        py::gil_scoped_release release;
+        refresh(client);
+        s = snapshot(client);
+    }
+    return snapshot_frequency_to_note_and_channel(*s, frequencies, channels);
+}
+
+// Vectorised keyboard mapping
+//
+// The period, scale degree, mapped flag and retuning in cents of every note,
+// built on first use for each channel and kept with the snapshot. For all 128
+// notes, the arrays returned are read-only views of the snapshot's mapping, so
+// repeated calls for the same tuning copy nothing.
+
+py::tuple snapshot_key_mapping(py::object self, std::optional<index_array> notes, int midichannel)
+{
+    if (midichannel < 0 || midichannel > 15)
+    {
+        throw py::value_error("midichannel must be in range [0, 15], got " + std::to_string(midichannel));
+    }
+    TuningSnapshot &snapshot = self.cast<TuningSnapshot &>();
+    std::shared_ptr<const KeyMapping> mapping;
+    {
+        py::gil_scoped_release release;
+        mapping = snapshot.key_mapping(midichannel);
+    }
+    if (!notes)
+    {
+        // The snapshot owns its mappings, so keeps the views' data alive
+        auto view = [&](auto *data)
+        {
+            using T = std::remove_const_t<std::remove_pointer_t<decltype(data)>>;
+            py::array_t<T> array(128, data, self);
+            array.attr("flags").attr("writeable") = false;
+            return array;
+        };
+        return py::make_tuple(view(mapping->periods), view(mapping->degrees), view(mapping->mapped),
+                              view(mapping->cents));
+    }
+    MidiIndices n = midi_indices(notes, 128, 0, 127, "midinote");
+    py::array_t<int> periods(n.shape);
+    py::array_t<int> degrees(n.shape);
+    py::array_t<bool> mapped(n.shape);
+    py::array_t<double> cents(n.shape);
+    int *p = periods.mutable_data();
+    int *d = degrees.mutable_data();
+    bool *m = mapped.mutable_data();
+    double *c = cents.mutable_data();
+    {
+        py::gil_scoped_release release;
+        for (py::ssize_t i = 0; i < n.size; i++)
+        {
+            int note = n.data[i];
+            p[i] = mapping->periods[note];
+            d[i] = mapping->degrees[note];
+            m[i] = mapping->mapped[note];
+            c[i] = mapping->cents[note];
+        }
+    }
+    return py::make_tuple(periods, degrees, mapped, cents);
+}
+
+py::tuple key_mapping_array(const MTSClientWrapper &client, std::optional<index_array> notes, int midichannel)
+{
+    std::shared_ptr<TuningSnapshot> s;
+    {
+        py::gil_scoped_release release;
+        refresh(client);
+        s = snapshot(client);
+    }
+    return snapshot_key_mapping(py::cast(s), notes, midichannel);
+}
+
+// Differences between two snapshots, as (16, 128) masks of notes whose
+// frequency or filter changed and flags for the scale name and mapping
+py::tuple snapshot_changes_since(const TuningSnapshot &snapshot, const TuningSnapshot &previous)
+{
+    py::array_t<bool> notes({16, 128});
+    py::array_t<bool> filters({16, 128});
+    bool *n = notes.mutable_data();
+    bool *f = filters.mutable_data();
+    bool renamed;
+    bool remapped;
+    {
+        py::gil_scoped_release release;
+        for (int c = 0; c < 16; c++)
+        {
+            for (int i = 0; i < 128; i++)
+            {
+                n[128 * c + i] = !(snapshot.frequencies[c][i] == previous.frequencies[c][i]);
+                f[128 * c + i] = snapshot.filter_mask[c][i] != previous.filter_mask[c][i];
+            }
+        }
+        renamed = snapshot.scale_name != previous.scale_name;
+        remapped = !(snapshot.period_ratio == previous.period_ratio) || snapshot.map_size != previous.map_size ||
+                   snapshot.map_start_key != previous.map_start_key || snapshot.ref_key != previous.ref_key;
+    }
+    return py::make_tuple(notes, filters, renamed, remapped);
+}
+
+// Read-only NumPy view of snapshot data, keeping the snapshot alive
+template <typename T>
+py::array_t<T> snapshot_view(py::object snapshot, const T *data)
+{
+    py::array_t<T> view({16, 128}, data, snapshot);
+    view.attr("flags").attr("writeable") = false;
+    return view;
+}
+
+// Recording master writes
+//
+// A tuning log starts with a 16 byte header, the magic "MTSESPYL" then a
+// uint32 format version and a uint32 of zero. Each write follows as a record
+// with a 16 byte header, the uint64 time in ns since recording started, uint8
+// operation, int8 midi channel or value, uint8 midi note, uint8 flag and
+// uint32 payload size, followed by the payload padded to a multiple of 8
+// bytes. Values are in native byte order. Tuning tables are recorded as a 16
+// byte mask of the notes which differ from what was last recorded for the
+// table, then the frequencies of those notes, so gliding few notes stays
+// small. Records are written through a fixed size stdio buffer, so memory use
+// does not grow with the length of a recording.
+
+enum class LogOp : uint8_t
+{
+    NoteTuning = 1,
+    NoteTunings,
+    FilterNote,
+    ClearNoteFilter,
+    FilterNoteMultiChannel,
+    ClearNoteFilterMultiChannel,
+    SetMultiChannel,
+    ScaleName,
+    PeriodRatio,
+    MapSize,
+    MapStartKey,
+    RefKey,
+};
+
+const char log_magic[8] = {'M', 'T', 'S', 'E', 'S', 'P', 'Y', 'L'};
+const uint32_t log_version = 1;
+
+struct LogRecord
+{
+    uint64_t time_ns;
+    LogOp op;
+    int8_t channel;
+    uint8_t note;
+    uint8_t flag;
+    uint32_t size;
+};
+
+static_assert(sizeof(LogRecord) == 16);
+
+class TuningRecorder
+{
+  public:
+    explicit TuningRecorder(const std::string &path) : file_(std::fopen(path.c_str(), "wb"))
+    {
+        if (!file_)
+        {
+            throw std::runtime_error("could not open '" + path + "' for writing");
+        }
+        std::setvbuf(file_, nullptr, _IOFBF, 1 << 20);
+        uint32_t header[2] = {log_version, 0};
+        std::fwrite(log_magic, 1, sizeof(log_magic), file_);
+        std::fwrite(header, 1, sizeof(header), file_);
+    }
+
+    ~TuningRecorder() { close(); }
+
+    void start();
+
+    void stop();
+
+    void close()
+    {
+        stop();
+        std::lock_guard<std::mutex> lock(mutex_);
+        if (file_)
+        {
+            std::fclose(file_);
+            file_ = nullptr;
+        }
+    }
+
+    uint64_t events() const { return events_; }
+
+    // Called with the active recorder lock held
+    void write(LogOp op, int channel, int note, bool flag, const void *payload = nullptr, uint32_t size = 0)
+    {
+        std::lock_guard<std::mutex> lock(mutex_);
+        if (!file_)
+        {
+            return;
+        }
+        LogRecord record{static_cast<uint64_t>((std::chrono::steady_clock::now() - start_).count()),
+                         op,
+                         static_cast<int8_t>(channel),
+                         static_cast<uint8_t>(note),
+                         flag,
+                         size};
+        static_assert(std::is_same_v<std::chrono::steady_clock::duration, std::chrono::nanoseconds>);
+        std::fwrite(&record, sizeof(record), 1, file_);
+        if (size)
+        {
+            static const char padding[8] = {};
+            std::fwrite(payload, 1, size, file_);
+            std::fwrite(padding, 1, (8 - size % 8) % 8, file_);
+        }
+        events_++;
+    }
+
+    void note_tuning(int table, int note, double frequency)
+    {
+        if (note >= 0 && note < 128 && table >= 0 && table < 17)
+        {
+            last_[table][note] = frequency;
+            write(LogOp::NoteTuning, table - 1, note, false, &frequency, sizeof(frequency));
+        }
+    }
+
+    void note_tunings(int table, const double *frequencies)
+    {
+        if (table < 0 || table >= 17)
+        {
+            return;
+        }
+        struct
+        {
+            uint64_t mask[2] = {};
+            double changed[128];
+        } payload;
+        int n = 0;
+        for (int i = 0; i < 128; i++)
+        {
+            if (!known_[table] || std::memcmp(&last_[table][i], &frequencies[i], sizeof(double)) != 0)
+            {
+                payload.mask[i / 64] |= uint64_t(1) << (i % 64);
+                payload.changed[n++] = frequencies[i];
+            }
+        }
+        std::copy(frequencies, frequencies + 128, last_[table]);
+        known_[table] = true;
+        write(LogOp::NoteTunings, table - 1, 0, false, &payload, sizeof(payload.mask) + n * sizeof(double));
+    }
+
+  private:
+    std::mutex mutex_;
+    std::FILE *file_;
+    std::chrono::steady_clock::time_point start_ = std::chrono::steady_clock::now();
+    uint64_t events_ = 0;
+    double last_[17][128];
+    bool known_[17] = {};
+};
+
+std::mutex &recorder_mutex()
+{
+    static std::mutex mutex;
+    return mutex;
+}
+
+std::atomic<TuningRecorder *> active_recorder{nullptr};
+
+void TuningRecorder::start()
+{
+    std::lock_guard<std::mutex> lock(recorder_mutex());
+    TuningRecorder *expected = nullptr;
+    if (!file_)
+    {
+        throw std::runtime_error("recorder is closed");
+    }
+    if (!active_recorder.compare_exchange_strong(expected, this) && expected != this)
+    {
+        throw std::runtime_error("another recorder is already recording");
+    }
+}
+
+void TuningRecorder::stop()
+{
+    std::lock_guard<std::mutex> lock(recorder_mutex());
+    TuningRecorder *expected = this;
+    active_recorder.compare_exchange_strong(expected, nullptr);
+    std::lock_guard<std::mutex> file_lock(mutex_);
+    if (file_)
+    {
+        std::fflush(file_);
+    }
 }
 
-void set_map_size(int size) { MTS_SetMapSize(size); }
+// Pass a write to the active recorder, if any. Costs one atomic load when
+// nothing is recording.
+template <typename F>
+void record(F &&f)
+{
+    if (!active_recorder.load(std::memory_order_acquire))
+    {
+        return;
+    }
+    std::lock_guard<std::mutex> lock(recorder_mutex());
+    if (TuningRecorder *recorder = active_recorder.load(std::memory_order_relaxed))
+    {
+        f(*recorder);
+    }
+}
 
-void set_map_start_key(int key) { MTS_SetMapStartKey(key); }
+// Every write to the master goes through these, so that it is recorded
 
-void set_ref_key(int key) { MTS_SetRefKey(key); }
+void master_set_note_tuning(double frequency, int midinote)
+{
+    MTS_SetNoteTuning(frequency, midinote);
+    record([&](TuningRecorder &r) { r.note_tuning(0, midinote, frequency); });
+}
+
+void master_set_note_tunings(const double *frequencies)
+{
+    MTS_SetNoteTunings(frequencies);
+    record([&](TuningRecorder &r) { r.note_tunings(0, frequencies); });
+}
+
+void master_set_multi_channel_note_tuning(double frequency, int midinote, int midichannel)
+{
+    MTS_SetMultiChannelNoteTuning(frequency, midinote, midichannel);
+    record([&](TuningRecorder &r) { r.note_tuning(1 + midichannel, midinote, frequency); });
+}
+
+void master_set_multi_channel_note_tunings(const double *frequencies, int midichannel)
+{
+    MTS_SetMultiChannelNoteTunings(frequencies, midichannel);
+    record([&](TuningRecorder &r) { r.note_tunings(1 + midichannel, frequencies); });
+}
+
+void master_filter_note(bool doFilter, int midinote, int midichannel)
+{
+    MTS_FilterNote(doFilter, midinote, midichannel);
+    record([&](TuningRecorder &r) { r.write(LogOp::FilterNote, midichannel, midinote, doFilter); });
+}
+
+void master_clear_note_filter()
+{
+    MTS_ClearNoteFilter();
+    record([&](TuningRecorder &r) { r.write(LogOp::ClearNoteFilter, -1, 0, false); });
+}
+
+void master_filter_note_multi_channel(bool doFilter, int midinote, int midichannel)
+{
+    MTS_FilterNoteMultiChannel(doFilter, midinote, midichannel);
+    record([&](TuningRecorder &r) { r.write(LogOp::FilterNoteMultiChannel, midichannel, midinote, doFilter); });
+}
+
+void master_clear_note_filter_multi_channel(int midichannel)
+{
+    MTS_ClearNoteFilterMultiChannel(midichannel);
+    record([&](TuningRecorder &r) { r.write(LogOp::ClearNoteFilterMultiChannel, midichannel, 0, false); });
+}
+
+void master_set_multi_channel(bool set, int midichannel)
+{
+    MTS_SetMultiChannel(set, midichannel);
+    record([&](TuningRecorder &r) { r.write(LogOp::SetMultiChannel, midichannel, 0, set); });
+}
+
+void master_set_scale_name(const std::string &name)
+{
+    MTS_SetScaleName(name.c_str());
+    record([&](TuningRecorder &r) { r.write(LogOp::ScaleName, -1, 0, false, name.data(), name.size()); });
+}
+
+void master_set_period_ratio(double ratio)
+{
+    MTS_SetPeriodRatio(ratio);
+    record([&](TuningRecorder &r) { r.write(LogOp::PeriodRatio, -1, 0, false, &ratio, sizeof(ratio)); });
+}
+
+void master_set_map_size(int size)
+{
+    MTS_SetMapSize(size);
+    record([&](TuningRecorder &r) { r.write(LogOp::MapSize, size, 0, false); });
+}
+
+void master_set_map_start_key(int key)
+{
+    MTS_SetMapStartKey(key);
+    record([&](TuningRecorder &r) { r.write(LogOp::MapStartKey, key, 0, false); });
+}
+
+void master_set_ref_key(int key)
+{
+    MTS_SetRefKey(key);
+    record([&](TuningRecorder &r) { r.write(LogOp::RefKey, key, 0, false); });
+}
+
+// What this process last wrote to the MTS-ESP master. Tuning table 0 is the
+// global table and table 1 + c is the multi-channel table for channel c. Note
+// filters are held per channel, MTS_FilterNote on channel -1 setting a note on
+// every channel as libMTS does. Registering or reinitializing resets MTS-ESP
+// to 12-TET with no notes filtered and no channels using multi-channel tuning,
+// so the mirror is reset to match. The scale name, period ratio and keyboard
+// mapping are unknown until written.
+struct MasterMirror
+{
+    std::mutex mutex;
+    double tunings[17][128];
+    bool note_filter[16][128];
+    bool multi_channel_filter[16][128];
+    bool multi_channel[16];
+    std::optional<std::string> scale_name;
+    std::optional<double> period_ratio;
+    std::optional<int> map_size;
+    std::optional<int> map_start_key;
+    std::optional<int> ref_key;
+
+    MasterMirror() { reset(); }
+
+    void reset()
+    {
+        for (int i = 0; i < 128; i++)
+        {
+            tunings[0][i] = 440.0 * std::exp2((i - 69) / 12.0);
+        }
+        for (int table = 1; table < 17; table++)
+        {
+            std::copy(tunings[0], tunings[0] + 128, tunings[table]);
+        }
+        std::memset(note_filter, 0, sizeof(note_filter));
+        std::memset(multi_channel_filter, 0, sizeof(multi_channel_filter));
+        std::memset(multi_channel, 0, sizeof(multi_channel));
+        scale_name.reset();
+        period_ratio.reset();
+        map_size.reset();
+        map_start_key.reset();
+        ref_key.reset();
+    }
+
+    void set_multi_channel(int midichannel, bool set)
+    {
+        if (midichannel >= 0 && midichannel < 16)
+        {
+            multi_channel[midichannel] = set;
+        }
+    }
+
+    void set_tuning(int table, int midinote, double frequency)
+    {
+        if (table >= 0 && table < 17 && midinote >= 0 && midinote < 128)
+        {
+            tunings[table][midinote] = frequency;
+        }
+    }
+
+    void set_tunings(int table, const double *frequencies)
+    {
+        if (table >= 0 && table < 17)
+        {
+            std::copy(frequencies, frequencies + 128, tunings[table]);
+        }
+    }
+
+    bool note_filtered(int midichannel, int midinote, bool doFilter) const
+    {
+        if (midichannel == -1)
+        {
+            for (int c = 0; c < 16; c++)
+            {
+                if (note_filter[c][midinote] != doFilter)
+                {
+                    return false;
+                }
+            }
+            return true;
+        }
+        return note_filter[midichannel][midinote] == doFilter;
+    }
+
+    void set_note_filter(int midichannel, int midinote, bool doFilter)
+    {
+        if (midinote < 0 || midinote > 127)
+        {
+            return;
+        }
+        if (midichannel == -1)
+        {
+            for (int c = 0; c < 16; c++)
+            {
+                note_filter[c][midinote] = doFilter;
+            }
+        }
+        else if (midichannel >= 0 && midichannel < 16)
+        {
+            note_filter[midichannel][midinote] = doFilter;
+        }
+    }
+
+    void set_multi_channel_filter(int midichannel, int midinote, bool doFilter)
+    {
+        if (midichannel >= 0 && midichannel < 16 && midinote >= 0 && midinote < 128)
+        {
+            multi_channel_filter[midichannel][midinote] = doFilter;
+        }
+    }
+};
+
+MasterMirror &master_mirror()
+{
+    static MasterMirror mirror;
+    return mirror;
+}
+
+// Defined with GlideScheduler below, glides stop when the master they write
+// to goes away
+void cancel_all_glides();
+
+void register_master()
+{
+    MasterMirror &mirror = master_mirror();
+    std::lock_guard<std::mutex> lock(mirror.mutex);
+    MTS_RegisterMaster();
+    mirror.reset();
+}
+
+void deregister_master()
+{
+    cancel_all_glides();
+    MasterMirror &mirror = master_mirror();
+    std::lock_guard<std::mutex> lock(mirror.mutex);
+    MTS_DeregisterMaster();
+    mirror.reset();
+}
+
+void reinitialize()
+{
+    cancel_all_glides();
+    MasterMirror &mirror = master_mirror();
+    std::lock_guard<std::mutex> lock(mirror.mutex);
+    MTS_Reinitialize();
+    mirror.reset();
+}
+
+void clear_note_filter()
+{
+    MasterMirror &mirror = master_mirror();
+    std::lock_guard<std::mutex> lock(mirror.mutex);
+    master_clear_note_filter();
+    std::memset(mirror.note_filter, 0, sizeof(mirror.note_filter));
+}
+
+void set_note_tuning(float frequency_in_hz, int midinote)
+{
+    MasterMirror &mirror = master_mirror();
+    std::lock_guard<std::mutex> lock(mirror.mutex);
+    master_set_note_tuning(frequency_in_hz, midinote);
+    mirror.set_tuning(0, midinote, frequency_in_hz);
+}
+
+void set_multi_channel(bool set, int midichannel)
+{
+    MasterMirror &mirror = master_mirror();
+    std::lock_guard<std::mutex> lock(mirror.mutex);
+    master_set_multi_channel(set, midichannel);
+    mirror.set_multi_channel(midichannel, set);
+}
+
+void set_scale_name(const std::string &name)
+{
+    MasterMirror &mirror = master_mirror();
+    std::lock_guard<std::mutex> lock(mirror.mutex);
+    master_set_scale_name(name);
+    mirror.scale_name = name;
+}
+
+void set_period_ratio(double ratio)
+{
+    MasterMirror &mirror = master_mirror();
+    std::lock_guard<std::mutex> lock(mirror.mutex);
+    master_set_period_ratio(ratio);
+    mirror.period_ratio = ratio;
+}
+
+void set_map_size(int size)
+{
+    MasterMirror &mirror = master_mirror();
+    std::lock_guard<std::mutex> lock(mirror.mutex);
+    master_set_map_size(size);
+    mirror.map_size = static_cast<signed char>(size);
+}
+
+void set_map_start_key(int key)
+{
+    MasterMirror &mirror = master_mirror();
+    std::lock_guard<std::mutex> lock(mirror.mutex);
+    master_set_map_start_key(key);
+    mirror.map_start_key = static_cast<signed char>(key);
+}
+
+void set_ref_key(int key)
+{
+    MasterMirror &mirror = master_mirror();
+    std::lock_guard<std::mutex> lock(mirror.mutex);
+    master_set_ref_key(key);
+    mirror.ref_key = static_cast<signed char>(key);
+}
+
+// Frequencies for one or more 128 note tuning tables, read from a list or any
+// object supporting the buffer protocol. C-contiguous float64 buffers are used
+// in place without copying and C-contiguous float32 buffers are converted in
+// a single pass. Anything else is converted with NumPy.
+class FrequencyTable
+{
+  public:
+    FrequencyTable(const py::object &frequencies, const std::vector<py::ssize_t> &shape)
+    {
+        if (py::isinstance<py::buffer>(frequencies))
+        {
+            py::buffer_info info = py::reinterpret_borrow<py::buffer>(frequencies).request();
+            if (info.shape == shape && is_c_contiguous(info))
+            {
+                if (info.item_type_is_equivalent_to<double>())
+                {
+                    data_ = static_cast<const double *>(info.ptr);
+                    info_ = std::move(info);
+                    return;
+                }
+                if (info.item_type_is_equivalent_to<float>())
+                {
+                    const float *f = static_cast<const float *>(info.ptr);
+                    converted_.assign(f, f + info.size);
+                    data_ = converted_.data();
+                    return;
+                }
+            }
+        }
+        auto array = py::array_t<double, py::array::c_style | py::array::forcecast>::ensure(frequencies);
+        if (!array)
+        {
+            throw py::type_error("frequencies must be a sequence or buffer of numbers");
+        }
+        if (std::vector<py::ssize_t>(array.shape(), array.shape() + array.ndim()) != shape)
+        {
+            throw py::value_error("frequencies must have shape " + shape_str(shape));
+        }
+        data_ = array.data();
+        array_ = std::move(array);
+    }
+
+    const double *data() const { return data_; }
+
+  private:
+    static bool is_c_contiguous(const py::buffer_info &info)
+    {
+        py::ssize_t stride = info.itemsize;
+        for (py::ssize_t i = info.ndim - 1; i >= 0; i--)
+        {
+            if (info.strides[i] != stride)
+            {
+                return false;
+            }
+            stride *= info.shape[i];
+        }
+        return true;
+    }
+
+    static std::string shape_str(const std::vector<py::ssize_t> &shape)
+    {
+        std::string s = "(";
+        for (size_t i = 0; i < shape.size(); i++)
+        {
+            s += std::to_string(shape[i]) + (shape.size() == 1 ? "," : i + 1 < shape.size() ? ", " : "");
+        }
+        return s + ")";
+    }
+
+    const double *data_ = nullptr;
+    py::buffer_info info_;
+    std::vector<double> converted_;
+    py::object array_;
+};
+
+void set_note_tunings(py::object frequencies_in_hz)
+{
+    FrequencyTable f(frequencies_in_hz, {128});
+    py::gil_scoped_release release;
+    MasterMirror &mirror = master_mirror();
+    std::lock_guard<std::mutex> lock(mirror.mutex);
+    master_set_note_tunings(f.data());
+    mirror.set_tunings(0, f.data());
+}
+
+void filter_note(bool doFilter, int midinote, int midichannel)
+{
+    MasterMirror &mirror = master_mirror();
+    std::lock_guard<std::mutex> lock(mirror.mutex);
+    master_filter_note(doFilter, midinote, midichannel);
+    mirror.set_note_filter(midichannel, midinote, doFilter);
+}
+
+void set_multi_channel_note_tunings(py::object frequencies_in_hz, int midichannel)
+{
+    FrequencyTable f(frequencies_in_hz, {128});
+    py::gil_scoped_release release;
+    MasterMirror &mirror = master_mirror();
+    std::lock_guard<std::mutex> lock(mirror.mutex);
+    master_set_multi_channel_note_tunings(f.data(), midichannel);
+    if (midichannel >= 0 && midichannel < 16)
+    {
+        mirror.set_tunings(1 + midichannel, f.data());
+    }
+}
+
+void set_all_multi_channel_note_tunings(py::object frequencies_in_hz)
+{
+    FrequencyTable f(frequencies_in_hz, {16, 128});
+    py::gil_scoped_release release;
+    MasterMirror &mirror = master_mirror();
+    std::lock_guard<std::mutex> lock(mirror.mutex);
+    for (int i = 0; i < 16; i++)
+    {
+        master_set_multi_channel_note_tunings(f.data() + 128 * i, i);
+        mirror.set_tunings(1 + i, f.data() + 128 * i);
+    }
+}
+
+void set_multi_channel_note_tuning(float frequency_in_hz, int midinote, int midichannel)
+{
+    MasterMirror &mirror = master_mirror();
+    std::lock_guard<std::mutex> lock(mirror.mutex);
+    master_set_multi_channel_note_tuning(frequency_in_hz, midinote, midichannel);
+    if (midichannel >= 0 && midichannel < 16)
+    {
+        mirror.set_tuning(1 + midichannel, midinote, frequency_in_hz);
+    }
+}
+
+void filter_note_multi_channel(bool doFilter, int midinote, int midichannel)
+{
+    MasterMirror &mirror = master_mirror();
+    std::lock_guard<std::mutex> lock(mirror.mutex);
+    master_filter_note_multi_channel(doFilter, midinote, midichannel);
+    mirror.set_multi_channel_filter(midichannel, midinote, doFilter);
+}
+
+void clear_note_filter_multi_channel(int midichannel)
+{
+    MasterMirror &mirror = master_mirror();
+    std::lock_guard<std::mutex> lock(mirror.mutex);
+    master_clear_note_filter_multi_channel(midichannel);
+    if (midichannel >= 0 && midichannel < 16)
+    {
+        std::memset(mirror.multi_channel_filter[midichannel], 0, 128);
+    }
+}
+
+using filter_mask_array = py::array_t<bool, py::array::c_style | py::array::forcecast>;
+
+// Make the note filter, or the multi-channel note filter, equal to
+// target(channel, note), writing only notes whose filter differs from what
+// this process last wrote. A note changing on several channels to the same
+// value on all of them takes a single write to channel -1. Called with the
+// mirror locked. Returns the number of writes made.
+template <typename F>
+int write_filter_mask(MasterMirror &mirror, F &&target, bool multi_channel)
+{
+    int writes = 0;
+    for (int note = 0; note < 128; note++)
+    {
+        if (multi_channel)
+        {
+            for (int c = 0; c < 16; c++)
+            {
+                bool doFilter = target(c, note);
+                if (mirror.multi_channel_filter[c][note] != doFilter)
+                {
+                    master_filter_note_multi_channel(doFilter, note, c);
+                    mirror.set_multi_channel_filter(c, note, doFilter);
+                    writes++;
+                }
+            }
+            continue;
+        }
+        int changed = 0;
+        bool uniform = true;
+        for (int c = 0; c < 16; c++)
+        {
+            changed += mirror.note_filter[c][note] != target(c, note);
+            uniform = uniform && target(c, note) == target(0, note);
+        }
+        if (changed > 1 && uniform)
+        {
+            master_filter_note(target(0, note), note, -1);
+            mirror.set_note_filter(-1, note, target(0, note));
+            writes++;
+            continue;
+        }
+        for (int c = 0; changed && c < 16; c++)
+        {
+            bool doFilter = target(c, note);
+            if (mirror.note_filter[c][note] != doFilter)
+            {
+                master_filter_note(doFilter, note, c);
+                mirror.set_note_filter(c, note, doFilter);
+                writes++;
+                changed--;
+            }
+        }
+    }
+    return writes;
+}
+
+// Make the note filter equal to a (128,) mask, applied to every channel, or a
+// (16, 128) mask. Returns the number of writes made.
+int set_filter_mask(filter_mask_array mask, bool multi_channel)
+{
+    bool all_channels = mask.ndim() == 1;
+    if (!(all_channels ? mask.shape(0) == 128 : mask.ndim() == 2 && mask.shape(0) == 16 && mask.shape(1) == 128))
+    {
+        throw py::value_error("mask must have shape (128,) or (16, 128)");
+    }
+    const bool *m = mask.data();
+    auto target = [&](int channel, int note) { return m[all_channels ? note : 128 * channel + note]; };
+    py::gil_scoped_release release;
+    MasterMirror &mirror = master_mirror();
+    std::lock_guard<std::mutex> lock(mirror.mutex);
+    return write_filter_mask(mirror, target, multi_channel);
+}
+
+// The notes a client should not play, as a (16, 128) array
+py::array_t<bool> get_filter_mask(const MTSClientWrapper &client, out_array<bool> out)
+{
+    return batch_query<bool>(client, std::nullopt, std::nullopt, out, MTS_ShouldFilterNote);
+}
+
+// Replay a tuning log, from any buffer such as a memory-mapped file, through
+// the master setters so the mirror follows. With speed None writes are made as
+// fast as possible, otherwise at their recorded times divided by speed.
+// A log cut short while recording replays up to its last whole record.
+// Returns the number of writes made.
+uint64_t replay_log(py::buffer data, std::optional<double> speed)
+{
+    if (speed && !(*speed > 0.0 && std::isfinite(*speed)))
+    {
+        throw py::value_error("speed must be positive and finite, or None");
+    }
+    py::buffer_info info = data.request();
+    const char *begin = static_cast<const char *>(info.ptr);
+    size_t size = info.size * info.itemsize;
+    if (size < 16 || std::memcmp(begin, log_magic, sizeof(log_magic)) != 0)
+    {
+        throw py::value_error("not a tuning log");
+    }
+    uint32_t version;
+    std::memcpy(&version, begin + 8, sizeof(version));
+    if (version != log_version)
+    {
+        throw py::value_error("unsupported tuning log version " + std::to_string(version));
+    }
+    py::gil_scoped_release release;
+    MasterMirror &mirror = master_mirror();
+    auto start = std::chrono::steady_clock::now();
+    double tables[17][128] = {};
+    uint64_t writes = 0;
+    for (size_t offset = 16; offset + sizeof(LogRecord) <= size;)
+    {
+        LogRecord r;
+        std::memcpy(&r, begin + offset, sizeof(r));
+        const char *payload = begin + offset + sizeof(r);
+        offset += sizeof(r) + (r.size + 7) / 8 * 8;
+        if (offset > size)
+        {
+            // Cut short while recording
+            break;
+        }
+        if (speed)
+        {
+            auto due = start + std::chrono::nanoseconds(static_cast<int64_t>(r.time_ns / *speed));
+            // Wake at least every 50 ms to check for KeyboardInterrupt
+            while (std::chrono::steady_clock::now() < due)
+            {
+                std::this_thread::sleep_until(std::min(due, std::chrono::steady_clock::now() +
+                                                                 std::chrono::milliseconds(50)));
+                py::gil_scoped_acquire acquire;
+                if (PyErr_CheckSignals() != 0)
+                {
+                    throw py::error_already_set();
+                }
+            }
+        }
+        int table = r.channel + 1;
+        std::lock_guard<std::mutex> lock(mirror.mutex);
+        switch (r.op)
+        {
+        case LogOp::NoteTuning:
+        {
+            double frequency;
+            std::memcpy(&frequency, payload, sizeof(frequency));
+            if (table < 0 || table >= 17 || r.note > 127 || r.size != sizeof(frequency))
+            {
+                throw std::runtime_error("invalid tuning log record");
+            }
+            tables[table][r.note] = frequency;
+            table == 0 ? master_set_note_tuning(frequency, r.note)
+                       : master_set_multi_channel_note_tuning(frequency, r.note, r.channel);
+            mirror.set_tuning(table, r.note, frequency);
+            break;
+        }
+        case LogOp::NoteTunings:
+        {
+            uint64_t mask[2] = {};
+            if (r.size >= sizeof(mask))
+            {
+                std::memcpy(mask, payload, sizeof(mask));
+            }
+            size_t n = std::popcount(mask[0]) + std::popcount(mask[1]);
+            if (table < 0 || table >= 17 || r.size != sizeof(mask) + n * sizeof(double))
+            {
+                throw std::runtime_error("invalid tuning log record");
+            }
+            const char *changed = payload + sizeof(mask);
+            for (int i = 0; i < 128; i++)
+            {
+                if (mask[i / 64] >> (i % 64) & 1)
+                {
+                    std::memcpy(&tables[table][i], changed, sizeof(double));
+                    changed += sizeof(double);
+                }
+            }
+            table == 0 ? master_set_note_tunings(tables[0])
+                       : master_set_multi_channel_note_tunings(tables[table], r.channel);
+            mirror.set_tunings(table, tables[table]);
+            break;
+        }
+        case LogOp::FilterNote:
+            master_filter_note(r.flag, r.note, r.channel);
+            mirror.set_note_filter(r.channel, r.note, r.flag);
+            break;
+        case LogOp::ClearNoteFilter:
+            master_clear_note_filter();
+            std::memset(mirror.note_filter, 0, sizeof(mirror.note_filter));
+            break;
+        case LogOp::FilterNoteMultiChannel:
+            master_filter_note_multi_channel(r.flag, r.note, r.channel);
+            mirror.set_multi_channel_filter(r.channel, r.note, r.flag);
+            break;
+        case LogOp::ClearNoteFilterMultiChannel:
+            master_clear_note_filter_multi_channel(r.channel);
+            if (r.channel >= 0 && r.channel < 16)
+            {
+                std::memset(mirror.multi_channel_filter[r.channel], 0, 128);
+            }
+            break;
+        case LogOp::SetMultiChannel:
+            master_set_multi_channel(r.flag, r.channel);
+            mirror.set_multi_channel(r.channel, r.flag);
+            break;
+        case LogOp::ScaleName:
+            mirror.scale_name = std::string(payload, r.size);
+            master_set_scale_name(*mirror.scale_name);
+            break;
+        case LogOp::PeriodRatio:
+        {
+            double ratio;
+            if (r.size != sizeof(ratio))
+            {
+                throw std::runtime_error("invalid tuning log record");
+            }
+            std::memcpy(&ratio, payload, sizeof(ratio));
+            master_set_period_ratio(ratio);
+            mirror.period_ratio = ratio;
+            break;
+        }
+        case LogOp::MapSize:
+            master_set_map_size(r.channel);
+            mirror.map_size = r.channel;
+            break;
+        case LogOp::MapStartKey:
+            master_set_map_start_key(r.channel);
+            mirror.map_start_key = r.channel;
+            break;
+        case LogOp::RefKey:
+            master_set_ref_key(r.channel);
+            mirror.ref_key = r.channel;
+            break;
+        default:
+            throw std::runtime_error("unknown tuning log operation " + std::to_string(static_cast<int>(r.op)));
+        }
+        writes++;
+    }
+    return writes;
+}
+
+// Master writes buffered by a batch and committed together. Only values that
+// differ from the master mirror are sent to MTS-ESP, and a tuning table with
+// enough changed notes is sent with a single bulk call.
+class MasterBatch
+{
+  public:
+    // One MTS_SetNoteTunings call costs roughly as much as seven
+    // MTS_SetNoteTuning calls
+    static constexpr int bulk_write_threshold = 8;
+
+    MasterBatch() { reset(); }
+
+    void set_note_tuning(float frequency_in_hz, int midinote)
+    {
+        check_range(midinote, 0, 127, "midinote");
+        std::lock_guard<std::mutex> lock(mutex_);
+        set_tuning(0, midinote, frequency_in_hz);
+    }
+
+    void set_note_tunings(py::object frequencies_in_hz)
+    {
+        FrequencyTable f(frequencies_in_hz, {128});
+        py::gil_scoped_release release;
+        std::lock_guard<std::mutex> lock(mutex_);
+        for (int i = 0; i < 128; i++)
+        {
+            set_tuning(0, i, f.data()[i]);
+        }
+    }
+
+    void set_multi_channel_note_tuning(float frequency_in_hz, int midinote, int midichannel)
+    {
+        check_range(midinote, 0, 127, "midinote");
+        check_range(midichannel, 0, 15, "midichannel");
+        std::lock_guard<std::mutex> lock(mutex_);
+        set_tuning(1 + midichannel, midinote, frequency_in_hz);
+    }
+
+    void set_multi_channel_note_tunings(py::object frequencies_in_hz, int midichannel)
+    {
+        check_range(midichannel, 0, 15, "midichannel");
+        FrequencyTable f(frequencies_in_hz, {128});
+        py::gil_scoped_release release;
+        std::lock_guard<std::mutex> lock(mutex_);
+        for (int i = 0; i < 128; i++)
+        {
+            set_tuning(1 + midichannel, i, f.data()[i]);
+        }
+    }
+
+    void filter_note(bool doFilter, int midinote, int midichannel)
+    {
+        check_range(midinote, 0, 127, "midinote");
+        check_range(midichannel, -1, 15, "midichannel");
+        std::lock_guard<std::mutex> lock(mutex_);
+        note_filter_[1 + midichannel][midinote] = doFilter;
+        note_filter_order_[1 + midichannel][midinote] = ++sequence_;
+    }
+
+    void clear_note_filter()
+    {
+        std::lock_guard<std::mutex> lock(mutex_);
+        std::memset(note_filter_order_, 0, sizeof(note_filter_order_));
+        clear_note_filter_ = true;
+    }
+
+    void filter_note_multi_channel(bool doFilter, int midinote, int midichannel)
+    {
+        check_range(midinote, 0, 127, "midinote");
+        check_range(midichannel, 0, 15, "midichannel");
+        std::lock_guard<std::mutex> lock(mutex_);
+        multi_channel_filter_[midichannel][midinote] = doFilter;
+        multi_channel_filter_order_[midichannel][midinote] = ++sequence_;
+    }
+
+    void clear_note_filter_multi_channel(int midichannel)
+    {
+        check_range(midichannel, 0, 15, "midichannel");
+        std::lock_guard<std::mutex> lock(mutex_);
+        std::memset(multi_channel_filter_order_[midichannel], 0, sizeof(multi_channel_filter_order_[midichannel]));
+        clear_multi_channel_filter_[midichannel] = true;
+    }
+
+    // Send buffered writes to MTS-ESP, returning the number of library calls
+    // made. Filters are cleared first, then tunings are set, then notes are
+    // filtered in the order they were buffered.
+    int commit()
+    {
+        std::lock_guard<std::mutex> lock(mutex_);
+        MasterMirror &mirror = master_mirror();
+        std::lock_guard<std::mutex> mirror_lock(mirror.mutex);
+        int writes = 0;
+        if (clear_note_filter_ && !all_zero(&mirror.note_filter[0][0], 16 * 128))
+        {
+            master_clear_note_filter();
+            std::memset(mirror.note_filter, 0, sizeof(mirror.note_filter));
+            writes++;
+        }
+        for (int c = 0; c < 16; c++)
+        {
+            if (clear_multi_channel_filter_[c] && !all_zero(mirror.multi_channel_filter[c], 128))
+            {
+                master_clear_note_filter_multi_channel(c);
+                std::memset(mirror.multi_channel_filter[c], 0, 128);
+                writes++;
+            }
+        }
+        for (int table = 0; table < 17; table++)
+        {
+            writes += commit_tunings(mirror, table);
+        }
+        writes += commit_filters(mirror);
+        reset();
+        return writes;
+    }
+
+    void discard()
+    {
+        std::lock_guard<std::mutex> lock(mutex_);
+        reset();
+    }
+
+  private:
+    static void check_range(int value, int lo, int hi, const char *name)
+    {
+        if (value < lo || value > hi)
+        {
+            throw py::value_error(std::string(name) + " must be in range [" + std::to_string(lo) + ", " +
+                                  std::to_string(hi) + "], got " + std::to_string(value));
+        }
+    }
+
+    static bool all_zero(const bool *values, size_t size)
+    {
+        return std::none_of(values, values + size, [](bool v) { return v; });
+    }
+
+    void set_tuning(int table, int midinote, double frequency)
+    {
+        tunings_[table][midinote] = frequency;
+        tuning_pending_[table][midinote] = true;
+    }
+
+    int commit_tunings(MasterMirror &mirror, int table)
+    {
+        double merged[128];
+        int changed = 0;
+        bool complete = true;
+        for (int i = 0; i < 128; i++)
+        {
+            if (tuning_pending_[table][i])
+            {
+                merged[i] = tunings_[table][i];
+                changed += !(merged[i] == mirror.tunings[table][i]);
+            }
+            else
+            {
+                merged[i] = mirror.tunings[table][i];
+                complete = complete && !std::isnan(merged[i]);
+            }
+        }
+        if (changed == 0)
+        {
+            return 0;
+        }
+        if (complete && changed >= bulk_write_threshold)
+        {
+            if (table == 0)
+            {
+                master_set_note_tunings(merged);
+            }
+            else
+            {
+                master_set_multi_channel_note_tunings(merged, table - 1);
+            }
+            mirror.set_tunings(table, merged);
+            return 1;
+        }
+        for (int i = 0; i < 128; i++)
+        {
+            if (tuning_pending_[table][i] && !(merged[i] == mirror.tunings[table][i]))
+            {
+                if (table == 0)
+                {
+                    master_set_note_tuning(merged[i], i);
+                }
+                else
+                {
+                    master_set_multi_channel_note_tuning(merged[i], i, table - 1);
+                }
+                mirror.set_tuning(table, i, merged[i]);
+            }
+        }
+        return changed;
+    }
+
+    int commit_filters(MasterMirror &mirror)
+    {
+        // (order, multi-channel, channel, note)
+        std::vector<std::tuple<uint64_t, bool, int, int>> filters;
+        for (int c = 0; c < 17; c++)
+        {
+            for (int i = 0; i < 128; i++)
+            {
+                if (note_filter_order_[c][i])
+                {
+                    filters.emplace_back(note_filter_order_[c][i], false, c - 1, i);
+                }
+                if (c < 16 && multi_channel_filter_order_[c][i])
+                {
+                    filters.emplace_back(multi_channel_filter_order_[c][i], true, c, i);
+                }
+            }
+        }
+        std::sort(filters.begin(), filters.end());
+        int writes = 0;
+        for (const auto &[order, multi_channel, channel, note] : filters)
+        {
+            if (multi_channel)
+            {
+                bool doFilter = multi_channel_filter_[channel][note];
+                if (mirror.multi_channel_filter[channel][note] != doFilter)
+                {
+                    master_filter_note_multi_channel(doFilter, note, channel);
+                    mirror.set_multi_channel_filter(channel, note, doFilter);
+                    writes++;
+                }
+            }
+            else
+            {
+                bool doFilter = note_filter_[1 + channel][note];
+                if (!mirror.note_filtered(channel, note, doFilter))
+                {
+                    master_filter_note(doFilter, note, channel);
+                    mirror.set_note_filter(channel, note, doFilter);
+                    writes++;
+                }
+            }
+        }
+        return writes;
+    }
+
+    void reset()
+    {
+        std::memset(tuning_pending_, 0, sizeof(tuning_pending_));
+        std::memset(note_filter_order_, 0, sizeof(note_filter_order_));
+        std::memset(multi_channel_filter_order_, 0, sizeof(multi_channel_filter_order_));
+        std::memset(clear_multi_channel_filter_, 0, sizeof(clear_multi_channel_filter_));
+        clear_note_filter_ = false;
+        sequence_ = 0;
+    }
+
+    double tunings_[17][128];
+    bool tuning_pending_[17][128];
+    bool note_filter_[17][128];
+    uint64_t note_filter_order_[17][128];
+    bool multi_channel_filter_[16][128];
+    uint64_t multi_channel_filter_order_[16][128];
+    bool clear_note_filter_;
+    bool clear_multi_channel_filter_[16];
+    uint64_t sequence_;
+    std::mutex mutex_;
+};
+
+// Preset banks
+//
+// A preset bank holds complete master states as fixed size records, so a
+// preset is found by its index alone and a bank in a memory-mapped file is
+// never read in full. A bank starts with a 16 byte header, the magic
+// "MTSESPYB" then a uint32 format version and a uint32 preset count, followed
+// by the presets. Values are in native byte order. Note filters are packed
+// into bits, note 128 * channel + note in bit note % 8 of byte note / 8.
+
+const char bank_magic[8] = {'M', 'T', 'S', 'E', 'S', 'P', 'Y', 'B'};
+const uint32_t bank_version = 1;
+
+struct Preset
+{
+    double tunings[17][128];
+    uint8_t note_filter[256];
+    uint8_t multi_channel_filter[256];
+    double period_ratio;
+    uint16_t multi_channel;
+    int8_t map_size;
+    int8_t map_start_key;
+    int8_t ref_key;
+    uint8_t padding[3];
+    char scale_name[256];
+};
+
+static_assert(sizeof(Preset) == 18192);
+
+// Unpack a bit-packed note filter into a mask, a byte at a time
+void unpack_filter_bits(const uint8_t *bits, bool (&mask)[16][128])
+{
+    static constexpr auto bytes = []
+    {
+        std::array<std::array<bool, 8>, 256> table{};
+        for (int byte = 0; byte < 256; byte++)
+        {
+            for (int bit = 0; bit < 8; bit++)
+            {
+                table[byte][bit] = byte >> bit & 1;
+            }
+        }
+        return table;
+    }();
+    for (int i = 0; i < 256; i++)
+    {
+        std::memcpy(&mask[i >> 4][(i & 15) * 8], bytes[bits[i]].data(), 8);
+    }
+}
+
+// Whether a preset frequency differs from the mirror's. Frequencies within a
+// few ulps are the same, so 12-TET tables computed with NumPy match the
+// mirror's initial tables.
+bool preset_frequency_changed(double frequency, double known)
+{
+    return !(std::abs(frequency - known) <= 1e-12 * std::abs(known));
+}
+
+// Write only the notes of a table that differ from the mirror, with a single
+// bulk write if enough do. Called with the mirror locked.
+int write_tuning_table(MasterMirror &mirror, int table, const double *frequencies)
+{
+    if (std::memcmp(frequencies, mirror.tunings[table], sizeof(mirror.tunings[table])) == 0)
+    {
+        return 0;
+    }
+    int changed = 0;
+    for (int i = 0; i < 128; i++)
+    {
+        changed += preset_frequency_changed(frequencies[i], mirror.tunings[table][i]);
+    }
+    if (changed >= MasterBatch::bulk_write_threshold)
+    {
+        table == 0 ? master_set_note_tunings(frequencies)
+                   : master_set_multi_channel_note_tunings(frequencies, table - 1);
+        mirror.set_tunings(table, frequencies);
+        return 1;
+    }
+    for (int i = 0; i < 128; i++)
+    {
+        if (preset_frequency_changed(frequencies[i], mirror.tunings[table][i]))
+        {
+            table == 0 ? master_set_note_tuning(frequencies[i], i)
+                       : master_set_multi_channel_note_tuning(frequencies[i], i, table - 1);
+        }
+    }
+    // Frequencies within a few ulps are taken exactly too, so activating the
+    // same preset again only compares the tables
+    mirror.set_tunings(table, frequencies);
+    return changed;
+}
+
+// Make the master's state equal to a preset in a bank, from any buffer such as
+// a memory-mapped file, writing only what differs from what this process last
+// wrote. Returns the number of writes made.
+int activate_preset(py::buffer data, int index)
+{
+    py::buffer_info info = data.request();
+    if (info.ndim != 1 || info.itemsize != 1 || info.strides[0] != 1)
+    {
+        throw py::type_error("data must be a contiguous bytes-like object");
+    }
+    const char *bytes = static_cast<const char *>(info.ptr);
+    uint32_t version;
+    uint32_t count;
+    if (info.size < 16 || std::memcmp(bytes, bank_magic, sizeof(bank_magic)) != 0)
+    {
+        throw py::value_error("not a preset bank");
+    }
+    std::memcpy(&version, bytes + 8, sizeof(version));
+    std::memcpy(&count, bytes + 12, sizeof(count));
+    if (version != bank_version)
+    {
+        throw py::value_error("unsupported preset bank version " + std::to_string(version));
+    }
+    if (static_cast<uint64_t>(info.size) < 16 + static_cast<uint64_t>(count) * sizeof(Preset))
+    {
+        throw py::value_error("preset bank is truncated");
+    }
+    if (index < 0 || static_cast<uint32_t>(index) >= count)
+    {
+        throw py::index_error("preset index out of range");
+    }
+    py::gil_scoped_release release;
+    auto preset = std::make_unique<Preset>();
+    std::memcpy(preset.get(), bytes + 16 + static_cast<size_t>(index) * sizeof(Preset), sizeof(Preset));
+    MasterMirror &mirror = master_mirror();
+    std::lock_guard<std::mutex> lock(mirror.mutex);
+    int writes = 0;
+    for (int table = 0; table < 17; table++)
+    {
+        writes += write_tuning_table(mirror, table, preset->tunings[table]);
+    }
+    // Filters are unpacked once, so unchanged filters cost a comparison
+    bool note_filter[16][128];
+    bool multi_channel_filter[16][128];
+    unpack_filter_bits(preset->note_filter, note_filter);
+    unpack_filter_bits(preset->multi_channel_filter, multi_channel_filter);
+    if (std::memcmp(note_filter, mirror.note_filter, sizeof(note_filter)) != 0)
+    {
+        writes += write_filter_mask(mirror, [&](int channel, int note) { return note_filter[channel][note]; }, false);
+    }
+    if (std::memcmp(multi_channel_filter, mirror.multi_channel_filter, sizeof(multi_channel_filter)) != 0)
+    {
+        writes += write_filter_mask(
+            mirror, [&](int channel, int note) { return multi_channel_filter[channel][note]; }, true);
+    }
+    for (int c = 0; c < 16; c++)
+    {
+        bool set = preset->multi_channel >> c & 1;
+        if (mirror.multi_channel[c] != set)
+        {
+            master_set_multi_channel(set, c);
+            mirror.set_multi_channel(c, set);
+            writes++;
+        }
+    }
+    std::string name(preset->scale_name, strnlen(preset->scale_name, sizeof(preset->scale_name)));
+    if (mirror.scale_name != name)
+    {
+        master_set_scale_name(name);
+        mirror.scale_name = name;
+        writes++;
+    }
+    if (mirror.period_ratio != preset->period_ratio)
+    {
+        master_set_period_ratio(preset->period_ratio);
+        mirror.period_ratio = preset->period_ratio;
+        writes++;
+    }
+    auto write_key = [&](int value, std::optional<int> &known, void (*write)(int))
+    {
+        if (known != value)
+        {
+            write(value);
+            known = value;
+            writes++;
+        }
+    };
+    write_key(preset->map_size, mirror.map_size, master_set_map_size);
+    write_key(preset->map_start_key, mirror.map_start_key, master_set_map_start_key);
+    write_key(preset->ref_key, mirror.ref_key, master_set_ref_key);
+    return writes;
+}
+
+// Glides between master tuning tables, run by a background thread which
+// updates MTS-ESP at a fixed control rate without holding the GIL. Each note
+// moves in pitch, so frequencies are interpolated geometrically, with the
+// fraction of the glide elapsed shaped by a curve. Tables are numbered as in
+// MasterMirror.
+class GlideScheduler
+{
+  public:
+    using clock = std::chrono::steady_clock;
+
+    enum class Curve
+    {
+        Linear,
+        Smooth,
+        EaseIn,
+        EaseOut
+    };
+
+    explicit GlideScheduler(double rate)
+    {
+        if (!(rate > 0.0 && rate <= 100000.0))
+        {
+            throw py::value_error("rate must be in range (0, 100000]");
+        }
+        period_ = std::chrono::duration_cast<clock::duration>(std::chrono::duration<double>(1.0 / rate));
+        thread_ = std::thread(&GlideScheduler::run, this);
+        std::lock_guard<std::mutex> lock(registry_mutex());
+        registry().push_back(this);
+    }
+
+    ~GlideScheduler() { close(); }
+
+    // Cancel the glides of every live scheduler
+    static void cancel_all()
+    {
+        std::lock_guard<std::mutex> lock(registry_mutex());
+        for (GlideScheduler *scheduler : registry())
+        {
+            scheduler->cancel();
+        }
+    }
+
+    void glide_to(const py::object &frequencies_in_hz, double duration, const std::string &curve,
+                  std::optional<int> midichannel)
+    {
+        frequency_array target = frequency_array::ensure(frequencies_in_hz);
+        if (!target)
+        {
+            throw py::type_error("frequencies must be a sequence or buffer of numbers");
+        }
+        int first = 0;
+        int count = 1;
+        if (midichannel)
+        {
+            if (*midichannel < 0 || *midichannel > 15)
+            {
+                throw py::value_error("midichannel must be in range [0, 15], got " + std::to_string(*midichannel));
+            }
+            first = 1 + *midichannel;
+        }
+        else if (target.ndim() == 2)
+        {
+            first = 1;
+            count = 16;
+        }
+        if (target.ndim() != (count == 16 ? 2 : 1) || target.shape(target.ndim() - 1) != 128 ||
+            (count == 16 && target.shape(0) != 16))
+        {
+            throw py::value_error(midichannel ? "frequencies must have shape (128,)"
+                                              : "frequencies must have shape (128,) or (16, 128)");
+        }
+        if (!(duration >= 0.0 && duration < 1e9))
+        {
+            throw py::value_error("duration must be non-negative and finite");
+        }
+        Curve c = parse_curve(curve);
+        const double *t = target.data();
+        py::gil_scoped_release release;
+        std::lock_guard<std::mutex> lock(mutex_);
+        if (stopping_)
+        {
+            throw std::runtime_error("glide scheduler is closed");
+        }
+        clock::time_point now = clock::now();
+        MasterMirror &mirror = master_mirror();
+        std::lock_guard<std::mutex> mirror_lock(mirror.mutex);
+        for (int table = first; table < first + count; table++)
+        {
+            Glide &g = glides_[table];
+            for (int i = 0; i < 128; i++)
+            {
+                double current = mirror.tunings[table][i];
+                g.start[i] = std::isnan(current) ? 440.0 * std::exp2((i - 69) / 12.0) : current;
+            }
+            std::copy(t + 128 * (table - first), t + 128 * (table - first + 1), g.target);
+            g.begin = now;
+            g.duration = std::chrono::duration_cast<clock::duration>(std::chrono::duration<double>(duration));
+            g.curve = c;
+            g.active = true;
+        }
+        cv_.notify_all();
+    }
+
+    void cancel()
+    {
+        std::lock_guard<std::mutex> lock(mutex_);
+        for (Glide &g : glides_)
+        {
+            g.active = false;
+        }
+        done_.notify_all();
+    }
+
+    bool active()
+    {
+        std::lock_guard<std::mutex> lock(mutex_);
+        return any_active();
+    }
+
+    bool wait(std::optional<double> timeout)
+    {
+        std::unique_lock<std::mutex> lock(mutex_);
+        auto idle = [this] { return !any_active() || stopping_; };
+        if (!timeout)
+        {
+            done_.wait(lock, idle);
+            return true;
+        }
+        return done_.wait_for(lock, std::chrono::duration<double>(*timeout), idle);
+    }
+
+    py::dict stats()
+    {
+        Stats s;
+        {
+            std::lock_guard<std::mutex> lock(mutex_);
+            s = stats_;
+        }
+        py::dict d;
+        d["ticks"] = s.ticks;
+        d["rate"] = s.active_time.count() > 0 ? s.intervals / std::chrono::duration<double>(s.active_time).count()
+                                              : 0.0;
+        d["deadline_misses"] = s.deadline_misses;
+        d["max_lateness"] = std::chrono::duration<double>(s.max_lateness).count();
+        return d;
+    }
+
+    void reset_stats()
+    {
+        std::lock_guard<std::mutex> lock(mutex_);
+        stats_ = Stats();
+        last_tick_.reset();
+    }
+
+    void close()
+    {
+        {
+            std::lock_guard<std::mutex> lock(registry_mutex());
+            auto &schedulers = registry();
+            schedulers.erase(std::remove(schedulers.begin(), schedulers.end(), this), schedulers.end());
+        }
+        {
+            std::lock_guard<std::mutex> lock(mutex_);
+            stopping_ = true;
+        }
+        cv_.notify_all();
+        done_.notify_all();
+        if (thread_.joinable() && thread_.get_id() != std::this_thread::get_id())
+        {
+            thread_.join();
+        }
+    }
+
+  private:
+    struct Glide
+    {
+        double start[128];
+        double target[128];
+        clock::time_point begin;
+        clock::duration duration;
+        Curve curve = Curve::Linear;
+        bool active = false;
+    };
+
+    struct Stats
+    {
+        uint64_t ticks = 0;
+        uint64_t intervals = 0;
+        uint64_t deadline_misses = 0;
+        clock::duration active_time = clock::duration::zero();
+        clock::duration max_lateness = clock::duration::zero();
+    };
+
+    static std::mutex &registry_mutex()
+    {
+        static std::mutex mutex;
+        return mutex;
+    }
+
+    static std::vector<GlideScheduler *> &registry()
+    {
+        static std::vector<GlideScheduler *> schedulers;
+        return schedulers;
+    }
+
+    static Curve parse_curve(const std::string &name)
+    {
+        if (name == "linear")
+        {
+            return Curve::Linear;
+        }
+        if (name == "smooth")
+        {
+            return Curve::Smooth;
+        }
+        if (name == "ease_in")
+        {
+            return Curve::EaseIn;
+        }
+        if (name == "ease_out")
+        {
+            return Curve::EaseOut;
+        }
+        throw py::value_error("curve must be one of 'linear', 'smooth', 'ease_in' or 'ease_out', got '" + name + "'");
+    }
+
+    static double shape(Curve curve, double x)
+    {
+        switch (curve)
+        {
+        case Curve::Smooth:
+            return x * x * (3.0 - 2.0 * x);
+        case Curve::EaseIn:
+            return x * x;
+        case Curve::EaseOut:
+            return x * (2.0 - x);
+        default:
+            return x;
+        }
+    }
+
+    bool any_active() const
+    {
+        return std::any_of(std::begin(glides_), std::end(glides_), [](const Glide &g) { return g.active; });
+    }
+
+    void run()
+    {
+        std::unique_lock<std::mutex> lock(mutex_);
+        clock::time_point deadline;
+        bool running = false;
+        while (true)
+        {
+            cv_.wait(lock, [this] { return stopping_ || any_active(); });
+            if (stopping_)
+            {
+                return;
+            }
+            if (!running)
+            {
+                deadline = clock::now();
+                last_tick_.reset();
+                running = true;
+            }
+            if (cv_.wait_until(lock, deadline, [this] { return stopping_; }))
+            {
+                return;
+            }
+            clock::time_point now = clock::now();
+            clock::duration lateness = now - deadline;
+            stats_.max_lateness = std::max(stats_.max_lateness, lateness);
+            if (lateness >= period_)
+            {
+                auto missed = lateness / period_;
+                stats_.deadline_misses += missed;
+                deadline += missed * period_;
+            }
+            deadline += period_;
+            if (any_active())
+            {
+                tick(now);
+            }
+            running = any_active();
+            if (!running)
+            {
+                done_.notify_all();
+            }
+        }
+    }
+
+    void tick(clock::time_point now)
+    {
+        double values[128];
+        MasterMirror &mirror = master_mirror();
+        std::lock_guard<std::mutex> mirror_lock(mirror.mutex);
+        for (int table = 0; table < 17; table++)
+        {
+            Glide &g = glides_[table];
+            if (!g.active)
+            {
+                continue;
+            }
+            double x = g.duration.count() > 0 ? std::chrono::duration<double>(now - g.begin) / g.duration : 1.0;
+            if (x >= 1.0)
+            {
+                std::copy(g.target, g.target + 128, values);
+                g.active = false;
+            }
+            else
+            {
+                double w = shape(g.curve, std::max(x, 0.0));
+                for (int i = 0; i < 128; i++)
+                {
+                    double a = g.start[i];
+                    double b = g.target[i];
+                    values[i] = a > 0.0 && b > 0.0 ? a * std::pow(b / a, w) : a + w * (b - a);
+                }
+            }
+            if (table == 0)
+            {
+                master_set_note_tunings(values);
+            }
+            else
+            {
+                master_set_multi_channel_note_tunings(values, table - 1);
+            }
+            mirror.set_tunings(table, values);
+        }
+        stats_.ticks++;
+        if (last_tick_)
+        {
+            stats_.intervals++;
+            stats_.active_time += now - *last_tick_;
+        }
+        last_tick_ = now;
+    }
+
+    Glide glides_[17];
+    Stats stats_;
+    std::optional<clock::time_point> last_tick_;
+    clock::duration period_;
+    bool stopping_ = false;
+    std::mutex mutex_;
+    std::condition_variable cv_;
+    std::condition_variable done_;
+    std::thread thread_;
+};
+
+void cancel_all_glides() { GlideScheduler::cancel_all(); }
+
+void parse_midi_data(const MTSClientWrapper &client, const py::buffer buffer)
+{
+    py::buffer_info info = buffer.request();
+    py::gil_scoped_release release;
+    auto lock = client.lock();
+    MTS_ParseMIDIData(client.ptr, (signed char *)info.ptr, info.size);
+}
+
+// Stateful feeder passing the MTS SysEx messages in a MIDI byte stream to a
+// client. The stream is scanned in C++ with the GIL released.
+class SysExStream
+{
+  public:
+    explicit SysExStream(MTSClientWrapper client) : client_(client) {}
+
+    size_t feed(const py::buffer &data)
+    {
+        py::buffer_info info = data.request();
+        if (info.ndim != 1 || info.itemsize != 1 || info.strides[0] != 1)
+        {
+            throw py::type_error("data must be a contiguous bytes-like object");
+        }
+        py::gil_scoped_release release;
+        std::lock_guard<std::mutex> stream_lock(mutex_);
+        auto client_lock = client_.lock();
+        size_t count = framer_.feed(static_cast<const unsigned char *>(info.ptr), info.size,
+                                    [&](const unsigned char *message, size_t len)
+                                    { MTS_ParseMIDIDataU(client_.ptr, message, static_cast<int>(len)); });
+        message_count_ += count;
+        return count;
+    }
+
+    void reset()
+    {
+        std::lock_guard<std::mutex> lock(mutex_);
+        framer_.reset();
+    }
+
+    size_t message_count()
+    {
+        std::lock_guard<std::mutex> lock(mutex_);
+        return message_count_;
+    }
+
+  private:
+    MTSClientWrapper client_;
+    MTSSysExFramer framer_;
+    size_t message_count_ = 0;
+    std::mutex mutex_;
+};
+
+// MTS SysEx codec, encoding and decoding tuning messages without a client
+
+void check_7_bit(int value, const char *name)
+{
+    if (value < 0 || value > 127)
+    {
+        throw py::value_error(std::string(name) + " must be in range [0, 127], got " + std::to_string(value));
+    }
+}
+
+py::bytes to_bytes(const std::vector<unsigned char> &data)
+{
+    return py::bytes(reinterpret_cast<const char *>(data.data()), data.size());
+}
+
+py::bytes encode_bulk_tuning_dump(frequency_array frequencies, int program, const std::string &name,
+                                  int device_id, std::optional<int> bank)
+{
+    if (frequencies.ndim() < 1 || frequencies.ndim() > 2 || frequencies.shape(frequencies.ndim() - 1) != 128)
+    {
+        throw py::value_error("frequencies must have shape (128,) or (n, 128)");
+    }
+    py::ssize_t n = frequencies.ndim() == 1 ? 1 : frequencies.shape(0);
+    check_7_bit(program, "program");
+    if (n > 1)
+    {
+        // Each dump gets its own program number
+        check_7_bit(program + static_cast<int>(n) - 1, "last program");
+    }
+    check_7_bit(device_id, "device_id");
+    if (bank)
+    {
+        check_7_bit(*bank, "bank");
+    }
+    std::vector<unsigned char> out;
+    {
+        py::gil_scoped_release release;
+        for (py::ssize_t i = 0; i < n; i++)
+        {
+            sysex_bulk_tuning_dump(frequencies.data() + 128 * i, device_id, bank.value_or(-1),
+                                   program + static_cast<int>(i), name, out);
+        }
+    }
+    return to_bytes(out);
+}
+
+py::bytes encode_single_note_tuning(index_array notes, frequency_array frequencies, int program, int device_id,
+                                    bool realtime, std::optional<int> bank)
+{
+    if (notes.ndim() != 1 || frequencies.ndim() != 1 || notes.size() != frequencies.size())
+    {
+        throw py::value_error("notes and frequencies must be one dimensional and the same length");
+    }
+    MidiIndices n = midi_indices(notes, 128, 0, 127, "midinote");
+    check_7_bit(program, "program");
+    check_7_bit(device_id, "device_id");
+    if (bank)
+    {
+        check_7_bit(*bank, "bank");
+    }
+    std::vector<unsigned char> out;
+    {
+        py::gil_scoped_release release;
+        sysex_single_note_tuning(n.data, frequencies.data(), n.size, device_id, realtime, bank.value_or(-1),
+                                 program, out);
+    }
+    return to_bytes(out);
+}
+
+py::bytes encode_scale_octave_tuning(frequency_array cents, std::optional<index_array> channels, bool two_byte,
+                                     int device_id, bool realtime)
+{
+    if (cents.ndim() != 1 || cents.size() != 12)
+    {
+        throw py::value_error("cents must have shape (12,)");
+    }
+    uint16_t mask = channel_mask(channels);
+    check_7_bit(device_id, "device_id");
+    std::vector<unsigned char> out;
+    sysex_scale_octave_tuning(cents.data(), mask, two_byte, device_id, realtime, out);
+    return to_bytes(out);
+}
+
+py::array_t<double> decode_mts_sysex(const py::buffer &data, std::optional<frequency_array> frequencies,
+                                     int midichannel)
+{
+    if (midichannel < 0 || midichannel > 15)
+    {
+        throw py::value_error("midichannel must be in range [0, 15], got " + std::to_string(midichannel));
+    }
+    py::buffer_info info = data.request();
+    if (info.ndim != 1 || info.itemsize != 1 || info.strides[0] != 1)
+    {
+        throw py::type_error("data must be a contiguous bytes-like object");
+    }
+    std::vector<double> table(128);
+    if (frequencies)
+    {
+        if (frequencies->ndim() != 1 || frequencies->size() != 128)
+        {
+            throw py::value_error("frequencies must have shape (128,)");
+        }
+        std::copy(frequencies->data(), frequencies->data() + 128, table.begin());
+    }
+    else
+    {
+        for (int i = 0; i < 128; i++)
+        {
+            table[i] = 440.0 * std::pow(2.0, (i - 69.0) / 12.0);
+        }
+    }
+    std::vector<double> rows;
+    {
+        py::gil_scoped_release release;
+        MTSSysExFramer framer;
+        framer.feed(static_cast<const unsigned char *>(info.ptr), info.size,
+                    [&](const unsigned char *message, size_t len)
+                    {
+                        if (sysex_decode_tuning(message, len, table.data(), midichannel))
+                        {
+                            rows.insert(rows.end(), table.begin(), table.end());
+                        }
+                    });
+    }
+    py::array_t<double> result({static_cast<py::ssize_t>(rows.size() / 128), static_cast<py::ssize_t>(128)});
+    std::copy(rows.begin(), rows.end(), result.mutable_data());
+    return result;
+}
+
+// Voice allocation for synths without MTS-ESP support
+//
+// Each note is played as the 12-TET note nearest its frequency in the client's
+// tuning, on a channel of its own pitch bent to the exact frequency, as in MPE.
+// Free channels are used in rotation, the one released longest ago first, so
+// release tails are not bent by the next note. With every channel busy the
+// oldest voice is stolen, unless stealing is off and the note is dropped. A
+// note on for a key already held releases its voice first. Pitch bends are 14
+// bit, centred on 8192, and only sent when a channel's bend changes.
+//
+// Polyphonic aftertouch follows its voice to the output channel and note, and
+// is dropped for keys not playing. Control changes, program changes and
+// channel pressure are sent on every output channel, since the voices of an
+// input channel can be on any of them. Input pitch bends are dropped, as the
+// allocator owns the pitch bend of the output channels.
+
+class VoiceAllocator
+{
+  public:
+    VoiceAllocator(MTSClientWrapper client, std::optional<index_array> channels, double bend_range, bool steal)
+        : client_(client), bend_range_(bend_range), steal_(steal)
+    {
+        if (!(bend_range > 0.0))
+        {
+            throw py::value_error("bend_range must be positive");
+        }
+        MidiIndices c = midi_indices(channels, 16, 0, 15, "midichannel");
+        for (py::ssize_t i = 0; i < c.size; i++)
+        {
+            if (std::find(channels_.begin(), channels_.end(), c.data[i]) != channels_.end())
+            {
+                throw py::value_error("channels must not repeat");
+            }
+            channels_.push_back(c.data[i]);
+        }
+        if (channels_.empty())
+        {
+            throw py::value_error("need at least one channel");
+        }
+        std::fill(std::begin(voice_of_), std::end(voice_of_), -1);
+        voices_.resize(channels_.size());
+    }
+
+    // The channel, note and pitch bend a note is played with, and the note of
+    // any voice stolen from that channel, all -1 if it is not played, followed
+    // by the channel and note of any voice the key was already playing, which
+    // is released, or -1
+    std::tuple<int, int, int, int, int, int> note_on(int midinote, int midichannel, int velocity)
+    {
+        check_7_bit(midinote, "midinote");
+        check_channel(midichannel);
+        check_7_bit(velocity, "velocity");
+        py::gil_scoped_release release;
+        std::lock_guard<std::mutex> lock(mutex_);
+        std::tuple<int, int, int, int, int, int> result{-1, -1, -1, -1, -1, -1};
+        auto on_release = [&](int channel, int note)
+        {
+            std::get<4>(result) = channel;
+            std::get<5>(result) = note;
+        };
+        if (velocity == 0)
+        {
+            release_key(key(midinote, midichannel), on_release);
+            return result;
+        }
+        start(
+            midinote, midichannel,
+            [&](int channel, int note, int bend, int stolen_note)
+            {
+                std::get<0>(result) = channel;
+                std::get<1>(result) = note;
+                std::get<2>(result) = bend;
+                std::get<3>(result) = stolen_note;
+            },
+            on_release);
+        return result;
+    }
+
+    std::pair<int, int> note_off(int midinote, int midichannel)
+    {
+        check_7_bit(midinote, "midinote");
+        check_channel(midichannel);
+        py::gil_scoped_release release;
+        std::lock_guard<std::mutex> lock(mutex_);
+        std::pair<int, int> result{-1, -1};
+        release_key(key(midinote, midichannel), [&](int channel, int note) { result = {channel, note}; });
+        return result;
+    }
+
+    // Convert the notes in a MIDI byte stream, passing other messages through.
+    // Messages split across calls are completed by the next call.
+    py::bytes process(const py::buffer &data)
+    {
+        py::buffer_info info = data.request();
+        if (info.ndim != 1 || info.itemsize != 1 || info.strides[0] != 1)
+        {
+            throw py::type_error("data must be a contiguous bytes-like object");
+        }
+        std::string out;
+        {
+            py::gil_scoped_release release;
+            std::lock_guard<std::mutex> lock(mutex_);
+            out.reserve(info.size * 5);
+            const auto *bytes = static_cast<const unsigned char *>(info.ptr);
+            for (py::ssize_t i = 0; i < info.size; i++)
+            {
+                parse_byte(bytes[i], out);
+            }
+        }
+        return py::bytes(out);
+    }
+
+    // Convert an (n, 3) array of messages, one per row, into an (m, 3) array
+    py::array_t<uint8_t> process_array(py::array_t<int, py::array::c_style | py::array::forcecast> events)
+    {
+        if (events.ndim() != 2 || events.shape(1) != 3)
+        {
+            throw py::value_error("events must have shape (n, 3)");
+        }
+        const int *e = events.data();
+        py::ssize_t n = events.shape(0);
+        for (py::ssize_t i = 0; i < n * 3; i++)
+        {
+            if (e[i] < 0 || e[i] > 255)
+            {
+                throw py::value_error("event bytes must be in range [0, 255]");
+            }
+        }
+        std::string out;
+        {
+            py::gil_scoped_release release;
+            std::lock_guard<std::mutex> lock(mutex_);
+            out.reserve(n * 9);
+            for (py::ssize_t i = 0; i < n; i++, e += 3)
+            {
+                handle(static_cast<unsigned char>(e[0]), static_cast<unsigned char>(e[1]),
+                       static_cast<unsigned char>(e[2]), 3, out);
+            }
+        }
+        py::array_t<uint8_t> result({static_cast<py::ssize_t>(out.size() / 3), py::ssize_t{3}});
+        std::memcpy(result.mutable_data(), out.data(), out.size());
+        return result;
+    }
+
+    // Note offs for every sounding voice, which are released
+    py::bytes all_notes_off()
+    {
+        std::string out;
+        {
+            py::gil_scoped_release release;
+            std::lock_guard<std::mutex> lock(mutex_);
+            for (int k = 0; k < 16 * 128; k++)
+            {
+                if (voice_of_[k] >= 0)
+                {
+                    release_key(k, [&](int channel, int note) { append(out, 0x80 | channel, note, 0); });
+                }
+            }
+        }
+        return py::bytes(out);
+    }
+
+    int active()
+    {
+        std::lock_guard<std::mutex> lock(mutex_);
+        return static_cast<int>(
+            std::count_if(voices_.begin(), voices_.end(), [](const State &v) { return v.key >= 0; }));
+    }
+
+    std::vector<int> channels() const { return channels_; }
+
+    double bend_range() const { return bend_range_; }
+
+  private:
+    struct State
+    {
+        int key = -1;
+        int note = 0;
+        int bend = -1;
+        uint64_t started = 0;
+        uint64_t released = 0;
+    };
+
+    static void check_channel(int midichannel)
+    {
+        if (midichannel < 0 || midichannel > 15)
+        {
+            throw py::value_error("midichannel must be in range [0, 15], got " + std::to_string(midichannel));
+        }
+    }
+
+    static int key(int midinote, int midichannel) { return midichannel * 128 + midinote; }
+
+    static void append(std::string &out, int status, int data1, int data2, int length = 3)
+    {
+        out.push_back(static_cast<char>(status));
+        out.push_back(static_cast<char>(data1));
+        if (length == 3)
+        {
+            out.push_back(static_cast<char>(data2));
+        }
+    }
+
+    template <typename F>
+    void release_key(int k, F &&on_release)
+    {
+        int v = voice_of_[k];
+        if (v < 0)
+        {
+            return;
+        }
+        voice_of_[k] = -1;
+        voices_[v].key = -1;
+        voices_[v].released = ++clock_;
+        on_release(channels_[v], voices_[v].note);
+    }
+
+    // Start a note, calling on_release(channel, note) for any voice the key was
+    // already playing, then on_start(channel, note, bend, stolen_note). Returns
+    // false if the note is filtered or dropped.
+    template <typename F, typename R>
+    bool start(int midinote, int midichannel, F &&on_start, R &&on_release)
+    {
+        int k = key(midinote, midichannel);
+        release_key(k, on_release);
+        double frequency;
+        {
+            auto client_lock = client_.lock();
+            if (MTS_ShouldFilterNote(client_.ptr, midinote, midichannel))
+            {
+                return false;
+            }
+            frequency = MTS_NoteToFrequency(client_.ptr, midinote, midichannel);
+        }
+        if (!(frequency > 0.0))
+        {
+            return false;
+        }
+        int v = -1;
+        for (size_t i = 0; i < voices_.size(); i++)
+        {
+            if (voices_[i].key < 0 && (v < 0 || voices_[i].released < voices_[v].released))
+            {
+                v = static_cast<int>(i);
+            }
+        }
+        int stolen_note = -1;
+        if (v < 0)
+        {
+            if (!steal_)
+            {
+                return false;
+            }
+            v = 0;
+            for (size_t i = 1; i < voices_.size(); i++)
+            {
+                if (voices_[i].started < voices_[v].started)
+                {
+                    v = static_cast<int>(i);
+                }
+            }
+            stolen_note = voices_[v].note;
+            voice_of_[voices_[v].key] = -1;
+        }
+        double semitones = 69.0 + 12.0 * std::log2(frequency / 440.0);
+        int note = static_cast<int>(std::clamp(std::lround(semitones), 0L, 127L));
+        long bend = 8192 + std::lround((semitones - note) / bend_range_ * 8192.0);
+        State &voice = voices_[v];
+        voice.key = k;
+        voice.note = note;
+        voice.bend = static_cast<int>(std::clamp(bend, 0L, 16383L));
+        voice.started = ++clock_;
+        voice_of_[k] = v;
+        on_start(channels_[v], note, voice.bend, stolen_note);
+        return true;
+    }
+
+    // Convert one channel message of length bytes, or pass a row of an array
+    // holding a system message through. Two byte messages are padded to three
+    // bytes for arrays.
+    void handle(unsigned char status, unsigned char data1, unsigned char data2, int length, std::string &out)
+    {
+        int kind = status & 0xF0;
+        int midichannel = status & 0x0F;
+        auto note_off = [&](int channel, int note) { append(out, 0x80 | channel, note, 0); };
+        if (status >= 0xF0)
+        {
+            append(out, status, data1, data2);
+        }
+        else if (kind == 0x90 && data2 > 0 && data1 < 128)
+        {
+            start(
+                data1, midichannel,
+                [&](int channel, int note, int bend, int stolen_note)
+                {
+                    if (stolen_note >= 0)
+                    {
+                        note_off(channel, stolen_note);
+                    }
+                    if (bend != sent_bend_[channel])
+                    {
+                        append(out, 0xE0 | channel, bend & 0x7F, bend >> 7);
+                        sent_bend_[channel] = bend;
+                    }
+                    append(out, 0x90 | channel, note, data2);
+                },
+                note_off);
+        }
+        else if ((kind == 0x80 || kind == 0x90) && data1 < 128)
+        {
+            int velocity = kind == 0x80 ? data2 : 0;
+            release_key(key(data1, midichannel),
+                        [&](int channel, int note) { append(out, 0x80 | channel, note, velocity); });
+        }
+        else if (kind == 0xA0 && data1 < 128)
+        {
+            int v = voice_of_[key(data1, midichannel)];
+            if (v >= 0)
+            {
+                append(out, 0xA0 | channels_[v], voices_[v].note, data2);
+            }
+        }
+        else if (kind == 0xB0 || kind == 0xC0 || kind == 0xD0)
+        {
+            for (int channel : channels_)
+            {
+                append(out, kind | channel, data1, data2, length);
+            }
+        }
+    }
+
+    // Channel message lengths by status nibble, and system common lengths
+    static int message_length(unsigned char status)
+    {
+        if (status < 0xF0)
+        {
+            return (status & 0xE0) == 0xC0 ? 2 : 3;
+        }
+        switch (status)
+        {
+        case 0xF1:
+        case 0xF3:
+            return 2;
+        case 0xF2:
+            return 3;
+        default:
+            return 1;
+        }
+    }
+
+    // System real-time bytes may come anywhere, even within another message,
+    // and are passed straight through, leaving the message and running status
+    // as they are. System common messages end running status.
+    void parse_byte(unsigned char byte, std::string &out)
+    {
+        if (byte >= 0xF8)
+        {
+            out.push_back(static_cast<char>(byte));
+            return;
+        }
+        if (in_sysex_)
+        {
+            out.push_back(static_cast<char>(byte));
+            if (!(byte & 0x80))
+            {
+                return;
+            }
+            in_sysex_ = false;
+            if (byte == 0xF7)
+            {
+                return;
+            }
+            out.pop_back();
+        }
+        if (byte == 0xF0)
+        {
+            in_sysex_ = true;
+            running_ = 0;
+            length_ = 0;
+            out.push_back(static_cast<char>(byte));
+            return;
+        }
+        if (byte & 0x80)
+        {
+            running_ = byte < 0xF0 ? byte : 0;
+            message_[0] = byte;
+            length_ = 1;
+        }
+        else if (length_ > 0)
+        {
+            message_[length_++] = byte;
+        }
+        else if (running_)
+        {
+            message_[0] = running_;
+            message_[1] = byte;
+            length_ = 2;
+        }
+        else
+        {
+            return;
+        }
+        int expected = message_length(message_[0]);
+        if (length_ < expected)
+        {
+            return;
+        }
+        if (message_[0] < 0xF0)
+        {
+            handle(message_[0], message_[1], expected == 3 ? message_[2] : 0, expected, out);
+        }
+        else
+        {
+            out.append(reinterpret_cast<const char *>(message_), expected);
+        }
+        length_ = 0;
+    }
+
+    MTSClientWrapper client_;
+    std::vector<int> channels_;
+    double bend_range_;
+    bool steal_;
+    std::vector<State> voices_;
+    // Voice playing each input channel and note, or -1
+    int voice_of_[16 * 128];
+    int sent_bend_[16] = {-1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1};
+    uint64_t clock_ = 0;
+    unsigned char running_ = 0;
+    unsigned char message_[3] = {};
+    int length_ = 0;
+    bool in_sysex_ = false;
+    std::mutex mutex_;
+};
+
+// Scala scale and keyboard mapping files, read with the Surge tuning library
+
+py::array_t<double> scala_files_to_frequencies(const std::string &scl_file, std::optional<std::string> kbm_file)
+{
+    py::array_t<double> result(128);
+    double *f = result.mutable_data();
+    py::gil_scoped_release release;
+    try
+    {
+        Tunings::Scale scale = Tunings::readSCLFile(scl_file);
+        Tunings::Tuning tuning = kbm_file ? Tunings::Tuning(scale, Tunings::readKBMFile(*kbm_file))
+                                          : Tunings::Tuning(scale);
+        for (int i = 0; i < 128; i++)
+        {
+            f[i] = tuning.frequencyForMidiNote(i);
+        }
+    }
+    catch (const Tunings::TuningError &e)
+    {
+        throw py::value_error(e.what());
+    }
+    return result;
+}
+
+// Opt-in call statistics
+//
+// Bindings are wrapped in a Timed call guard named after them. While
+// statistics are disabled a guard costs one relaxed atomic load. Enabled, it
+// counts calls and adds each call's duration, including any wait for the GIL,
+// to a histogram with bucket i holding durations in [2^i, 2^(i + 1)) ns, then
+// passes the name and duration to the hook, if one is set.
+
+struct CallStats
+{
+    std::atomic<uint64_t> calls{0};
+    std::atomic<uint64_t> total_ns{0};
+    std::atomic<uint64_t> max_ns{0};
+    std::atomic<uint64_t> histogram[64]{};
+
+    void record(uint64_t ns)
+    {
+        calls.fetch_add(1, std::memory_order_relaxed);
+        total_ns.fetch_add(ns, std::memory_order_relaxed);
+        uint64_t max = max_ns.load(std::memory_order_relaxed);
+        while (ns > max && !max_ns.compare_exchange_weak(max, ns, std::memory_order_relaxed))
+        {
+        }
+        int bucket = ns ? 63 - std::countl_zero(ns) : 0;
+        histogram[bucket].fetch_add(1, std::memory_order_relaxed);
+    }
+
+    void reset()
+    {
+        calls = 0;
+        total_ns = 0;
+        max_ns = 0;
+        for (auto &count : histogram)
+        {
+            count = 0;
+        }
+    }
+};
+
+std::atomic<bool> stats_enabled{false};
+std::atomic<bool> stats_hook_set{false};
+
+std::mutex &stats_mutex()
+{
+    static std::mutex mutex;
+    return mutex;
+}
+
+// Never destroyed, as they may be used during interpreter shutdown
+std::map<std::string, std::unique_ptr<CallStats>> &stats_registry()
+{
+    static auto *registry = new std::map<std::string, std::unique_ptr<CallStats>>();
+    return *registry;
+}
+
+py::object &stats_hook()
+{
+    static auto *hook = new py::object();
+    return *hook;
+}
+
+CallStats &call_stats(const std::string &name)
+{
+    std::lock_guard<std::mutex> lock(stats_mutex());
+    auto &stats = stats_registry()[name];
+    if (!stats)
+    {
+        stats = std::make_unique<CallStats>();
+    }
+    return *stats;
+}
+
+uint64_t now_ns()
+{
+    return std::chrono::duration_cast<std::chrono::nanoseconds>(
+               std::chrono::steady_clock::now().time_since_epoch())
+        .count();
+}
+
+// Called with the GIL held
+void record_call(const char *name, CallStats &stats, uint64_t ns)
+{
+    stats.record(ns);
+    if (!stats_hook_set.load(std::memory_order_relaxed) || std::uncaught_exceptions())
+    {
+        return;
+    }
+    py::object hook;
+    {
+        std::lock_guard<std::mutex> lock(stats_mutex());
+        hook = stats_hook();
+    }
+    if (hook)
+    {
+        try
+        {
+            hook(name, ns);
+        }
+        catch (py::error_already_set &e)
+        {
+            e.discard_as_unraisable("mtsespy stats hook");
+        }
+    }
+}
+
+template <size_t N>
+struct BindingName
+{
+    char value[N];
+
+    constexpr BindingName(const char (&name)[N]) { std::copy_n(name, N, value); }
+};
+
+// Outermost call guard, so constructed and destroyed with the GIL held
+template <BindingName name>
+struct Timed
+{
+    uint64_t start = stats_enabled.load(std::memory_order_relaxed) ? now_ns() : 0;
+
+    ~Timed()
+    {
+        if (start)
+        {
+            static CallStats &stats = call_stats(name.value);
+            record_call(name.value, stats, now_ns() - start);
+        }
+    }
+};
+
+template <BindingName name>
+py::call_guard<Timed<name>> timed()
+{
+    return {};
+}
+
+template <BindingName name>
+py::call_guard<Timed<name>, py::gil_scoped_release> timed_nogil()
+{
+    return {};
+}
+
+void enable_stats(bool enabled) { stats_enabled = enabled; }
+
+py::dict stats()
+{
+    // Copied under the lock, since making Python objects may run Python code
+    std::vector<std::tuple<std::string, uint64_t, uint64_t, uint64_t, std::vector<uint64_t>>> copies;
+    {
+        std::lock_guard<std::mutex> lock(stats_mutex());
+        for (const auto &[name, stats] : stats_registry())
+        {
+            if (uint64_t calls = stats->calls)
+            {
+                std::vector<uint64_t> histogram(stats->histogram, stats->histogram + 64);
+                copies.emplace_back(name, calls, stats->total_ns, stats->max_ns, std::move(histogram));
+            }
+        }
+    }
+    py::dict result;
+    for (const auto &[name, calls, total_ns, max_ns, histogram] : copies)
+    {
+        py::dict entry;
+        entry["calls"] = calls;
+        entry["total_ns"] = total_ns;
+        entry["max_ns"] = max_ns;
+        entry["histogram"] = py::array_t<uint64_t>(64, histogram.data());
+        result[py::str(name)] = entry;
+    }
+    return result;
+}
+
+void reset_stats()
+{
+    std::lock_guard<std::mutex> lock(stats_mutex());
+    for (auto &[name, stats] : stats_registry())
+    {
+        stats->reset();
+    }
+}
+
+void set_stats_hook(py::object hook)
+{
+    if (!hook.is_none() && !PyCallable_Check(hook.ptr()))
+    {
+        throw py::type_error("hook must be callable or None");
+    }
+    py::object previous;
+    {
+        std::lock_guard<std::mutex> lock(stats_mutex());
+        previous = stats_hook();
+        stats_hook() = hook.is_none() ? py::object() : hook;
+        stats_hook_set = !hook.is_none();
+    }
+}
+
+// For timings made in Python
+void record_python_call(const std::string &name, uint64_t elapsed_ns)
+{
+    if (stats_enabled.load(std::memory_order_relaxed))
+    {
+        CallStats &stats = call_stats(name);
+        record_call(name.c_str(), stats, elapsed_ns);
+    }
+}
 
-PYBIND11_MODULE(_mtsespy, m)
+PYBIND11_MODULE(_mtsespy, m, py::mod_gil_not_used())
 {
     m.doc() = "Wrapper for ODDSound MTS-ESP C++ library";
-    py::class_<MTSClientWrapper>(m, "MTSClient");
-    m.def("register_client", &register_client, "Register MTS client");
-    m.def("deregister_client", &deregister_client, "De-register MTS client");
-    m.def("has_master", &has_master, "Check if client is connected to a master");
-    m.def("should_filter_note", &should_filter_note, "Check if note should not be played");
-    m.def("note_to_frequency", &note_to_frequency, "Convert midi note to frequency");
-    m.def("retuning_in_semitones", &retuning_in_semitones, "Midi note retuning in semitones");
-    m.def("retuning_as_ratio", &retuning_as_ratio, "Midi note retuning as ratio");
+    // Calls into MTS-ESP run with the GIL released. Functions taking Python
+    // objects release it themselves once their arguments have been read. The
+    // MTSClient methods and properties for scalar queries keep it, as they
+    // take less time than releasing and reacquiring it, and nothing holding a
+    // client lock waits for the GIL.
+    auto nogil = py::call_guard<py::gil_scoped_release>();
+    py::class_<TuningSnapshot, std::shared_ptr<TuningSnapshot>>(
+        m, "TuningSnapshot", "Immutable copy of the tuning seen by a client")
+        .def_property_readonly(
+            "frequencies", [](py::object self)
+            { return snapshot_view(self, &self.cast<TuningSnapshot &>().frequencies[0][0]); },
+            "Frequencies of all notes as a (16, 128) array indexed by channel and note")
+        .def_property_readonly(
+            "filter_mask", [](py::object self)
+            { return snapshot_view(self, &self.cast<TuningSnapshot &>().filter_mask[0][0]); },
+            "Notes which should not be played as a (16, 128) array indexed by channel and note")
+        .def_property_readonly(
+            "multi_channel",
+            [](py::object self)
+            {
+                py::array_t<bool> view(16, self.cast<TuningSnapshot &>().multi_channel, self);
+                view.attr("flags").attr("writeable") = false;
+                return view;
+            },
+            "Channels using multi-channel tuning as a (16,) array")
+        .def_readonly("scale_name", &TuningSnapshot::scale_name, "Scale name")
+        .def_readonly("period_ratio", &TuningSnapshot::period_ratio, "Period of the scale")
+        .def_readonly("map_size", &TuningSnapshot::map_size, "Size of keyboard mapping")
+        .def_readonly("map_start_key", &TuningSnapshot::map_start_key, "Start key of keyboard mapping")
+        .def_readonly("ref_key", &TuningSnapshot::ref_key, "Reference key of tuning")
+        .def_readonly("generation", &TuningSnapshot::generation,
+                      "Counter incremented each time the client's tuning changes")
+        .def("frequency_to_note", &snapshot_frequency_to_note,
+             "Get notes closest to an array of frequencies on a midi channel, with errors in cents",
+             py::arg("frequencies"), py::arg("midichannel"))
+        .def("frequency_to_note_and_channel", &snapshot_frequency_to_note_and_channel,
+             "Get notes and midi channels closest to an array of frequencies, with errors in cents",
+             py::arg("frequencies"), py::arg("channels") = py::none())
+        .def("key_mapping", &snapshot_key_mapping,
+             "Get periods, scale degrees, mapped flags and retunings in cents of notes on a midi channel",
+             py::arg("notes") = py::none(), py::arg("midichannel") = 0)
+        .def("changes_since", &snapshot_changes_since,
+             "Masks of notes whose frequency and filter changed since previous snapshot, and whether the scale "
+             "name and mapping changed",
+             py::arg("previous"));
+    py::class_<TuningTables, std::shared_ptr<TuningTables>>(
+        m, "TuningTables", "Live read-only access to the master's tuning tables in libMTS")
+        .def_property_readonly("online", &TuningTables::online,
+                               "Whether a master is connected, without which the tables are not used")
+        .def("frequencies", &tuning_tables_frequencies,
+             "Read-only view of the global tuning table, or a midi channel's multi-channel table, updated in "
+             "place by the master",
+             py::arg("midichannel") = py::none())
+        .def("read", &tuning_tables_read,
+             "Copy the global table and the 16 multi-channel tables into a (17, 128) array, repeating until "
+             "two passes agree so the copy is not torn by a concurrent update",
+             py::arg("out").noconvert() = py::none(), py::arg("max_passes") = 100, timed<"TuningTables.read">());
+    // The scalar queries are methods bound directly to the C++ functions, with
+    // the module functions of the same names as aliases taking the client first.
+    // The module functions release the GIL, so threads can query the same
+    // client in parallel. The methods and properties keep the GIL and are bound
+    // without call statistics, as the cheapest way to make a single query.
+    py::class_<MTSClientWrapper>(m, "MTSClient")
+        .def("snapshot", &snapshot, "Get snapshot of the current tuning, made on first use",
+             timed_nogil<"MTSClient.snapshot">())
+        .def("refresh", &refresh, "Update snapshot of the current tuning, returning True if it changed",
+             timed_nogil<"MTSClient.refresh">())
+        .def(
+            "tables", [](const MTSClientWrapper &) { return std::make_shared<TuningTables>(); },
+            "Get live read-only access to the master's tuning tables")
+        .def("has_master", &has_master, "Check if client is connected to a master")
+        .def("should_filter_note", &should_filter_note, "Check if note should not be played",
+             py::arg("midinote"), py::arg("midichannel"))
+        .def("note_to_frequency", &note_to_frequency, "Convert midi note to frequency", py::arg("midinote"),
+             py::arg("midichannel"))
+        .def("retuning_in_semitones", &retuning_in_semitones, "Midi note retuning in semitones",
+             py::arg("midinote"), py::arg("midichannel"))
+        .def("retuning_as_ratio", &retuning_as_ratio, "Midi note retuning as ratio", py::arg("midinote"),
+             py::arg("midichannel"))
+        .def("frequency_to_note", &frequency_to_note, "Get note number whose pitch is closest to given frequency",
+             py::arg("freq"), py::arg("midichannel"))
+        .def("frequency_to_note_and_channel", &frequency_to_note_and_channel,
+             "Get note number and midi channel for pitch closest to given frequency", py::arg("freq"))
+        .def("parse_midi_data", &parse_midi_data, "Parse midi MTS sysex data to update tuning", py::arg("buffer"),
+             timed<"MTSClient.parse_midi_data">())
+        .def_property_readonly("scale_name", &get_scale_name, "Scale name of current scale")
+        .def_property_readonly("period_ratio", &get_period_ratio, "Period of the current scale")
+        .def_property_readonly("period_semitones", &get_period_semitones, "Period of the current scale in semitones")
+        .def_property_readonly("map_size", &get_map_size, "Size of keyboard mapping")
+        .def_property_readonly("map_start_key", &get_map_start_key, "Start key of keyboard mapping")
+        .def_property_readonly("ref_key", &get_ref_key, "Reference key of tuning")
+        .def_property_readonly("has_received_mts_sysex", &has_received_mts_sysex,
+                               "Whether client has received any valid MTS SysEx messages")
+        .def_property_readonly("should_update_library", &client_should_update_library,
+                               "Whether an older version of libMTS dynamic library is installed");
+    m.def("register_client", &register_client, "Register MTS client", timed_nogil<"register_client">());
+    m.def("deregister_client", &deregister_client, "De-register MTS client", timed_nogil<"deregister_client">());
+    m.def("has_master", &has_master, "Check if client is connected to a master", timed_nogil<"has_master">());
+    m.def("should_filter_note", &should_filter_note, "Check if note should not be played",
+          timed_nogil<"should_filter_note">());
+    m.def("note_to_frequency", &note_to_frequency, "Convert midi note to frequency",
+          timed_nogil<"note_to_frequency">());
+    m.def("retuning_in_semitones", &retuning_in_semitones, "Midi note retuning in semitones",
+          timed_nogil<"retuning_in_semitones">());
+    m.def("retuning_as_ratio", &retuning_as_ratio, "Midi note retuning as ratio",
+          timed_nogil<"retuning_as_ratio">());
+    m.def("get_filter_mask", &get_filter_mask, "Get which notes should not be played as a (16, 128) array",
+          py::arg("client"), py::arg("out").noconvert() = py::none(), timed<"get_filter_mask">());
+    m.def("should_filter_note_array", &should_filter_note_array,
+          "Check which notes should not be played, for arrays of notes and channels", py::arg("client"),
+          py::arg("notes") = py::none(), py::arg("channels") = py::none(),
+          py::arg("out").noconvert() = py::none(), timed<"should_filter_note_array">());
+    m.def("note_to_frequency_array", &note_to_frequency_array,
+          "Convert arrays of midi notes and channels to frequencies", py::arg("client"),
+          py::arg("notes") = py::none(), py::arg("channels") = py::none(),
+          py::arg("out").noconvert() = py::none(), timed<"note_to_frequency_array">());
+    m.def("retuning_in_semitones_array", &retuning_in_semitones_array,
+          "Midi note retunings in semitones for arrays of notes and channels", py::arg("client"),
+          py::arg("notes") = py::none(), py::arg("channels") = py::none(),
+          py::arg("out").noconvert() = py::none(), timed<"retuning_in_semitones_array">());
+    m.def("retuning_as_ratio_array", &retuning_as_ratio_array,
+          "Midi note retunings as ratios for arrays of notes and channels", py::arg("client"),
+          py::arg("notes") = py::none(), py::arg("channels") = py::none(),
+          py::arg("out").noconvert() = py::none(), timed<"retuning_as_ratio_array">());
     m.def("frequency_to_note", &frequency_to_note,
-          "Get note number whose pitch is closest to given frequency");
+          "Get note number whose pitch is closest to given frequency", timed_nogil<"frequency_to_note">());
     m.def("frequency_to_note_and_channel", &frequency_to_note_and_channel,
-          "Get note number and midi channel for pitch closest to given frequency");
-    m.def("get_scale_name", &get_scale_name, "Get scale name of current scale");
-    m.def("client_should_update_library", &client_should_update_library, "Check if older version of libMTS dynamic library installed");
-    m.def("get_period_ratio", &get_period_ratio, "Get period of the current scale");
-    m.def("get_period_semitones", &get_period_semitones, "Get period of the current scale in semitones");
-    m.def("get_map_size", &get_map_size, "Get size of keyboard mapping");
-    m.def("get_map_start_key", &get_map_start_key, "Get start key of keyboard mapping");
-    m.def("get_ref_key", &get_ref_key, "Get reference key of tuning");
-    m.def("has_received_mts_sysex", &has_received_mts_sysex, "Check if client has received any valid MTS SysEx messages");
-    m.def("register_master", &MTS_RegisterMaster, "Register MTS master");
-    m.def("deregister_master", &MTS_DeregisterMaster, "Deregister MTS master");
+          "Get note number and midi channel for pitch closest to given frequency",
+           timed_nogil<"frequency_to_note_and_channel">());
+    m.def("frequency_to_note_array", &frequency_to_note_array,
+          "Get notes closest to an array of frequencies on a midi channel, with errors in cents",
+          py::arg("client"), py::arg("frequencies"), py::arg("midichannel"), timed<"frequency_to_note_array">());
+    m.def("frequency_to_note_and_channel_array", &frequency_to_note_and_channel_array,
+          "Get notes and midi channels closest to an array of frequencies, with errors in cents",
+          py::arg("client"), py::arg("frequencies"), py::arg("channels") = py::none(),
+           timed<"frequency_to_note_and_channel_array">());
+    m.def("key_mapping_array", &key_mapping_array,
+          "Get periods, scale degrees, mapped flags and retunings in cents of notes on a midi channel",
+          py::arg("client"), py::arg("notes") = py::none(), py::arg("midichannel") = 0,
+          timed<"key_mapping_array">());
+    m.def("get_scale_name", &get_scale_name, "Get scale name of current scale", timed_nogil<"get_scale_name">());
+    m.def("client_should_update_library", &client_should_update_library,
+          "Check if older version of libMTS dynamic library installed",
+          timed_nogil<"client_should_update_library">());
+    m.def("get_period_ratio", &get_period_ratio, "Get period of the current scale",
+          timed_nogil<"get_period_ratio">());
+    m.def("get_period_semitones", &get_period_semitones, "Get period of the current scale in semitones",
+          timed_nogil<"get_period_semitones">());
+    m.def("get_map_size", &get_map_size, "Get size of keyboard mapping", timed_nogil<"get_map_size">());
+    m.def("get_map_start_key", &get_map_start_key, "Get start key of keyboard mapping",
+          timed_nogil<"get_map_start_key">());
+    m.def("get_ref_key", &get_ref_key, "Get reference key of tuning", timed_nogil<"get_ref_key">());
+    m.def("has_received_mts_sysex", &has_received_mts_sysex,
+          "Check if client has received any valid MTS SysEx messages",
+          timed_nogil<"has_received_mts_sysex">());
+    m.def("register_master", &register_master, "Register MTS master", timed_nogil<"register_master">());
+    m.def("deregister_master", &deregister_master, "Deregister MTS master", timed_nogil<"deregister_master">());
     m.def("can_register_master", &MTS_CanRegisterMaster,
-          "Check if master has already been registered");
-    m.def("has_ipc", &MTS_HasIPC, "Check if process running master is using IPC");
-    m.def("reinitialize", &MTS_Reinitialize, "Reset everything in MTS-ESP library");
-    m.def("get_num_clients", &MTS_GetNumClients, "Get number of connected clients");
-    m.def("set_note_tunings", &set_note_tunings, "Set tunings of all 128 midi notes");
-    m.def("set_note_tuning", &set_note_tuning, "Set tuning of single note");
-    m.def("set_scale_name", &MTS_SetScaleName, "Set scale name");
-    m.def("filter_note", &filter_note, "Instruct clients to filter note");
-    m.def("clear_note_filter", &MTS_ClearNoteFilter, "Clear note filter");
+          "Check if master has already been registered", timed_nogil<"can_register_master">());
+    m.def("has_ipc", &MTS_HasIPC, "Check if process running master is using IPC", timed_nogil<"has_ipc">());
+    m.def("reinitialize", &reinitialize, "Reset everything in MTS-ESP library", timed_nogil<"reinitialize">());
+    m.def("get_num_clients", &MTS_GetNumClients, "Get number of connected clients",
+          timed_nogil<"get_num_clients">());
+    m.def("set_note_tunings", &set_note_tunings, "Set tunings of all 128 midi notes", timed<"set_note_tunings">());
+    m.def("set_note_tuning", &set_note_tuning, "Set tuning of single note", timed_nogil<"set_note_tuning">());
+    m.def("set_scale_name", &set_scale_name, "Set scale name", timed_nogil<"set_scale_name">());
+    m.def("filter_note", &filter_note, "Instruct clients to filter note", timed_nogil<"filter_note">());
+    m.def("clear_note_filter", &clear_note_filter, "Clear note filter", timed_nogil<"clear_note_filter">());
+    m.def("set_filter_mask", &set_filter_mask,
+          "Set which notes to filter from a (128,) or (16, 128) mask, writing only notes that changed, and "
+          "return the number of writes made",
+          py::arg("mask"), py::arg("multi_channel") = false, timed<"set_filter_mask">());
     m.def("set_multi_channel", &set_multi_channel,
-          "Set whether MIDI channel is in multi-channel tuning table");
+          "Set whether MIDI channel is in multi-channel tuning table", timed_nogil<"set_multi_channel">());
     m.def("set_multi_channel_note_tunings", &set_multi_channel_note_tunings,
-          "Set tuning of all 128 notes on specific midi channel");
+          "Set tuning of all 128 notes on specific midi channel", timed<"set_multi_channel_note_tunings">());
+    m.def("set_all_multi_channel_note_tunings", &set_all_multi_channel_note_tunings,
+          "Set tuning of all 128 notes on all 16 midi channels", timed<"set_all_multi_channel_note_tunings">());
     m.def("set_multi_channel_note_tuning", &set_multi_channel_note_tuning,
-          "Set tuning of note on specific midi channel");
+          "Set tuning of note on specific midi channel", timed_nogil<"set_multi_channel_note_tuning">());
     m.def("filter_note_multi_channel", &filter_note_multi_channel,
-          "Instruct clients to filter note on specific midi channel");
+          "Instruct clients to filter note on specific midi channel", timed_nogil<"filter_note_multi_channel">());
     m.def("clear_note_filter_multi_channel", &clear_note_filter_multi_channel,
-          "Clear note filter on specific midi channel");
-    m.def("parse_midi_data", &parse_midi_data, "Parse midi MTS sysex data to update tuning");
-    m.def("master_should_update_library", &MTS_Master_ShouldUpdateLibrary, "Check if older version of libMTS dynamic library installed");
-    m.def("set_period_ratio", &MTS_SetPeriodRatio, "Set the period ratio of the scale");
-    m.def("set_map_size", &set_map_size, "Set the size of the keyboard mapping");
-    m.def("set_map_start_key", &set_map_start_key, "Set the start key of the keyboard mapping");
-    m.def("set_ref_key", &set_ref_key, "Set the reference key of the tuning");
+          "Clear note filter on specific midi channel", timed_nogil<"clear_note_filter_multi_channel">());
+    m.def("parse_midi_data", &parse_midi_data, "Parse midi MTS sysex data to update tuning",
+          timed<"parse_midi_data">());
+    py::class_<SysExStream>(m, "_SysExStream")
+        .def(py::init<MTSClientWrapper>(), py::arg("client"))
+        .def("feed", &SysExStream::feed, "Feed midi bytes, returning the number of MTS messages parsed",
+             py::arg("data"), timed<"SysExStream.feed">())
+        .def("reset", &SysExStream::reset, "Drop any partially received message", nogil)
+        .def_property_readonly("message_count", &SysExStream::message_count,
+                               "Total number of MTS messages parsed");
+    py::class_<VoiceAllocator>(m, "_VoiceAllocator")
+        .def(py::init<MTSClientWrapper, std::optional<index_array>, double, bool>(), py::arg("client"),
+             py::arg("channels") = py::none(), py::arg("bend_range") = 2.0, py::arg("steal") = true)
+        .def("note_on", &VoiceAllocator::note_on,
+             "Allocate a voice for a note, returning its channel, 12-TET note, pitch bend, any stolen note, and the "
+             "channel and note of any voice released for the same key",
+             py::arg("midinote"), py::arg("midichannel") = 0, py::arg("velocity") = 127,
+             timed<"VoiceAllocator.note_on">())
+        .def("note_off", &VoiceAllocator::note_off,
+             "Release the voice playing a note, returning its channel and note", py::arg("midinote"),
+             py::arg("midichannel") = 0, timed<"VoiceAllocator.note_off">())
+        .def("process", &VoiceAllocator::process,
+             "Convert the notes in midi bytes, passing other messages through", py::arg("data"),
+             timed<"VoiceAllocator.process">())
+        .def("process_array", &VoiceAllocator::process_array,
+             "Convert the notes in an (n, 3) array of midi messages, passing other messages through",
+             py::arg("events"), timed<"VoiceAllocator.process_array">())
+        .def("all_notes_off", &VoiceAllocator::all_notes_off, "Release every voice, returning their note offs",
+             timed<"VoiceAllocator.all_notes_off">())
+        .def_property_readonly("active", &VoiceAllocator::active, "Number of voices playing")
+        .def_property_readonly("channels", &VoiceAllocator::channels, "Output channels")
+        .def_property_readonly("bend_range", &VoiceAllocator::bend_range, "Pitch bend range in semitones");
+    py::class_<MasterBatch>(m, "_MasterBatch")
+        .def(py::init<>())
+        .def("set_note_tuning", &MasterBatch::set_note_tuning, "Buffer tuning of single note",
+             py::arg("frequency_in_hz"), py::arg("midinote"), nogil)
+        .def("set_note_tunings", &MasterBatch::set_note_tunings, "Buffer tunings of all 128 midi notes",
+             py::arg("frequencies_in_hz"))
+        .def("set_multi_channel_note_tuning", &MasterBatch::set_multi_channel_note_tuning,
+             "Buffer tuning of note on specific midi channel", py::arg("frequency_in_hz"), py::arg("midinote"),
+             py::arg("midichannel"), nogil)
+        .def("set_multi_channel_note_tunings", &MasterBatch::set_multi_channel_note_tunings,
+             "Buffer tuning of all 128 notes on specific midi channel", py::arg("frequencies_in_hz"),
+             py::arg("midichannel"))
+        .def("filter_note", &MasterBatch::filter_note, "Buffer instruction to filter note", py::arg("doFilter"),
+             py::arg("midinote"), py::arg("midichannel"), nogil)
+        .def("clear_note_filter", &MasterBatch::clear_note_filter, "Buffer clearing note filter", nogil)
+        .def("filter_note_multi_channel", &MasterBatch::filter_note_multi_channel,
+             "Buffer instruction to filter note on specific midi channel", py::arg("doFilter"),
+             py::arg("midinote"), py::arg("midichannel"), nogil)
+        .def("clear_note_filter_multi_channel", &MasterBatch::clear_note_filter_multi_channel,
+             "Buffer clearing note filter on specific midi channel", py::arg("midichannel"), nogil)
+        .def("commit", &MasterBatch::commit,
+             "Send changed values to MTS-ESP, returning the number of library calls made",
+             timed_nogil<"MasterBatch.commit">())
+        .def("discard", &MasterBatch::discard, "Drop buffered writes", nogil);
+    py::class_<TuningRecorder>(m, "_TuningRecorder")
+        .def(py::init<std::string>(), py::arg("path"))
+        .def("start", &TuningRecorder::start, "Start recording master writes", nogil)
+        .def("stop", &TuningRecorder::stop, "Stop recording and flush the log", nogil)
+        .def("close", &TuningRecorder::close, "Stop recording and close the log", nogil)
+        .def_property_readonly("events", &TuningRecorder::events, "Number of writes recorded");
+    m.def("_activate_preset", &activate_preset, "Apply a preset from a preset bank to the master",
+          py::arg("data"), py::arg("index"), timed<"activate_preset">());
+    m.def("_replay_log", &replay_log, "Replay master writes from a tuning log", py::arg("data"),
+          py::arg("speed") = 1.0, timed<"replay_log">());
+    py::class_<GlideScheduler>(m, "_GlideScheduler")
+        .def(py::init<double>(), py::arg("rate") = 1000.0)
+        .def("glide_to", &GlideScheduler::glide_to, "Glide master tuning to target frequencies",
+             py::arg("frequencies_in_hz"), py::arg("duration"), py::arg("curve") = "linear",
+             py::arg("midichannel") = py::none(), timed<"GlideScheduler.glide_to">())
+        .def("cancel", &GlideScheduler::cancel, "Stop all glides, leaving tunings where they are", nogil)
+        .def("wait", &GlideScheduler::wait, "Wait until no glides are active, returning False on timeout",
+             py::arg("timeout") = py::none(), nogil)
+        .def_property_readonly("active", &GlideScheduler::active, "Whether any glides are active")
+        .def("stats", &GlideScheduler::stats, "Ticks, achieved rate in Hz, deadline misses and max lateness in s")
+        .def("reset_stats", &GlideScheduler::reset_stats, "Reset scheduler statistics", nogil)
+        .def("close", &GlideScheduler::close, "Stop the scheduler thread", nogil);
+    m.def("encode_bulk_tuning_dump", &encode_bulk_tuning_dump,
+          "Encode frequencies of all 128 notes as MTS bulk tuning dumps", py::arg("frequencies"),
+          py::arg("program") = 0, py::arg("name") = "", py::arg("device_id") = 0x7F,
+          py::arg("bank") = py::none(), timed<"encode_bulk_tuning_dump">());
+    m.def("encode_single_note_tuning", &encode_single_note_tuning,
+          "Encode frequencies of given notes as MTS single note tuning changes, with bank 0 by default if not "
+          "realtime",
+          py::arg("notes"),
+          py::arg("frequencies"), py::arg("program") = 0, py::arg("device_id") = 0x7F,
+          py::arg("realtime") = true, py::arg("bank") = py::none(), timed<"encode_single_note_tuning">());
+    m.def("encode_scale_octave_tuning", &encode_scale_octave_tuning,
+          "Encode cents offsets of the 12 pitch classes as an MTS scale/octave tuning message",
+          py::arg("cents"), py::arg("channels") = py::none(), py::arg("two_byte") = false,
+          py::arg("device_id") = 0x7F, py::arg("realtime") = true, timed<"encode_scale_octave_tuning">());
+    m.def("decode_mts_sysex", &decode_mts_sysex,
+          "Decode MTS messages into the frequencies of all 128 notes on a midi channel after each message "
+          "retuning it",
+          py::arg("data"), py::arg("frequencies") = py::none(), py::arg("midichannel") = 0,
+          timed<"decode_mts_sysex">());
+    m.def("_scala_files_to_frequencies", &scala_files_to_frequencies,
+          "Frequencies of all 128 midi notes from Scala scale and keyboard mapping files", py::arg("scl_file"),
+          py::arg("kbm_file") = py::none(), timed<"_scala_files_to_frequencies">());
+    m.def("enable_stats", &enable_stats, "Turn collection of call statistics on or off",
+          py::arg("enabled") = true);
+    m.def("stats_enabled", []() { return stats_enabled.load(); }, "Check if call statistics are collected");
+    m.def("stats", &stats,
+          "Call count, total and maximum duration in ns, and log2 ns duration histogram of each binding called "
+          "while statistics were collected");
+    m.def("reset_stats", &reset_stats, "Reset call statistics");
+    m.def("set_stats_hook", &set_stats_hook,
+          "Set a function called with the name and duration in ns of each call while statistics are "
+          "collected, or None to remove it",
+          py::arg("hook"));
+    m.def("_record_call", &record_python_call, "Record a call timed in Python", py::arg("name"),
+          py::arg("elapsed_ns"));
+    m.def("master_should_update_library", &MTS_Master_ShouldUpdateLibrary,
+          "Check if older version of libMTS dynamic library installed",
+          timed_nogil<"master_should_update_library">());
+    m.def("set_period_ratio", &set_period_ratio, "Set the period ratio of the scale",
+          timed_nogil<"set_period_ratio">());
+    m.def("set_map_size", &set_map_size, "Set the size of the keyboard mapping",
+          timed_nogil<"set_map_size">());
+    m.def("set_map_start_key", &set_map_start_key, "Set the start key of the keyboard mapping",
+          timed_nogil<"set_map_start_key">());
+    m.def("set_ref_key", &set_ref_key, "Set the reference key of the tuning", timed_nogil<"set_ref_key">());
 }
@@ -0,0 +1,232 @@
+"""
+Banks of complete master states, switched between with a single call
+"""
+
+import mmap
+import os
+import struct
+
+import numpy as np
+
+from ._mtsespy import _activate_preset
+
+_MAGIC = b"MTSESPYB"
+_VERSION = 1
+_HEADER = struct.Struct("=8sII")
+
+PRESET_DTYPE = np.dtype(
+    [
+        ("tunings", "=f8", (17, 128)),
+        ("note_filter", "u1", (256,)),
+        ("multi_channel_filter", "u1", (256,)),
+        ("period_ratio", "=f8"),
+        ("multi_channel", "=u2"),
+        ("map_size", "i1"),
+        ("map_start_key", "i1"),
+        ("ref_key", "i1"),
+        ("padding", "V3"),
+        ("scale_name", "S256"),
+    ]
+)
+
+
+def _pack_mask(mask, name):
+    mask = np.asarray(mask, dtype=bool)
+    if mask.shape == (128,):
+        mask = np.broadcast_to(mask, (16, 128))
+    elif mask.shape != (16, 128):
+        raise ValueError(f"{name} must have shape (128,) or (16, 128)")
+    return np.packbits(mask, bitorder="little")
+
+
+class PresetBank:
+    """
+    Complete master states, any of which can be applied in a single call.
+
+    Each preset holds the global and all 16 multi-channel tuning tables, the
+    note filters, which channels use multi-channel tuning, the scale name,
+    period ratio and keyboard mapping. Presets are stored as fixed size
+    records in one contiguous buffer, which `save` writes to a compact file
+    and `load` memory-maps, so presets in large banks are only read when
+    activated. `activate` applies a preset in C++, writing only what differs
+    from what this process last wrote to the master.
+
+    New presets start as 12-TET with no notes filtered, no channels using
+    multi-channel tuning, the scale name "12-TET", a period ratio of 2 and
+    no keyboard mapping.
+
+    Parameters
+    ----------
+    count : int
+        Number of presets.
+
+    Examples
+    --------
+    >>> bank = mts.PresetBank(2)
+    >>> bank.set(1, frequencies=440.0 * 2 ** ((np.arange(128) - 69) / 19),
+    ...          scale_name="19-EDO", map_size=19)
+    >>> with mts.Master():
+    ...     bank.activate(1)
+    ...     bank.activate(0)
+    """
+
+    def __init__(self, count=0):
+        data = bytearray(_HEADER.size + count * PRESET_DTYPE.itemsize)
+        _HEADER.pack_into(data, 0, _MAGIC, _VERSION, count)
+        self._data = data
+        self._mmap = None
+        self.presets = np.frombuffer(data, PRESET_DTYPE, count, _HEADER.size)
+        presets = self.presets
+        presets["tunings"] = 440.0 * 2 ** ((np.arange(128) - 69) / 12)
+        presets["period_ratio"] = 2.0
+        presets["map_size"] = presets["map_start_key"] = presets["ref_key"] = -1
+        presets["scale_name"] = b"12-TET"
+
+    @classmethod
+    def load(cls, path):
+        """
+        Memory-map a preset bank saved with `save`, read-only.
+        """
+        bank = cls.__new__(cls)
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size < _HEADER.size:
+                raise ValueError("not a preset bank")
+            bank._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count = _HEADER.unpack_from(bank._mmap)
+        if magic != _MAGIC:
+            bank._mmap.close()
+            raise ValueError("not a preset bank")
+        if version != _VERSION:
+            bank._mmap.close()
+            raise ValueError(f"unsupported preset bank version {version}")
+        if len(bank._mmap) < _HEADER.size + count * PRESET_DTYPE.itemsize:
+            bank._mmap.close()
+            raise ValueError("preset bank is truncated")
+        bank._data = bank._mmap
+        bank.presets = np.frombuffer(bank._mmap, PRESET_DTYPE, count, _HEADER.size)
+        return bank
+
+    def save(self, path):
+        """
+        Write the bank to a file.
+        """
+        with open(path, "wb") as f:
+            f.write(self._data)
+
+    def close(self):
+        """
+        Unmap a bank loaded with `load`.
+        """
+        if self._mmap is not None:
+            self.presets = self._data = None
+            self._mmap.close()
+            self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        return len(self.presets)
+
+    def set(
+        self,
+        index,
+        frequencies=None,
+        multi_channel_frequencies=None,
+        note_filter=None,
+        multi_channel_filter=None,
+        multi_channel=None,
+        scale_name=None,
+        period_ratio=None,
+        map_size=None,
+        map_start_key=None,
+        ref_key=None,
+    ):
+        """
+        Change parts of a preset, leaving the rest as they are.
+
+        Parameters
+        ----------
+        index : int
+            Preset to change.
+        frequencies : array_like, optional
+            Global tuning table of 128 frequencies.
+        multi_channel_frequencies : array_like, optional
+            Multi-channel tuning tables, of shape (16, 128).
+        note_filter : array_like of bool, optional
+            Notes to filter, of shape (128,) for every channel or (16, 128).
+        multi_channel_filter : array_like of bool, optional
+            Notes to filter on channels using multi-channel tuning, of shape
+            (128,) for every channel or (16, 128).
+        multi_channel : array_like of bool, optional
+            Which of the 16 channels use multi-channel tuning.
+        scale_name : str, optional
+            Scale name, at most 255 bytes encoded as UTF-8.
+        period_ratio : float, optional
+            Period ratio of the scale.
+        map_size, map_start_key, ref_key : int, optional
+            Keyboard mapping, as for `set_map_size`, `set_map_start_key` and
+            `set_ref_key`.
+        """
+        if not -len(self) <= index < len(self):
+            raise IndexError("preset index out of range")
+        preset = self.presets[index : index + 1 or None]
+        if frequencies is not None:
+            frequencies = np.asarray(frequencies, dtype=np.float64)
+            if frequencies.shape != (128,):
+                raise ValueError("frequencies must have shape (128,)")
+            preset["tunings"][0, 0] = frequencies
+        if multi_channel_frequencies is not None:
+            multi_channel_frequencies = np.asarray(
+                multi_channel_frequencies, dtype=np.float64
+            )
+            if multi_channel_frequencies.shape != (16, 128):
+                raise ValueError("multi_channel_frequencies must have shape (16, 128)")
+            preset["tunings"][0, 1:] = multi_channel_frequencies
+        if note_filter is not None:
+            preset["note_filter"] = _pack_mask(note_filter, "note_filter")
+        if multi_channel_filter is not None:
+            preset["multi_channel_filter"] = _pack_mask(
+                multi_channel_filter, "multi_channel_filter"
+            )
+        if multi_channel is not None:
+            multi_channel = np.asarray(multi_channel, dtype=bool)
+            if multi_channel.shape != (16,):
+                raise ValueError("multi_channel must have shape (16,)")
+            preset["multi_channel"] = multi_channel @ (1 << np.arange(16))
+        if scale_name is not None:
+            name = scale_name.encode()
+            if len(name) > 255:
+                raise ValueError("scale_name must be at most 255 bytes")
+            preset["scale_name"] = name
+        if period_ratio is not None:
+            preset["period_ratio"] = period_ratio
+        for field, value in [
+            ("map_size", map_size),
+            ("map_start_key", map_start_key),
+            ("ref_key", ref_key),
+        ]:
+            if value is not None:
+                if not -128 <= value <= 127:
+                    raise ValueError(f"{field} must be in range [-128, 127]")
+                preset[field] = value
+
+    def activate(self, index):
+        """
+        Apply a preset to the master in one native call.
+
+        Only the notes, filters and settings which differ from what this
+        process last wrote to the master are written. A master must be
+        registered.
+
+        Returns
+        -------
+        int
+            Number of writes made.
+        """
+        if index < 0:
+            index += len(self)
+        return _activate_preset(self._data, index)
@@ -0,0 +1,157 @@
+"""
+Recording master writes to a tuning log and replaying them
+"""
+
+import mmap
+import os
+import struct
+from typing import NamedTuple
+
+import numpy as np
+
+from ._mtsespy import _TuningRecorder, _replay_log
+
+_MAGIC = b"MTSESPYL"
+_VERSION = 1
+_RECORD = struct.Struct("=QBbBBI")
+
+_OPS = {
+    1: "set_note_tuning",
+    2: "set_note_tunings",
+    3: "filter_note",
+    4: "clear_note_filter",
+    5: "filter_note_multi_channel",
+    6: "clear_note_filter_multi_channel",
+    7: "set_multi_channel",
+    8: "set_scale_name",
+    9: "set_period_ratio",
+    10: "set_map_size",
+    11: "set_map_start_key",
+    12: "set_ref_key",
+}
+
+
+class Recorder(_TuningRecorder):
+    """
+    Context manager recording every write this process makes to the master.
+
+    Writes from the module functions, `MasterBatch`, `GlideScheduler` and
+    `set_filter_mask` are appended, with the time since recording started,
+    to a compact binary tuning log at `path`. Tuning tables are stored as
+    the notes changed since the table was last recorded, and the log is
+    written through a fixed size buffer, so long recordings of glides need
+    no more memory than short ones. Only one recorder can record at a time.
+
+    Parameters
+    ----------
+    path : str or os.PathLike
+        File to write the log to, replacing any existing file.
+
+    Examples
+    --------
+    >>> with mts.Master(), mts.Recorder("set.mtslog") as recorder:
+    ...     mts.set_note_tuning(441.0, 69)
+    >>> recorder.events
+    1
+    """
+
+    def __init__(self, path):
+        super().__init__(os.fspath(path))
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def replay(path, speed=1.0):
+    """
+    Make the master writes in a tuning log again.
+
+    The log is memory-mapped and replayed in C++ without the GIL, through
+    the same setters as the module functions. A master must be registered.
+
+    Parameters
+    ----------
+    path : str or os.PathLike
+        Tuning log written by `Recorder`.
+    speed : float or None, optional
+        Replay at `speed` times the recorded rate, by default in real time,
+        or as fast as possible if None.
+
+    Returns
+    -------
+    int
+        Number of writes made.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError("not a tuning log")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return _replay_log(data, speed)
+
+
+class LogEvent(NamedTuple):
+    """
+    A master write read from a tuning log.
+
+    `name` is the module function making the write. `value` is a frequency,
+    the full (128,) tuning table, a bool for filters and `set_multi_channel`,
+    the scale name, period ratio or mapping value, or None for clearing
+    filters. `midichannel` is -1 for the global table and for filters on
+    every channel.
+    """
+
+    time: float
+    name: str
+    midichannel: int
+    midinote: int
+    value: object
+
+
+def read_log(path):
+    """
+    Iterate over the master writes in a tuning log as `LogEvent` tuples.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:8] != _MAGIC:
+        raise ValueError("not a tuning log")
+    (version,) = struct.unpack_from("=I", data, 8)
+    if version != _VERSION:
+        raise ValueError(f"unsupported tuning log version {version}")
+    tables = np.zeros((17, 128))
+    offset = 16
+    while offset + _RECORD.size <= len(data):
+        time_ns, op, channel, note, flag, size = _RECORD.unpack_from(data, offset)
+        payload = data[offset + _RECORD.size : offset + _RECORD.size + size]
+        offset += _RECORD.size + (size + 7) // 8 * 8
+        if offset > len(data):
+            break
+        name = _OPS.get(op)
+        if name is None:
+            raise ValueError(f"unknown tuning log operation {op}")
+        if name == "set_note_tuning":
+            (value,) = struct.unpack("=d", payload)
+            tables[channel + 1, note] = value
+        elif name == "set_note_tunings":
+            mask = np.unpackbits(
+                np.frombuffer(payload[:16], dtype=np.uint8), bitorder="little"
+            ).astype(bool)
+            tables[channel + 1, mask] = np.frombuffer(payload[16:], dtype=np.float64)
+            value = tables[channel + 1].copy()
+        elif name in ("filter_note", "filter_note_multi_channel", "set_multi_channel"):
+            value = bool(flag)
+        elif name == "set_scale_name":
+            value = payload.decode()
+        elif name == "set_period_ratio":
+            (value,) = struct.unpack("=d", payload)
+        elif name in ("set_map_size", "set_map_start_key", "set_ref_key"):
+            value, channel = channel, -1
+        else:
+            value = None
+        if name in ("set_note_tuning", "set_note_tunings") and channel >= 0:
+            name = name.replace("set_note", "set_multi_channel_note")
+        yield LogEvent(time_ns * 1e-9, name, channel, note, value)
@@ -0,0 +1,259 @@
+"""
+Rendering the notes in MIDI files to frequencies with MTS-ESP tunings
+"""
+
+import heapq
+import mmap
+import os
+import struct
+
+import numpy as np
+
+from ._mtsespy import (
+    MTSClient,
+    TuningSnapshot,
+    decode_mts_sysex,
+    note_to_frequency_array,
+    parse_midi_data,
+)
+
+NOTE_DTYPE = np.dtype(
+    [
+        ("time", np.float64),
+        ("frequency", np.float64),
+        ("velocity", np.uint8),
+        ("duration", np.float64),
+        ("channel", np.uint8),
+        ("note", np.uint8),
+    ]
+)
+
+# Data bytes following each channel message status
+_DATA_LENGTHS = {0x80: 2, 0x90: 2, 0xA0: 2, 0xB0: 2, 0xC0: 1, 0xD0: 1, 0xE0: 2}
+
+
+def _read_varlen(data, offset):
+    value = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value = (value << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            return value, offset
+
+
+def _track_events(data, start, end, track):
+    """
+    Yield (tick, track, index, message) for the events of one track, with
+    tempo changes as (tick, track, index, microseconds per quarter note).
+    """
+    offset = start
+    tick = 0
+    status = None
+    sysex = None
+    index = 0
+    while offset < end:
+        delta, offset = _read_varlen(data, offset)
+        tick += delta
+        byte = data[offset]
+        if byte == 0xFF:
+            kind = data[offset + 1]
+            length, offset = _read_varlen(data, offset + 2)
+            if kind == 0x51 and length == 3:
+                yield tick, track, index, int.from_bytes(data[offset : offset + 3], "big")
+            elif kind == 0x2F:
+                return
+            offset += length
+            # Meta and SysEx events cancel running status
+            status = None
+        elif byte in (0xF0, 0xF7):
+            length, offset = _read_varlen(data, offset + 1)
+            packet = bytes(data[offset : offset + length])
+            offset += length
+            # A SysEx message may be split into an F0 packet followed by F7
+            # continuation packets, and F7 packets may also escape other data
+            if byte == 0xF0:
+                sysex = b"\xf0" + packet
+            elif sysex is not None:
+                sysex += packet
+            if sysex is not None and sysex.endswith(b"\xf7"):
+                yield tick, track, index, sysex
+                sysex = None
+            status = None
+        else:
+            if byte & 0x80:
+                status = byte
+                offset += 1
+            elif status is None:
+                raise ValueError("MIDI data byte without status")
+            length = _DATA_LENGTHS[status & 0xF0]
+            yield tick, track, index, bytes([status]) + bytes(
+                data[offset : offset + length]
+            )
+            offset += length
+        index += 1
+
+
+def _midi_file_events(data):
+    if data[:4] != b"MThd":
+        raise ValueError("not a standard MIDI file")
+    (length,) = struct.unpack_from(">I", data, 4)
+    _, n_tracks, division = struct.unpack_from(">HHH", data, 8)
+    offset = 8 + length
+    tracks = []
+    for track in range(n_tracks):
+        if data[offset : offset + 4] != b"MTrk":
+            raise ValueError("missing MIDI track")
+        (length,) = struct.unpack_from(">I", data, offset + 4)
+        tracks.append(_track_events(data, offset + 8, offset + 8 + length, track))
+        offset += 8 + length
+    if division & 0x8000:
+        frames_per_second = 256 - (division >> 8)
+        seconds_per_tick = 1.0 / (frames_per_second * (division & 0xFF))
+        tempo_scale = None
+    else:
+        tempo_scale = 1e-6 / division
+        seconds_per_tick = 500000 * tempo_scale
+    last_tick = 0
+    time = 0.0
+    # Tracks are merged in tick order, keeping the order of events within
+    # each track, so tempo changes apply to every track
+    events = tracks[0] if len(tracks) == 1 else heapq.merge(*tracks)
+    for tick, _, _, message in events:
+        time += (tick - last_tick) * seconds_per_tick
+        last_tick = tick
+        if isinstance(message, int):
+            if tempo_scale is not None:
+                seconds_per_tick = message * tempo_scale
+        else:
+            yield time, message
+
+
+def read_midi_file(path):
+    """
+    Iterate over the messages in a standard MIDI file.
+
+    The file is memory-mapped and its tracks are merged as they are read, so
+    memory use does not grow with the length of the file. Tempo changes are
+    applied and meta events are dropped.
+
+    Parameters
+    ----------
+    path : str, os.PathLike or bytes-like
+        Path to the file, or its contents.
+
+    Yields
+    ------
+    tuple of (float, bytes)
+        Time in seconds and a complete MIDI message, with SysEx messages
+        starting F0 and ending F7.
+    """
+    if isinstance(path, (bytes, bytearray, memoryview)):
+        yield from _midi_file_events(memoryview(path))
+        return
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError("not a standard MIDI file")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield from _midi_file_events(data)
+
+
+class _Tuning:
+    """
+    Frequencies of all notes on all channels, following MTS SysEx.
+    """
+
+    def __init__(self, source):
+        self.client = None
+        if isinstance(source, MTSClient):
+            self.client = source
+            self.frequencies = note_to_frequency_array(source)
+        elif isinstance(source, TuningSnapshot):
+            self.frequencies = source.frequencies.copy()
+        else:
+            frequencies = np.asarray(source, dtype=np.float64)
+            if frequencies.shape not in ((128,), (16, 128)):
+                raise ValueError("tuning must have shape (128,) or (16, 128)")
+            self.frequencies = np.broadcast_to(frequencies, (16, 128)).copy()
+
+    def parse(self, message):
+        if len(message) < 5 or message[1] not in (0x7E, 0x7F) or message[3] != 0x08:
+            return
+        if self.client is not None:
+            parse_midi_data(self.client, message)
+            note_to_frequency_array(self.client, out=self.frequencies)
+        else:
+            # Scale/octave tunings address channels, other messages all of them
+            for channel in range(16):
+                decoded = decode_mts_sysex(
+                    message, frequencies=self.frequencies[channel], midichannel=channel
+                )
+                if len(decoded):
+                    self.frequencies[channel] = decoded[-1]
+
+
+def render_notes(events, tuning, chunk_size=4096):
+    """
+    Render the notes in a MIDI stream to frequencies, in chunks.
+
+    Each note's frequency is that of its midi note and channel in the tuning
+    when it starts. MTS SysEx messages in the stream retune the following
+    notes: a client parses them as with `parse_midi_data`, while for a
+    snapshot or array they are decoded as with `decode_mts_sysex` for each
+    channel. Notes are emitted when they end, with notes still held
+    at the end of the stream ending at the last event.
+
+    Parameters
+    ----------
+    events : str, os.PathLike, bytes-like or iterable
+        Path to a standard MIDI file or its contents, or an iterable of
+        (time in seconds, MIDI message bytes) as from `read_midi_file`.
+    tuning : MTSClient, TuningSnapshot or array_like
+        Source of the tuning: a client, a snapshot, or frequencies of shape
+        (128,) for all channels or (16, 128).
+    chunk_size : int, optional
+        Number of notes in each chunk, except the last. Defaults to 4096.
+
+    Yields
+    ------
+    numpy.ndarray
+        Structured array of `NOTE_DTYPE` with fields time, frequency,
+        velocity, duration, channel and note.
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be positive")
+    if isinstance(events, (str, os.PathLike, bytes, bytearray, memoryview)):
+        events = read_midi_file(events)
+    tuning = _Tuning(tuning)
+    chunk = []
+    # (channel, note) -> (start time, velocity, frequency)
+    active = {}
+    time = 0.0
+
+    def end(key, time):
+        start, velocity, frequency = active.pop(key)
+        chunk.append((start, frequency, velocity, time - start, key[0], key[1]))
+        if len(chunk) == chunk_size:
+            full = np.array(chunk, dtype=NOTE_DTYPE)
+            chunk.clear()
+            return full
+        return None
+
+    for time, message in events:
+        status = message[0]
+        kind = status & 0xF0
+        if kind == 0x90 or kind == 0x80:
+            key = (status & 0x0F, message[1])
+            full = end(key, time) if key in active else None
+            if kind == 0x90 and message[2]:
+                active[key] = (time, message[2], float(tuning.frequencies[key]))
+            if full is not None:
+                yield full
+        elif status == 0xF0:
+            tuning.parse(message)
+    for key in list(active):
+        full = end(key, time)
+        if full is not None:
+            yield full
+    if chunk:
+        yield np.array(chunk, dtype=NOTE_DTYPE)
@@ -0,0 +1,55 @@
+"""
+Loading tunings from Scala scale (.scl) and keyboard mapping (.kbm) files
+"""
+
+import os
+from functools import lru_cache
+
+from ._mtsespy import _scala_files_to_frequencies
+
+
+def scala_files_to_frequencies(scl_file, kbm_file=None):
+    """
+    Frequencies of all 128 midi notes for a Scala scale and keyboard mapping.
+
+    Parsed tunings are cached, keyed on the absolute file paths and their
+    modification times, so loading unchanged files again costs a stat of each
+    file rather than a parse. Editing a file on disk invalidates its entry.
+
+    Parameters
+    ----------
+    scl_file : str or os.PathLike
+        Path to a Scala scale file.
+    kbm_file : str or os.PathLike, optional
+        Path to a Scala keyboard mapping file. The default mapping puts the
+        first scale degree on midi note 60 at 261.6256 Hz.
+
+    Returns
+    -------
+    numpy.ndarray
+        Read-only float64 array of shape (128,), shared between callers.
+
+    Raises
+    ------
+    FileNotFoundError
+        If either file does not exist.
+    ValueError
+        If either file cannot be parsed.
+    """
+    scl_file = os.path.abspath(scl_file)
+    scl_mtime = os.stat(scl_file).st_mtime_ns
+    if kbm_file is None:
+        return _load(scl_file, scl_mtime, None, None)
+    kbm_file = os.path.abspath(kbm_file)
+    return _load(scl_file, scl_mtime, kbm_file, os.stat(kbm_file).st_mtime_ns)
+
+
+@lru_cache(maxsize=256)
+def _load(scl_file, scl_mtime, kbm_file, kbm_mtime):
+    frequencies = _scala_files_to_frequencies(scl_file, kbm_file)
+    frequencies.flags.writeable = False
+    return frequencies
+
+
+scala_files_to_frequencies.cache_info = _load.cache_info
+scala_files_to_frequencies.cache_clear = _load.cache_clear
@@ -0,0 +1,487 @@
+"""
+Serving the master from a subprocess to producers in other threads and processes
+"""
+
+import os
+import signal
+import threading
+from multiprocessing import AuthenticationError, Pipe, get_context
+from multiprocessing.connection import Client as _connect
+from multiprocessing.connection import Listener, wait
+from time import monotonic, sleep
+
+import numpy as np
+
+import mtsespy as mts
+from ._mtsespy import _MasterBatch
+
+# Commands buffered in a MasterBatch each tick, so only notes whose tuning or
+# filter changed are written
+_BATCHED = {
+    "set_note_tuning",
+    "set_note_tunings",
+    "set_multi_channel_note_tuning",
+    "set_multi_channel_note_tunings",
+    "filter_note",
+    "clear_note_filter",
+    "filter_note_multi_channel",
+    "clear_note_filter_multi_channel",
+}
+
+# Commands setting a value, given as their first argument, for the setting
+# named by the command and any other arguments. Only the last value set for
+# each setting in a tick is written, and only if it changed.
+_SETTINGS = {
+    "set_multi_channel",
+    "set_scale_name",
+    "set_period_ratio",
+    "set_map_size",
+    "set_map_start_key",
+    "set_ref_key",
+}
+
+_COMMANDS = _BATCHED | _SETTINGS | {"set_all_multi_channel_note_tunings"}
+
+
+class _Server:
+    """
+    Control loop of the server process, applying the commands received from
+    all producers once per tick.
+    """
+
+    def __init__(self, listener, owner, rate):
+        self._listener = listener
+        self._owner = owner
+        self._period = 1.0 / rate
+        self._lock = threading.Lock()
+        self._accepted = []
+        self._wakeup, self._notify = Pipe(duplex=False)
+        self._connections = [owner]
+        self._pending = []
+        self._syncs = []
+        self._running = True
+        self._closing = False
+        self._settings = {}
+        self._start = monotonic()
+        self._ticks = 0
+        self._missed = 0
+        self._commands = 0
+        self._writes = 0
+        self._errors = 0
+        self._queue_depth = 0
+        self._max_queue_depth = 0
+
+    def run(self):
+        threading.Thread(target=self._accept, daemon=True).start()
+        deadline = monotonic() + self._period
+        while self._running:
+            timeout = deadline - monotonic()
+            if timeout > 0:
+                for connection in wait([self._wakeup, *self._connections], timeout):
+                    if connection is self._wakeup:
+                        self._add_connections()
+                    else:
+                        self._receive(connection)
+                continue
+            self._tick()
+            deadline += self._period
+            now = monotonic()
+            if deadline < now:
+                self._missed += 1
+                deadline = now + self._period
+        self._tick()
+        if self._closing:
+            self._reply(self._owner, None)
+
+    def _accept(self):
+        while True:
+            try:
+                connection = self._listener.accept()
+            except AuthenticationError:
+                continue
+            except OSError:
+                return
+            with self._lock:
+                self._accepted.append(connection)
+            self._notify.send_bytes(b"")
+
+    def _add_connections(self):
+        self._wakeup.recv_bytes()
+        with self._lock:
+            self._connections.extend(self._accepted)
+            self._accepted.clear()
+
+    def _receive(self, connection):
+        # Producers send lists of commands, and requests answered by a reply
+        try:
+            while True:
+                name, value = connection.recv()
+                if name == "commands":
+                    self._pending.extend(value)
+                    self._commands += len(value)
+                elif name == "sync":
+                    self._syncs.append(connection)
+                elif name == "stats":
+                    self._reply(connection, self.stats())
+                elif name == "get_num_clients":
+                    self._reply(connection, mts.get_num_clients())
+                elif name == "close" and connection is self._owner:
+                    self._running = False
+                    self._closing = True
+                    return
+                if not connection.poll():
+                    return
+        except (EOFError, OSError):
+            self._connections.remove(connection)
+            connection.close()
+            if connection is self._owner:
+                self._running = False
+
+    @staticmethod
+    def _reply(connection, value):
+        try:
+            connection.send(value)
+        except OSError:
+            pass
+
+    def _tick(self):
+        commands = self._pending
+        self._pending = []
+        self._queue_depth = len(commands)
+        self._max_queue_depth = max(self._max_queue_depth, len(commands))
+        if commands:
+            self._apply(commands)
+        self._ticks += 1
+        for connection in self._syncs:
+            self._reply(connection, None)
+        self._syncs.clear()
+
+    def _apply(self, commands):
+        batch = _MasterBatch()
+        settings = {}
+        for name, args in commands:
+            try:
+                if name not in _COMMANDS:
+                    raise ValueError(f"unknown command {name!r}")
+                if name in _SETTINGS:
+                    settings[(name, *args[1:])] = args
+                elif name == "set_all_multi_channel_note_tunings":
+                    (frequencies,) = args
+                    frequencies = np.asarray(frequencies, dtype=np.float64)
+                    if frequencies.shape != (16, 128):
+                        raise ValueError("frequencies must have shape (16, 128)")
+                    for midichannel in range(16):
+                        batch.set_multi_channel_note_tunings(
+                            frequencies[midichannel], midichannel
+                        )
+                else:
+                    getattr(batch, name)(*args)
+            except (TypeError, ValueError):
+                self._errors += 1
+        self._writes += batch.commit()
+        for key, args in settings.items():
+            if self._settings.get(key) == args:
+                continue
+            try:
+                getattr(mts, key[0])(*args)
+            except (TypeError, ValueError):
+                self._errors += 1
+                continue
+            self._settings[key] = args
+            self._writes += 1
+
+    def stats(self):
+        elapsed = monotonic() - self._start
+        return {
+            "ticks": self._ticks,
+            "rate": self._ticks / elapsed,
+            "missed": self._missed,
+            "commands": self._commands,
+            "commands_per_second": self._commands / elapsed,
+            "writes": self._writes,
+            "errors": self._errors,
+            "queue_depth": self._queue_depth,
+            "max_queue_depth": self._max_queue_depth,
+            "producers": len(self._connections) - 1,
+        }
+
+
+def _serve(owner, authkey, rate):
+    """
+    Entry point of the server process.
+    """
+    try:
+        listener = Listener(authkey=authkey)
+    except Exception as e:
+        owner.send(e)
+        return
+    with listener:
+        try:
+            master = mts.Master()
+        except Exception as e:
+            owner.send(e)
+            return
+        with master:
+            # The owner stops the server, so interrupts go to it alone
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            owner.send(listener.address)
+            _Server(listener, owner, rate).run()
+
+
+class MasterProxy:
+    """
+    Producer sending master writes to a `MasterServer`.
+
+    Has the methods `set_note_tuning`, `set_note_tunings`,
+    `set_multi_channel_note_tuning`, `set_multi_channel_note_tunings`,
+    `set_all_multi_channel_note_tunings`, `filter_note`,
+    `clear_note_filter`, `filter_note_multi_channel`,
+    `clear_note_filter_multi_channel`, `set_multi_channel`,
+    `set_scale_name`, `set_period_ratio`, `set_map_size`,
+    `set_map_start_key` and `set_ref_key`, taking the same arguments as the
+    module functions. Each queues a command and returns without waiting for
+    it to be applied. Queued commands are sent together by a background
+    thread `latency` seconds after the first of them, or by `flush`, `sync`,
+    `stats` and `close`, so sending costs one message per batch rather than
+    per command. Commands with invalid arguments are dropped by the server
+    and counted in its `errors`. A proxy can be shared between threads, and
+    passed to other processes, where it connects again.
+
+    Parameters
+    ----------
+    address : str or tuple
+        Address of the server, as `MasterServer.address`.
+    authkey : bytes
+        Authentication key of the server, as `MasterServer.authkey`.
+    latency : float, optional
+        Longest time in seconds a command is queued before being sent.
+        Defaults to 0.001.
+    """
+
+    def __init__(self, address, authkey, latency=0.001):
+        self.address = address
+        self.authkey = authkey
+        self._start(_connect(address, authkey=authkey), latency)
+
+    def _start(self, connection, latency):
+        if latency < 0:
+            raise ValueError("latency must not be negative")
+        self.latency = latency
+        self._connection = connection
+        # The connection lock is taken before the queue lock, and held while
+        # sending so batches are sent in the order they were queued
+        self._lock = threading.Lock()
+        self._queued = threading.Condition(threading.Lock())
+        self._queue = []
+        self._closed = False
+        threading.Thread(target=self._send_queued, daemon=True).start()
+
+    def __reduce__(self):
+        return MasterProxy, (self.address, self.authkey, self.latency)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _queue_command(self, name, args):
+        with self._queued:
+            if self._closed:
+                raise ValueError("proxy is closed")
+            self._queue.append((name, args))
+            if len(self._queue) == 1:
+                self._queued.notify()
+
+    def _send_queued(self):
+        while True:
+            with self._queued:
+                self._queued.wait_for(lambda: self._queue or self._closed)
+                if self._closed:
+                    return
+            sleep(self.latency)
+            try:
+                self.flush()
+            except OSError:
+                return
+
+    def _flush(self):
+        # Called with the connection lock held
+        with self._queued:
+            commands = self._queue
+            self._queue = []
+        if commands:
+            self._connection.send(("commands", commands))
+
+    def _request(self, name):
+        with self._lock:
+            self._flush()
+            self._connection.send((name, None))
+            return self._connection.recv()
+
+    def flush(self):
+        """
+        Send the queued commands now.
+        """
+        with self._lock:
+            self._flush()
+
+    def sync(self):
+        """
+        Send the queued commands and wait until the server has applied them.
+        """
+        self._request("sync")
+
+    def stats(self):
+        """
+        Metrics of the server.
+
+        Returns
+        -------
+        dict
+            The number of ticks, the achieved tick rate in Hz, the number of
+            missed ticks, the number of commands received and received per
+            second, the number of writes made to MTS-ESP, the number of
+            invalid commands dropped, the number of commands applied in the
+            last tick and the most in any tick, and the number of producers
+            connected.
+        """
+        return self._request("stats")
+
+    def get_num_clients(self):
+        """
+        Get number of connected clients.
+        """
+        return self._request("get_num_clients")
+
+    def close(self):
+        """
+        Send the queued commands and disconnect from the server.
+        """
+        with self._lock:
+            if self._connection.closed:
+                return
+            try:
+                self._flush()
+            finally:
+                with self._queued:
+                    self._closed = True
+                    self._queued.notify()
+                self._connection.close()
+
+
+def _command(name):
+    def command(self, *args):
+        self._queue_command(name, args)
+
+    command.__name__ = command.__qualname__ = name
+    command.__doc__ = f"Queue `{name}` to send to the server."
+    return command
+
+
+for _name in sorted(_COMMANDS):
+    setattr(MasterProxy, _name, _command(_name))
+
+
+class MasterServer(MasterProxy):
+    """
+    Context manager running the master in a subprocess, serving producers.
+
+    The subprocess registers the master and listens on a local socket, or a
+    named pipe on Windows, for producers connected with `connect`, from any
+    thread or process. Commands from all producers are applied once per
+    control tick: tuning and filter writes through a `MasterBatch`, so only
+    notes which changed are written, and of the other settings only the last
+    value set in the tick, if it changed. The server has the same methods as
+    `MasterProxy`, and `stats` reports its throughput and queue depth.
+    Passed to another process, the server arrives there as a `MasterProxy`.
+
+    As with `Master`, `MasterExistsError` is raised if a master already
+    exists. Leaving the context applies any commands still queued, then
+    deregisters the master and stops the subprocess.
+
+    Parameters
+    ----------
+    rate : float, optional
+        Control rate in Hz. Defaults to 1000.
+    latency : float, optional
+        Longest time in seconds commands made through the server itself, and
+        by default through its producers, are queued before being sent.
+        Defaults to 0.001.
+    timeout : float, optional
+        Seconds to wait for the server to start. Defaults to 30.
+
+    Examples
+    --------
+    >>> with mts.MasterServer() as server:
+    ...     producer = server.connect()
+    ...     producer.set_note_tuning(441.0, 69)
+    ...     producer.sync()
+    ...     server.stats()["writes"]
+    1
+    """
+
+    def __init__(self, rate=1000.0, latency=0.001, timeout=30.0):
+        if not 0 < rate <= 100000:
+            raise ValueError("rate must be in range (0, 100000]")
+        if latency < 0:
+            raise ValueError("latency must not be negative")
+        context = get_context("spawn")
+        self.authkey = os.urandom(32)
+        connection, child = context.Pipe()
+        self._process = context.Process(
+            target=_serve,
+            args=(child, self.authkey, rate),
+            name="mtsespy master server",
+            daemon=True,
+        )
+        self._process.start()
+        child.close()
+        try:
+            if not connection.poll(timeout):
+                raise TimeoutError("master server did not start")
+            try:
+                reply = connection.recv()
+            except EOFError:
+                raise RuntimeError("master server exited while starting") from None
+        except BaseException:
+            self._process.kill()
+            self._process.join()
+            connection.close()
+            raise
+        if isinstance(reply, BaseException):
+            self._process.join()
+            connection.close()
+            raise reply
+        self.address = reply
+        self._start(connection, latency)
+
+    def connect(self, latency=None):
+        """
+        Connect a new producer to the server.
+
+        Parameters
+        ----------
+        latency : float, optional
+            Latency of the producer, by default that of the server.
+
+        Returns
+        -------
+        MasterProxy
+        """
+        return MasterProxy(
+            self.address, self.authkey, self.latency if latency is None else latency
+        )
+
+    def close(self):
+        """
+        Apply the queued commands, deregister the master and stop the server.
+        """
+        if self._connection.closed:
+            return
+        try:
+            self._request("close")
+        except (EOFError, OSError):
+            pass
+        super().close()
+        self._process.join()
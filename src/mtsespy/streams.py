@@ -0,0 +1,75 @@
+"""
+Streaming MIDI input for MTS-ESP clients
+"""
+
+from ._mtsespy import _SysExStream
+
+
+class SysExStream(_SysExStream):
+    """
+    Pass the MTS SysEx messages in a MIDI byte stream to a client.
+
+    The stream can be fed chunks of any size, as read from a midi port or
+    file. SysEx messages split across chunks are reassembled, other midi
+    messages are skipped and each complete MTS message is parsed by the client
+    as if passed to `parse_midi_data`. Scanning is done in C++ with the GIL
+    released.
+
+    Given a `source`, the stream can be iterated over, with ``for`` for an
+    iterable of chunks or ``async for`` for an async iterable, feeding each
+    chunk as it is read and yielding the number of MTS messages it completed.
+
+    Parameters
+    ----------
+    client : MTSClient
+        Client to retune, as returned by `register_client` or `Client`.
+    source : iterable or async iterable of bytes-like, optional
+        Chunks of midi bytes to feed when iterating over the stream.
+
+    Examples
+    --------
+    >>> async for count in mts.SysExStream(c, port_chunks()):
+    ...     if count:
+    ...         redraw(c)
+    """
+
+    def __init__(self, client, source=None):
+        super().__init__(client)
+        self.source = source
+
+    def __iter__(self):
+        if self.source is None:
+            raise TypeError("SysExStream has no source to iterate over")
+        for chunk in self.source:
+            yield self.feed(chunk)
+
+    async def __aiter__(self):
+        if self.source is None:
+            raise TypeError("SysExStream has no source to iterate over")
+        async for chunk in self.source:
+            yield self.feed(chunk)
+
+    def feed_all(self, chunks):
+        """
+        Feed every chunk from an iterable of bytes-like objects.
+
+        Returns
+        -------
+        int
+            Number of MTS messages parsed.
+        """
+        return sum(self.feed(chunk) for chunk in chunks)
+
+    async def afeed_all(self, chunks):
+        """
+        Feed every chunk from an async iterable of bytes-like objects.
+
+        Returns
+        -------
+        int
+            Number of MTS messages parsed.
+        """
+        count = 0
+        async for chunk in chunks:
+            count += self.feed(chunk)
+        return count
@@ -0,0 +1,298 @@
+#include "sysex.h"
+
+#include <algorithm>
+#include <cmath>
+
+size_t MTSSysExFramer::feed(const unsigned char *data, size_t len, const Callback &on_message)
+{
+    size_t count = 0;
+    for (size_t i = 0; i < len; i++)
+    {
+        unsigned char b = data[i];
+        if (b >= 0xF8)
+        {
+            // Real-time messages can be interleaved with anything
+            continue;
+        }
+        if (b == 0xF0)
+        {
+            message_.assign(1, b);
+            state_ = State::Collecting;
+            continue;
+        }
+        if (b == 0xF7)
+        {
+            if (state_ == State::Collecting && message_.size() >= 5)
+            {
+                message_.push_back(b);
+                on_message(message_.data(), message_.size());
+                count++;
+            }
+            state_ = State::Idle;
+            continue;
+        }
+        if (b & 0x80)
+        {
+            // Any other status byte ends a SysEx message early
+            state_ = State::Idle;
+            continue;
+        }
+        if (state_ != State::Collecting)
+        {
+            continue;
+        }
+        message_.push_back(b);
+        // MTS messages start F0 7E/7F <device id> 08
+        size_t n = message_.size();
+        if ((n == 2 && b != 0x7E && b != 0x7F) || (n == 4 && b != 0x08) || n >= max_message_length)
+        {
+            state_ = State::Skipping;
+        }
+    }
+    return count;
+}
+
+void MTSSysExFramer::reset()
+{
+    state_ = State::Idle;
+    message_.clear();
+}
+
+namespace
+{
+
+const double fraction_scale = 16383.0;
+
+void frequency_bytes(double frequency, std::vector<unsigned char> &out)
+{
+    if (std::isnan(frequency))
+    {
+        out.insert(out.end(), {0x7F, 0x7F, 0x7F});
+        return;
+    }
+    double semitones = 69.0 + 12.0 * std::log2(frequency / 440.0);
+    int note = 0;
+    int fraction = 0;
+    if (semitones >= 127.0)
+    {
+        note = 127;
+        // 7F 7F 7F is reserved for "no change"
+        fraction = std::min(static_cast<int>(std::lround((semitones - 127.0) * fraction_scale)), 16382);
+    }
+    else if (semitones > 0.0)
+    {
+        note = static_cast<int>(semitones);
+        fraction = static_cast<int>(std::lround((semitones - note) * fraction_scale));
+    }
+    out.insert(out.end(), {static_cast<unsigned char>(note), static_cast<unsigned char>(fraction >> 7),
+                           static_cast<unsigned char>(fraction & 0x7F)});
+}
+
+double frequency_from_bytes(const unsigned char *b)
+{
+    if (b[0] == 0x7F && b[1] == 0x7F && b[2] == 0x7F)
+    {
+        return std::nan("");
+    }
+    double semitones = b[0] + ((b[1] << 7) | b[2]) / fraction_scale;
+    return 440.0 * std::pow(2.0, (semitones - 69.0) / 12.0);
+}
+
+// XOR of everything after F0, masked to 7 bits
+unsigned char checksum(const std::vector<unsigned char> &out, size_t start)
+{
+    unsigned char sum = 0;
+    for (size_t i = start + 1; i < out.size(); i++)
+    {
+        sum ^= out[i];
+    }
+    return sum & 0x7F;
+}
+
+void apply_scale_octave(const double *semitones, double *frequencies)
+{
+    for (int i = 0; i < 128; i++)
+    {
+        frequencies[i] = 440.0 * std::pow(2.0, (i + semitones[i % 12] - 69.0) / 12.0);
+    }
+}
+
+} // namespace
+
+void sysex_bulk_tuning_dump(const double *frequencies, int device_id, int bank, int program,
+                            const std::string &name, std::vector<unsigned char> &out)
+{
+    size_t start = out.size();
+    out.insert(out.end(), {0xF0, 0x7E, static_cast<unsigned char>(device_id), 0x08});
+    if (bank < 0)
+    {
+        out.push_back(0x01);
+    }
+    else
+    {
+        out.insert(out.end(), {0x04, static_cast<unsigned char>(bank)});
+    }
+    out.push_back(static_cast<unsigned char>(program));
+    for (size_t i = 0; i < 16; i++)
+    {
+        out.push_back(i < name.size() ? name[i] & 0x7F : ' ');
+    }
+    for (int i = 0; i < 128; i++)
+    {
+        frequency_bytes(frequencies[i], out);
+    }
+    out.push_back(checksum(out, start));
+    out.push_back(0xF7);
+}
+
+void sysex_single_note_tuning(const int *notes, const double *frequencies, size_t n, int device_id,
+                              bool realtime, int bank, int program, std::vector<unsigned char> &out)
+{
+    if (!realtime && bank < 0)
+    {
+        bank = 0;
+    }
+    for (size_t i = 0; i < n; i += 127)
+    {
+        size_t count = std::min(n - i, static_cast<size_t>(127));
+        out.insert(out.end(), {0xF0, static_cast<unsigned char>(realtime ? 0x7F : 0x7E),
+                               static_cast<unsigned char>(device_id), 0x08});
+        if (bank < 0)
+        {
+            out.push_back(0x02);
+        }
+        else
+        {
+            out.insert(out.end(), {0x07, static_cast<unsigned char>(bank)});
+        }
+        out.insert(out.end(), {static_cast<unsigned char>(program), static_cast<unsigned char>(count)});
+        for (size_t j = i; j < i + count; j++)
+        {
+            out.push_back(static_cast<unsigned char>(notes[j]));
+            frequency_bytes(frequencies[j], out);
+        }
+        out.push_back(0xF7);
+    }
+}
+
+void sysex_scale_octave_tuning(const double *cents, uint16_t channel_mask, bool two_byte, int device_id,
+                               bool realtime, std::vector<unsigned char> &out)
+{
+    out.insert(out.end(), {0xF0, static_cast<unsigned char>(realtime ? 0x7F : 0x7E),
+                           static_cast<unsigned char>(device_id), 0x08,
+                           static_cast<unsigned char>(two_byte ? 0x09 : 0x08),
+                           static_cast<unsigned char>((channel_mask >> 14) & 0x03),
+                           static_cast<unsigned char>((channel_mask >> 7) & 0x7F),
+                           static_cast<unsigned char>(channel_mask & 0x7F)});
+    for (int i = 0; i < 12; i++)
+    {
+        if (two_byte)
+        {
+            // libMTS scales positive offsets by 8191 and negative by 8192
+            double scale = cents[i] > 0.0 ? 8191.0 : 8192.0;
+            long value = std::clamp(8192L + std::lround(cents[i] / 100.0 * scale), 0L, 16383L);
+            out.insert(out.end(), {static_cast<unsigned char>(value >> 7), static_cast<unsigned char>(value & 0x7F)});
+        }
+        else
+        {
+            out.push_back(static_cast<unsigned char>(std::clamp(64L + std::lround(cents[i]), 0L, 127L)));
+        }
+    }
+    out.push_back(0xF7);
+}
+
+bool sysex_decode_tuning(const unsigned char *message, size_t len, double *frequencies, int midichannel)
+{
+    if (len < 6 || message[0] != 0xF0 || (message[1] != 0x7E && message[1] != 0x7F) || message[3] != 0x08 ||
+        message[len - 1] != 0xF7)
+    {
+        return false;
+    }
+    for (size_t i = 1; i < len - 1; i++)
+    {
+        if (message[i] & 0x80)
+        {
+            return false;
+        }
+    }
+    const unsigned char *data = message + 5;
+    size_t data_len = len - 6;
+    switch (message[4])
+    {
+    case 0x01: // Bulk tuning dump: program, name, tunings, checksum
+    case 0x04: // Bulk tuning dump with bank
+    {
+        size_t header = message[4] == 0x01 ? 17 : 18;
+        if (data_len != header + 3 * 128 + 1)
+        {
+            return false;
+        }
+        for (int i = 0; i < 128; i++)
+        {
+            double f = frequency_from_bytes(data + header + 3 * i);
+            if (!std::isnan(f))
+            {
+                frequencies[i] = f;
+            }
+        }
+        return true;
+    }
+    case 0x02: // Single note tuning change: program, count, (note, tuning) * count
+    case 0x07: // Single note tuning change with bank
+    {
+        size_t header = message[4] == 0x02 ? 2 : 3;
+        if (data_len < header || data_len != header + 4 * data[header - 1])
+        {
+            return false;
+        }
+        for (size_t i = 0; i < data[header - 1]; i++)
+        {
+            const unsigned char *change = data + header + 4 * i;
+            double f = frequency_from_bytes(change + 1);
+            if (!std::isnan(f))
+            {
+                frequencies[change[0]] = f;
+            }
+        }
+        return true;
+    }
+    case 0x05: // Scale/octave tuning dump, 1 byte form: bank, program, name, offsets, checksum
+    case 0x06: // Scale/octave tuning dump, 2 byte form
+    case 0x08: // Scale/octave tuning, 1 byte form: channels, offsets
+    case 0x09: // Scale/octave tuning, 2 byte form
+    {
+        bool two_byte = message[4] == 0x06 || message[4] == 0x09;
+        bool dump = message[4] == 0x05 || message[4] == 0x06;
+        size_t header = dump ? 18 : 3;
+        if (data_len != header + (two_byte ? 24 : 12) + (dump ? 1 : 0))
+        {
+            return false;
+        }
+        if (!dump)
+        {
+            uint16_t channel_mask = (data[0] << 14) | (data[1] << 7) | data[2];
+            if (!(channel_mask & (1 << midichannel)))
+            {
+                return false;
+            }
+        }
+        double semitones[12];
+        for (int i = 0; i < 12; i++)
+        {
+            if (two_byte)
+            {
+                int value = (data[header + 2 * i] << 7) | data[header + 2 * i + 1];
+                semitones[i] = (value - 8192.0) / (value > 8192 ? 8191.0 : 8192.0);
+            }
+            else
+            {
+                semitones[i] = (data[header + i] - 64.0) * 0.01;
+            }
+        }
+        apply_scale_octave(semitones, frequencies);
+        return true;
+    }
+    default:
+        return false;
+    }
+}
@@ -0,0 +1,74 @@
+#pragma once
+
+#include <cstddef>
+#include <cstdint>
+#include <functional>
+#include <string>
+#include <vector>
+
+// Splits a MIDI byte stream into complete MTS SysEx messages.
+//
+// The stream can be fed in chunks of any size, so messages split across
+// chunks are reassembled. Channel and system common messages between SysEx
+// messages are skipped, as are real-time messages, which may appear anywhere.
+// SysEx messages which are not MTS messages are dropped as soon as their
+// header has been seen, so are never buffered.
+class MTSSysExFramer
+{
+  public:
+    using Callback = std::function<void(const unsigned char *message, size_t len)>;
+
+    // Longest MTS message is a single note tuning change with bank of 127
+    // notes, 8 + 127 * 4 + 1 = 517 bytes
+    static constexpr size_t max_message_length = 1024;
+
+    // Feed bytes to the framer, calling on_message with each complete MTS
+    // message (from F0 to F7 inclusive). Returns the number of messages.
+    size_t feed(const unsigned char *data, size_t len, const Callback &on_message);
+
+    // Drop any partially received message
+    void reset();
+
+  private:
+    enum class State
+    {
+        Idle,
+        Collecting,
+        Skipping,
+    };
+
+    State state_ = State::Idle;
+    std::vector<unsigned char> message_;
+};
+
+// MTS SysEx encoding and decoding
+//
+// Frequencies are stored in MTS messages as a semitone (midi note number) and
+// a 14 bit fraction of a semitone. Fractions are scaled by 16383 rather than
+// the 16384 of the MIDI specification, matching libMTS, so that encoded
+// messages parse back to the same frequencies in libMTS clients. Encoders
+// append messages to out.
+
+// Bulk tuning dump, or bulk tuning dump with bank if bank is non-negative.
+// NaN frequencies are encoded as "no change".
+void sysex_bulk_tuning_dump(const double *frequencies, int device_id, int bank, int program,
+                            const std::string &name, std::vector<unsigned char> &out);
+
+// Single note tuning change, or single note tuning change with bank if bank is
+// non-negative. Split into several messages if more than 127 notes are given.
+// The non-realtime form only exists with a bank, so bank 0 is used if realtime
+// is false and no bank is given.
+void sysex_single_note_tuning(const int *notes, const double *frequencies, size_t n, int device_id,
+                              bool realtime, int bank, int program, std::vector<unsigned char> &out);
+
+// Scale/octave tuning, 1 byte form (-64 to +63 cents) or 2 byte form (-100 to
+// +100 cents), of the 12 pitch classes starting from C on the channels in
+// channel_mask
+void sysex_scale_octave_tuning(const double *cents, uint16_t channel_mask, bool two_byte, int device_id,
+                               bool realtime, std::vector<unsigned char> &out);
+
+// Apply a complete MTS message to the table of 128 frequencies of a midi
+// channel, returning false if it is not a well formed message which retunes
+// notes on that channel. Only scale/octave tuning messages address channels,
+// the others retuning every channel.
+bool sysex_decode_tuning(const unsigned char *message, size_t len, double *frequencies, int midichannel);
@@ -0,0 +1,289 @@
+"""
+Generating scales and mapping them onto midi notes with NumPy
+
+Scales are given as in Scala files: the frequency ratios of scale degrees 1
+to n relative to degree 0, the last being the period. Results are memoised
+on their parameters and returned as shared read-only arrays, ready to pass
+to `set_note_tunings` or `set_all_multi_channel_note_tunings`.
+"""
+
+from functools import lru_cache
+
+import numpy as np
+
+STANDARD_FREQUENCIES = 440.0 * 2 ** ((np.arange(128) - 69) / 12)
+STANDARD_FREQUENCIES.flags.writeable = False
+
+
+def _read_only(array):
+    array.flags.writeable = False
+    return array
+
+
+def _scale_key(scale):
+    scale = np.asarray(scale, dtype=np.float64)
+    if scale.ndim != 1 or len(scale) == 0:
+        raise ValueError("scale must be a non-empty sequence of ratios")
+    return tuple(scale.tolist())
+
+
+def _degree_ratios(scale):
+    """
+    Ratios of degrees 0 to n - 1 and the period ratio.
+
+    Called on cache misses only, to keep checks out of the cached path.
+    """
+    scale = np.array(scale)
+    if not np.all(scale > 0):
+        raise ValueError("scale ratios must be positive")
+    return np.concatenate(([1.0], scale[:-1])), scale[-1]
+
+
+def _reduce(ratios, period_ratio):
+    """
+    Sorted distinct ratios reduced into [1, period_ratio), as a scale.
+    """
+    ratios = ratios / period_ratio ** np.floor(np.log(ratios) / np.log(period_ratio))
+    ratios = np.unique(np.round(ratios, 12))
+    ratios = ratios[(ratios > 1.0) & (ratios < period_ratio)]
+    return _read_only(np.append(ratios, period_ratio))
+
+
+@lru_cache(maxsize=256)
+def edo_scale(divisions, period_ratio=2.0):
+    """
+    Equal division of a period.
+
+    Parameters
+    ----------
+    divisions : int
+        Number of equal steps in the period.
+    period_ratio : float, optional
+        Frequency ratio of the period, by default an octave.
+
+    Returns
+    -------
+    numpy.ndarray
+        Read-only ratios of the `divisions` scale degrees.
+    """
+    if divisions < 1:
+        raise ValueError("divisions must be positive")
+    return _read_only(period_ratio ** (np.arange(1, divisions + 1) / divisions))
+
+
+def ji_lattice_scale(generators, bounds, period_ratio=2.0):
+    """
+    Just intonation scale from a lattice of generator ratios.
+
+    Every product of powers of the generators, with each exponent within its
+    bounds, is reduced into the period, and the distinct ratios sorted.
+
+    Parameters
+    ----------
+    generators : sequence of float
+        Generator ratios, such as (3, 5) for 5-limit just intonation.
+    bounds : sequence of (int, int)
+        Lowest and highest exponent of each generator, inclusive.
+    period_ratio : float, optional
+        Frequency ratio of the period, by default an octave.
+
+    Returns
+    -------
+    numpy.ndarray
+        Read-only ratios of the scale degrees.
+
+    Examples
+    --------
+    >>> mts.ji_lattice_scale((3, 5), ((-1, 1), (-1, 1)))
+    array([1.06666667, 1.2       , 1.25      , 1.33333333, 1.5       ,
+           1.6       , 1.66666667, 1.875     , 2.        ])
+    """
+    generators = tuple(float(g) for g in generators)
+    bounds = tuple((int(low), int(high)) for low, high in bounds)
+    if len(generators) != len(bounds):
+        raise ValueError("need one pair of bounds for each generator")
+    return _ji_lattice_scale(generators, bounds, float(period_ratio))
+
+
+@lru_cache(maxsize=256)
+def _ji_lattice_scale(generators, bounds, period_ratio):
+    log_ratios = np.zeros(1)
+    for generator, (low, high) in zip(generators, bounds):
+        if low > high:
+            raise ValueError("lower exponent bound above upper bound")
+        exponents = np.arange(low, high + 1)
+        log_ratios = np.add.outer(log_ratios, exponents * np.log(generator)).ravel()
+    return _reduce(np.exp(log_ratios), period_ratio)
+
+
+@lru_cache(maxsize=256)
+def rank2_scale(generator, size, down=0, period_ratio=2.0):
+    """
+    Scale from a chain of generators in a rank-2 temperament.
+
+    Parameters
+    ----------
+    generator : float
+        Generator ratio, such as 2 ** (696.578 / 1200) for quarter-comma
+        meantone.
+    size : int
+        Number of generators in the chain, and notes in the scale.
+    down : int, optional
+        Number of generators in the chain below the tonic. Defaults to 0.
+    period_ratio : float, optional
+        Frequency ratio of the period, by default an octave.
+
+    Returns
+    -------
+    numpy.ndarray
+        Read-only ratios of the scale degrees.
+    """
+    if not 0 <= down < size:
+        raise ValueError("need 0 <= down < size")
+    return _reduce(
+        generator ** np.arange(-down, size - down, dtype=np.float64), period_ratio
+    )
+
+
+def keyboard_frequencies(
+    scale, map_size=None, map_start_key=60, ref_key=69, ref_frequency=440.0
+):
+    """
+    Frequencies of all 128 midi notes for a scale mapped linearly onto keys.
+
+    Keys are mapped as by `set_map_size`, `set_map_start_key` and
+    `set_ref_key`: `map_start_key` plays scale degree 0, each of the
+    following `map_size` keys the next degree, and the mapping repeats a
+    period higher every `map_size` keys. `ref_key` is tuned to
+    `ref_frequency`.
+
+    Parameters
+    ----------
+    scale : sequence of float
+        Ratios of scale degrees 1 to n, the last being the period.
+    map_size : int, optional
+        Number of keys in the mapping, at most the number of scale degrees.
+        Defaults to the number of scale degrees.
+    map_start_key : int, optional
+        Key playing scale degree 0. Defaults to 60.
+    ref_key : int, optional
+        Key tuned to `ref_frequency`. Defaults to 69.
+    ref_frequency : float, optional
+        Frequency of `ref_key`. Defaults to 440.0.
+
+    Returns
+    -------
+    numpy.ndarray
+        Read-only float64 array of shape (128,), shared between callers.
+    """
+    scale = _scale_key(scale)
+    if map_size is None:
+        map_size = len(scale)
+    if not 0 < map_size <= len(scale):
+        raise ValueError("map_size must be between 1 and the number of scale degrees")
+    if not (0 <= map_start_key < 128 and 0 <= ref_key < 128):
+        raise ValueError("keys must be in range 0 to 127")
+    return _keyboard_frequencies(
+        scale, map_size, map_start_key, ref_key, float(ref_frequency)
+    )
+
+
+@lru_cache(maxsize=1024)
+def _keyboard_frequencies(scale, map_size, map_start_key, ref_key, ref_frequency):
+    ratios, period_ratio = _degree_ratios(scale)
+    period, degree = np.divmod(np.arange(128) - map_start_key, map_size)
+    frequencies = period_ratio**period * ratios[degree]
+    return _read_only(frequencies * (ref_frequency / frequencies[ref_key]))
+
+
+def isomorphic_frequencies(
+    scale, steps, notes, channels=None, base_frequency=261.625565
+):
+    """
+    Frequencies for a scale laid out isomorphically on a grid of keys.
+
+    The key in column `i` and row `j` of the grid plays scale degree
+    `i * steps[0] + j * steps[1]`, counting on through later periods, with
+    degree 0 at `base_frequency`. Notes not on the grid keep their standard
+    12-TET frequencies.
+
+    Parameters
+    ----------
+    scale : int or sequence of float
+        Ratios of scale degrees 1 to n, the last being the period, or a
+        number of equal divisions of the octave.
+    steps : tuple of (int, int)
+        Scale degrees moved going one key across and one key up.
+    notes : array_like of int
+        Midi note of each key, of shape (rows, columns), with -1 for keys
+        with no note.
+    channels : array_like of int, optional
+        Midi channel of each key, of the same shape as `notes`, for layouts
+        spanning several channels.
+    base_frequency : float, optional
+        Frequency of the key in row 0 and column 0. Defaults to middle C.
+
+    Returns
+    -------
+    numpy.ndarray
+        Read-only float64 array of shape (128,), or (16, 128) if `channels`
+        is given, shared between callers.
+
+    Examples
+    --------
+    Fourths up the columns of a Launchpad in 12-TET
+
+    >>> notes = 11 + np.arange(8) + 10 * np.arange(8)[:, None]
+    >>> mts.set_note_tunings(mts.isomorphic_frequencies(12, (1, 5), notes))
+    """
+    if isinstance(scale, (int, np.integer)):
+        scale = edo_scale(scale)
+    scale = _scale_key(scale)
+    notes = np.asarray(notes, dtype=np.int64)
+    if notes.ndim != 2:
+        raise ValueError("notes must be a 2D array")
+    if channels is not None:
+        channels = np.asarray(channels, dtype=np.int64)
+        if channels.shape != notes.shape:
+            raise ValueError("channels must have the same shape as notes")
+        channels = channels.tobytes()
+    x, y = steps
+    return _isomorphic_frequencies(
+        scale,
+        int(x),
+        int(y),
+        notes.tobytes(),
+        notes.shape,
+        channels,
+        float(base_frequency),
+    )
+
+
+@lru_cache(maxsize=1024)
+def _isomorphic_frequencies(scale, x, y, notes, shape, channels, base_frequency):
+    ratios, period_ratio = _degree_ratios(scale)
+    notes = np.frombuffer(notes, dtype=np.int64).reshape(shape)
+    if np.any((notes < -1) | (notes > 127)):
+        raise ValueError("notes must be in range 0 to 127, or -1 for no note")
+    rows, columns = np.indices(shape)
+    period, degree = np.divmod(columns * x + rows * y, len(ratios))
+    key_frequencies = base_frequency * period_ratio**period * ratios[degree]
+    on_grid = notes >= 0
+    if channels is None:
+        frequencies = STANDARD_FREQUENCIES.copy()
+        frequencies[notes[on_grid]] = key_frequencies[on_grid]
+    else:
+        channels = np.frombuffer(channels, dtype=np.int64).reshape(shape)
+        if np.any((channels < 0) | (channels > 15)):
+            raise ValueError("channels must be in range 0 to 15")
+        frequencies = np.tile(STANDARD_FREQUENCIES, (16, 1))
+        frequencies[channels[on_grid], notes[on_grid]] = key_frequencies[on_grid]
+    return _read_only(frequencies)
+
+
+ji_lattice_scale.cache_info = _ji_lattice_scale.cache_info
+ji_lattice_scale.cache_clear = _ji_lattice_scale.cache_clear
+keyboard_frequencies.cache_info = _keyboard_frequencies.cache_info
+keyboard_frequencies.cache_clear = _keyboard_frequencies.cache_clear
+isomorphic_frequencies.cache_info = _isomorphic_frequencies.cache_info
+isomorphic_frequencies.cache_clear = _isomorphic_frequencies.cache_clear
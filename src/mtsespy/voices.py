@@ -0,0 +1,72 @@
+"""
+Playing MTS-ESP tunings on synths without MTS-ESP support
+"""
+
+from ._mtsespy import _VoiceAllocator
+
+
+class VoiceAllocator(_VoiceAllocator):
+    """
+    Convert tuned notes into 12-TET notes with per-channel pitch bend.
+
+    Each note is played as the 12-TET note nearest its frequency in the
+    client's tuning, alone on a channel with a 14-bit pitch bend, centred on
+    8192, making up the difference, as in MPE. Free channels are used in
+    rotation, the one released longest ago first. With every channel busy
+    the oldest voice is stolen, or the note dropped if `steal` is False.
+    Notes the master filters are dropped too. A note on for a key already
+    playing releases its voice first. Allocation is done in C++.
+
+    `note_on` returns the channel, note and bend of a voice, with the note
+    of any voice stolen from the channel, or -1 for each if the note is
+    not played, then the channel and note of any voice released for the
+    same key, or -1. `note_off` returns the channel and note released.
+    `process` converts a MIDI byte stream, and `process_array` an (n, 3)
+    array of messages, into the note offs, pitch bends and note ons to send.
+    Pitch bends are only sent by these when a channel's bend changes.
+    Polyphonic aftertouch is sent on the channel and note of its voice, and
+    dropped for keys not playing. Control changes, program changes and
+    channel pressure are sent on every output channel, since the voices of
+    an input channel can be on any of them, while input pitch bends are
+    dropped. System messages are passed through.
+
+    Parameters
+    ----------
+    client : MTSClient
+        Client giving the tuning, as returned by `register_client` or
+        `Client`.
+    channels : array_like of int, optional
+        Output midi channels, by default all 16. Pass ``range(1, 16)`` for
+        the member channels of an MPE lower zone.
+    bend_range : float, optional
+        Pitch bend range of the synth in semitones. Defaults to 2.0.
+    steal : bool, optional
+        Whether to steal the oldest voice when every channel is busy.
+        Defaults to True.
+
+    Examples
+    --------
+    >>> with mts.Client() as c:
+    ...     voices = mts.VoiceAllocator(c, channels=range(1, 16))
+    ...     out_port.send(voices.bend_range_messages())
+    ...     out_port.send(voices.process(in_port.read()))
+    """
+
+    def bend_range_messages(self):
+        """
+        Midi messages setting the pitch bend range of every output channel.
+
+        Returns
+        -------
+        bytes
+            Registered parameter number 0 messages for `bend_range`, in
+            semitones and cents.
+        """
+        cents = round(self.bend_range * 100)
+        semitones, cents = divmod(cents, 100)
+        messages = bytearray()
+        for channel in self.channels:
+            cc = 0xB0 | channel
+            messages += bytes([cc, 101, 0, cc, 100, 0, cc, 6, semitones, cc, 38, cents])
+            messages += bytes([cc, 101, 127, cc, 100, 127])
+        return bytes(messages)
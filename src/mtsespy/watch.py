@@ -0,0 +1,98 @@
+"""
+Watching the tuning seen by a client for changes
+"""
+
+import asyncio
+from dataclasses import dataclass
+
+import numpy as np
+
+
+@dataclass(frozen=True)
+class TuningChange:
+    """
+    Change in the tuning seen by a client, as yielded by `watch`.
+
+    Attributes
+    ----------
+    snapshot : TuningSnapshot
+        Tuning after the change.
+    previous : TuningSnapshot
+        Tuning before the change.
+    notes : numpy.ndarray
+        Bool array of shape (16, 128), indexed by channel and note, which is
+        True for notes whose frequency changed.
+    filters : numpy.ndarray
+        Bool array of shape (16, 128) which is True for notes whose filter
+        changed.
+    scale_renamed : bool
+        Whether the scale name changed.
+    remapped : bool
+        Whether the period ratio, map size, map start key or reference key
+        changed.
+    """
+
+    snapshot: object
+    previous: object
+    notes: np.ndarray
+    filters: np.ndarray
+    scale_renamed: bool
+    remapped: bool
+
+    @property
+    def channels(self):
+        """
+        Midi channels with notes whose frequency or filter changed.
+        """
+        return tuple(np.flatnonzero((self.notes | self.filters).any(axis=1)).tolist())
+
+
+def watch(client, interval=0.005, max_interval=0.25):
+    """
+    Asynchronously iterate over changes to the tuning seen by a client.
+
+    The client is refreshed when `watch` is called and changes are reported
+    relative to that tuning. Polling runs `refresh`, which reads and compares
+    the tuning in C++, in the event loop's default executor so the loop is not
+    blocked. Polls start every `interval` seconds and the wait doubles while
+    nothing changes, up to `max_interval`, dropping back to `interval` after
+    each change. Changes made between two polls are reported as a single
+    `TuningChange`.
+
+    Parameters
+    ----------
+    client : MTSClient
+        Client to watch.
+    interval : float, optional
+        Shortest time in seconds between polls.
+    max_interval : float, optional
+        Longest time in seconds between polls when idle.
+
+    Returns
+    -------
+    async iterator of TuningChange
+
+    Examples
+    --------
+    >>> async for change in mts.watch(client):
+    ...     print(change.channels, change.scale_renamed)
+    """
+    if not 0 < interval <= max_interval:
+        raise ValueError("interval must be positive and at most max_interval")
+    client.refresh()
+    return _watch(client, client.snapshot(), interval, max_interval)
+
+
+async def _watch(client, previous, interval, max_interval):
+    loop = asyncio.get_running_loop()
+    delay = interval
+    while True:
+        await asyncio.sleep(delay)
+        await loop.run_in_executor(None, client.refresh)
+        snapshot = client.snapshot()
+        if snapshot.generation == previous.generation:
+            delay = min(2 * delay, max_interval)
+            continue
+        yield TuningChange(snapshot, previous, *snapshot.changes_since(previous))
+        previous = snapshot
+        delay = interval
@@ -2,10 +2,19 @@
 Tests for mtsespy
 """
 
-from concurrent.futures import ProcessPoolExecutor
-from time import sleep
+import asyncio
+import gc
+import os
+import weakref
+from array import array
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from threading import Barrier
+from time import perf_counter, sleep
 from math import log2
+from multiprocessing import get_context
+from pathlib import Path
 
+import numpy as np
 import pytest
 
 import mtsespy as mts
@@ -140,6 +149,40 @@ def test_set_note_tunings():
     assert frequencies == client_frequencies
 
 
+@pytest.mark.parametrize("dtype", [np.float64, np.float32])
+def test_set_note_tunings_array(dtype):
+    frequencies = np.arange(128, dtype=dtype)
+    with mts.Master():
+        mts.set_note_tunings(frequencies)
+        with mts.Client() as c:
+            client_frequencies = mts.note_to_frequency_array(c, channels=0)
+    assert client_frequencies.tolist() == frequencies.tolist()
+
+
+def test_set_note_tunings_buffer():
+    frequencies = array("d", range(128))
+    with mts.Master():
+        mts.set_note_tunings(frequencies)
+        with mts.Client() as c:
+            client_frequencies = mts.note_to_frequency_array(c, channels=0)
+    assert client_frequencies.tolist() == frequencies.tolist()
+
+
+def test_set_note_tunings_non_contiguous():
+    frequencies = np.arange(256.0)[::2]
+    with mts.Master():
+        mts.set_note_tunings(frequencies)
+        with mts.Client() as c:
+            client_frequencies = mts.note_to_frequency_array(c, channels=0)
+    assert client_frequencies.tolist() == frequencies.tolist()
+
+
+def test_set_note_tunings_wrong_shape():
+    with mts.Master():
+        with pytest.raises(ValueError):
+            mts.set_note_tunings(np.ones(127))
+
+
 def test_has_ipc():
     assert mts.has_ipc()
 
@@ -155,6 +198,128 @@ def test_get_num_clients():
         assert mts.get_num_clients() == 0
 
 
+def test_client_pool_reuses_clients():
+    pool = mts.ClientPool()
+    try:
+        with mts.Master():
+            with mts.Client(pool=pool) as c1:
+                assert mts.get_num_clients() == 1
+            assert len(pool) == 1
+            assert mts.get_num_clients() == 1
+            with pool.lease() as c2:
+                assert c2 is c1
+                assert len(pool) == 0
+                mts.set_note_tuning(441.0, 69)
+                assert mts.note_to_frequency(c2, 69, 0) == 441.0
+            pool.close()
+            assert len(pool) == 0
+            assert mts.get_num_clients() == 0
+    finally:
+        pool.close()
+
+
+def test_client_pool_evicts_idle_clients():
+    pool = mts.ClientPool(idle_timeout=0.0, max_idle=1)
+    try:
+        with mts.Master():
+            with pool.lease(), pool.lease():
+                assert mts.get_num_clients() == 2
+            assert len(pool) <= 1
+            sleep(0.01)
+            with pool.lease():
+                assert len(pool) == 0
+            assert mts.get_num_clients() <= 1
+            sleep(0.01)
+            pool.release(pool.acquire())
+            assert mts.get_num_clients() <= 1
+        with pytest.raises(ValueError):
+            mts.ClientPool(idle_timeout=-1.0)
+        with pytest.raises(ValueError):
+            mts.ClientPool(max_idle=-1)
+    finally:
+        pool.close()
+
+
+def test_client_pool_evicts_when_unused():
+    pool = mts.ClientPool(idle_timeout=0.01)
+    try:
+        with mts.Master():
+            pool.release(pool.acquire())
+            assert mts.get_num_clients() == 1
+            sleep(0.05)
+            assert len(pool) == 0
+            assert mts.get_num_clients() == 0
+            pool.release(pool.acquire())
+            sleep(0.05)
+            client = pool.acquire()
+            assert mts.get_num_clients() == 1
+            pool.release(client)
+    finally:
+        pool.close()
+
+
+def test_client_pool_not_kept_alive():
+    pool = mts.ClientPool()
+    ref = weakref.ref(pool)
+    del pool
+    gc.collect()
+    assert ref() is None
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+def test_client_pool_fork_with_lock_held():
+    """
+    Test that a child forked while another thread holds the pool's lock can
+    use the pool.
+    """
+    pool = mts.ClientPool()
+    try:
+        with mts.Master():
+            pool.release(pool.acquire())
+            with pool._lock:
+                pid = os.fork()
+                if pid == 0:
+                    os._exit(0 if len(pool) == 0 else 1)
+            deadline = perf_counter() + 10
+            while (result := os.waitpid(pid, os.WNOHANG)) == (0, 0):
+                if perf_counter() > deadline:
+                    os.kill(pid, 9)
+                    os.waitpid(pid, 0)
+                    pytest.fail("child deadlocked on the pool's lock")
+                sleep(0.01)
+            assert os.waitstatus_to_exitcode(result[1]) == 0
+            assert len(pool) == 1
+    finally:
+        pool.close()
+
+
+def test_client_pool_threads():
+    """
+    Test that concurrent leases never share a client.
+    """
+    pool = mts.ClientPool()
+    n_threads = 8
+    n_rounds = 100
+    barrier = Barrier(n_threads)
+    held = [[None] * n_threads for _ in range(n_rounds)]
+
+    def lease(i):
+        for r in range(n_rounds):
+            with pool.lease() as c:
+                held[r][i] = id(c)
+                barrier.wait()
+
+    try:
+        with mts.Master():
+            with ThreadPoolExecutor(n_threads) as executor:
+                list(executor.map(lease, range(n_threads)))
+            assert len(pool) == n_threads
+            assert mts.get_num_clients() == n_threads
+    finally:
+        pool.close()
+    assert all(len(set(ids)) == n_threads for ids in held)
+
+
 def test_reinitialize():
     assert mts.can_register_master()
     mts.register_master()
@@ -207,6 +372,70 @@ def test_clear_note_filter():
     assert not should_filter
 
 
+def test_set_filter_mask():
+    mask = np.zeros(128, dtype=bool)
+    mask[1::2] = True
+    with mts.Master():
+        with mts.Client() as c:
+            assert mts.set_filter_mask(mask) == 64
+            assert mts.set_filter_mask(mask) == 0
+            filters = mts.get_filter_mask(c)
+            assert filters.shape == (16, 128)
+            assert np.array_equal(filters, np.tile(mask, (16, 1)))
+            masks = np.tile(mask, (16, 1))
+            masks[3, 1] = False
+            masks[5, 0] = True
+            assert mts.set_filter_mask(masks) == 2
+            assert np.array_equal(mts.get_filter_mask(c), masks)
+            assert mts.set_filter_mask(np.zeros(128, dtype=bool)) == 65
+            assert not mts.get_filter_mask(c).any()
+
+
+def test_set_filter_mask_after_filter_note():
+    """
+    Test that the diff follows filter_note, where channel -1 sets a note on
+    every channel and a later call for one channel overrides it.
+    """
+    mask = np.zeros(128, dtype=bool)
+    mask[60] = True
+    with mts.Master():
+        with mts.Client() as c:
+            mts.filter_note(True, 60, -1)
+            assert mts.set_filter_mask(mask) == 0
+            mts.filter_note(False, 60, 3)
+            assert not mts.should_filter_note(c, 60, 3)
+            assert mts.set_filter_mask(mask) == 1
+            assert mts.get_filter_mask(c)[:, 60].all()
+            mts.clear_note_filter()
+            assert mts.set_filter_mask(mask) == 1
+            assert mts.should_filter_note(c, 60, 3)
+
+
+def test_set_filter_mask_multi_channel():
+    masks = np.zeros((16, 128), dtype=bool)
+    masks[1, 69] = True
+    with mts.Master():
+        mts.set_multi_channel(True, 1)
+        with mts.Client() as c:
+            assert mts.set_filter_mask(masks, multi_channel=True) == 1
+            assert mts.set_filter_mask(masks, multi_channel=True) == 0
+            assert mts.should_filter_note(c, 69, 1)
+            assert mts.set_filter_mask(masks, multi_channel=False) == 1
+            mts.clear_note_filter_multi_channel(1)
+            assert mts.set_filter_mask(masks, multi_channel=True) == 1
+
+
+def test_set_filter_mask_errors():
+    with mts.Master():
+        with pytest.raises(ValueError):
+            mts.set_filter_mask(np.zeros(127, dtype=bool))
+        with pytest.raises(ValueError):
+            mts.set_filter_mask(np.zeros((15, 128), dtype=bool))
+        with mts.Client() as c:
+            with pytest.raises(ValueError):
+                mts.get_filter_mask(c, out=np.empty((16, 127), dtype=bool))
+
+
 def test_set_multi_channel_note_tuning():
     with mts.Master():
         mts.set_multi_channel(True, 0)
@@ -245,6 +474,27 @@ def test_set_multi_channel_note_tunings_2():
     assert frequencies != client_frequencies
 
 
+def test_set_multi_channel_note_tunings_array():
+    frequencies = np.arange(128.0)
+    with mts.Master():
+        mts.set_multi_channel(True, 0)
+        mts.set_multi_channel_note_tunings(frequencies, 0)
+        with mts.Client() as c:
+            client_frequencies = mts.note_to_frequency_array(c, channels=0)
+    assert client_frequencies.tolist() == frequencies.tolist()
+
+
+def test_set_all_multi_channel_note_tunings():
+    frequencies = np.arange(16 * 128.0).reshape(16, 128)
+    with mts.Master():
+        for channel in range(16):
+            mts.set_multi_channel(True, channel)
+        mts.set_all_multi_channel_note_tunings(frequencies)
+        with mts.Client() as c:
+            client_frequencies = mts.note_to_frequency_array(c)
+    assert client_frequencies.tolist() == frequencies.tolist()
+
+
 def test_filter_note_multi_channel():
     with mts.Master():
         mts.set_multi_channel(True, 1)
@@ -287,6 +537,229 @@ def test_has_master_2():
     assert not does_have_master
 
 
+def test_client_methods():
+    with mts.Master():
+        mts.set_note_tuning(441.0, 69)
+        mts.filter_note(True, 61, 2)
+        mts.set_scale_name("methods")
+        mts.set_period_ratio(3.0)
+        mts.set_map_size(13)
+        mts.set_map_start_key(62)
+        mts.set_ref_key(67)
+        with mts.Client() as c:
+            assert c.has_master()
+            assert c.note_to_frequency(69, 0) == mts.note_to_frequency(c, 69, 0)
+            assert abs(c.note_to_frequency(midinote=69, midichannel=-1) - 441.0) < 1e-6
+            assert c.should_filter_note(61, 2)
+            assert not c.should_filter_note(61, 3)
+            assert c.retuning_in_semitones(69, 0) == mts.retuning_in_semitones(c, 69, 0)
+            assert c.retuning_as_ratio(69, 0) == mts.retuning_as_ratio(c, 69, 0)
+            assert c.frequency_to_note(441.0, 0) == 69
+            assert c.frequency_to_note_and_channel(441.0) == (69, 0)
+            assert c.scale_name == "methods"
+            assert c.period_ratio == 3.0
+            assert c.period_semitones == mts.get_period_semitones(c)
+            assert c.map_size == 13
+            assert c.map_start_key == 62
+            assert c.ref_key == 67
+            assert not c.has_received_mts_sysex
+            assert c.should_update_library == mts.client_should_update_library(c)
+            c.parse_midi_data(mts.encode_single_note_tuning([60], [300.0]))
+            assert c.has_received_mts_sysex
+
+
+def test_client_methods_out_of_range():
+    with mts.Client() as c:
+        for query in [
+            c.note_to_frequency,
+            c.should_filter_note,
+            c.retuning_in_semitones,
+            c.retuning_as_ratio,
+            lambda n, ch: mts.note_to_frequency(c, n, ch),
+        ]:
+            with pytest.raises(ValueError, match="midinote"):
+                query(128, 0)
+            with pytest.raises(ValueError, match="midinote"):
+                query(-1, 0)
+            with pytest.raises(ValueError, match="midichannel"):
+                query(69, 16)
+            with pytest.raises(ValueError, match="midichannel"):
+                query(69, -2)
+        with pytest.raises(ValueError, match="midichannel"):
+            c.frequency_to_note(440.0, 16)
+        with pytest.raises(AttributeError):
+            c.scale_name = "read-only"
+
+def test_note_to_frequency_array():
+    with mts.Master():
+        mts.set_note_tuning(441.0, 69)
+        with mts.Client() as c:
+            freqs = mts.note_to_frequency_array(c)
+            expected = [[mts.note_to_frequency(c, i, j) for i in range(128)] for j in range(16)]
+    assert freqs.shape == (16, 128)
+    assert freqs.dtype == np.float64
+    assert freqs[0, 69] == 441.0
+    assert freqs.tolist() == expected
+
+
+def test_note_to_frequency_array_notes_and_channels():
+    with mts.Client() as c:
+        freqs = mts.note_to_frequency_array(c, notes=[57, 69, 81], channels=0)
+    assert freqs.tolist() == [220.0, 440.0, 880.0]
+
+
+def test_note_to_frequency_array_out():
+    out = np.zeros((2, 128))
+    with mts.Client() as c:
+        result = mts.note_to_frequency_array(c, channels=[0, 1], out=out)
+    assert result is out
+    assert out[1, 69] == 440.0
+
+
+def test_note_to_frequency_array_out_wrong_dtype():
+    out = np.zeros((16, 128), dtype=np.float32)
+    with mts.Client() as c:
+        with pytest.raises(TypeError):
+            mts.note_to_frequency_array(c, out=out)
+
+
+def test_note_to_frequency_array_out_wrong_shape():
+    out = np.zeros(128)
+    with mts.Client() as c:
+        with pytest.raises(ValueError):
+            mts.note_to_frequency_array(c, out=out)
+
+
+def test_note_to_frequency_array_out_of_range():
+    with mts.Client() as c:
+        with pytest.raises(ValueError):
+            mts.note_to_frequency_array(c, notes=[128])
+        with pytest.raises(ValueError):
+            mts.note_to_frequency_array(c, channels=[16])
+
+
+def test_retuning_in_semitones_array():
+    with mts.Master():
+        mts.set_note_tuning(440 * 2 ** (1 / 24), 69)
+        with mts.Client() as c:
+            semitones = mts.retuning_in_semitones_array(c, channels=0)
+    assert abs(semitones[69] - 0.5) <= 1e-6
+    assert np.all(abs(np.delete(semitones, 69)) <= 1e-6)
+
+
+def test_retuning_as_ratio_array():
+    with mts.Client() as c:
+        ratios = mts.retuning_as_ratio_array(c)
+    assert np.all(ratios == 1.0)
+
+
+def test_should_filter_note_array():
+    with mts.Master():
+        mts.filter_note(True, 69, 0)
+        with mts.Client() as c:
+            should_filter = mts.should_filter_note_array(c, channels=0)
+    assert should_filter.dtype == np.bool_
+    assert should_filter[69]
+    assert should_filter.sum() == 1
+
+
+def test_snapshot():
+    with mts.Master():
+        mts.set_note_tuning(441.0, 69)
+        mts.filter_note(True, 70, 0)
+        mts.set_scale_name("foo")
+        with mts.Client() as c:
+            snapshot = c.snapshot()
+            freqs = mts.note_to_frequency_array(c)
+    assert snapshot.frequencies.shape == (16, 128)
+    assert snapshot.frequencies.tolist() == freqs.tolist()
+    assert snapshot.filter_mask[0, 70]
+    assert snapshot.filter_mask.sum() == 1
+    assert snapshot.scale_name == "foo"
+    assert snapshot.period_ratio == 2.0
+    assert snapshot.map_size == -1
+    assert snapshot.generation == 0
+
+
+def test_snapshot_read_only():
+    with mts.Client() as c:
+        snapshot = c.snapshot()
+    with pytest.raises(ValueError):
+        snapshot.frequencies[0, 0] = 1.0
+
+
+def test_tables():
+    with mts.Master():
+        with mts.Client() as c:
+            tables = c.tables()
+            assert tables.online
+            frequencies = tables.frequencies()
+            channel_frequencies = tables.frequencies(3)
+            assert frequencies.shape == (128,)
+            assert frequencies[69] == 440.0
+            mts.set_note_tuning(441.0, 69)
+            mts.set_multi_channel_note_tuning(450.0, 69, 3)
+            assert frequencies[69] == 441.0
+            assert channel_frequencies[69] == 450.0
+            with pytest.raises(ValueError):
+                frequencies[69] = 1.0
+            out = np.empty((17, 128))
+            assert tables.read(out) is out
+            assert out[0, 69] == 441.0
+            assert out[4, 69] == 450.0
+            assert out[1, 69] == 440.0
+            assert tables.read().tolist() == out.tolist()
+    assert not tables.online
+
+
+def test_tables_errors():
+    with mts.Client() as c:
+        tables = c.tables()
+        with pytest.raises(ValueError):
+            tables.frequencies(16)
+        with pytest.raises(ValueError):
+            tables.read(max_passes=1)
+        with pytest.raises(ValueError):
+            tables.read(np.empty((16, 128)))
+        with pytest.raises(TypeError):
+            tables.read(np.empty((17, 128), dtype=np.float32))
+
+
+def test_refresh_unchanged():
+    with mts.Master():
+        with mts.Client() as c:
+            snapshot = c.snapshot()
+            changed = c.refresh()
+            assert c.snapshot() is snapshot
+    assert not changed
+    assert snapshot.generation == 0
+
+
+def test_refresh_changed():
+    with mts.Master():
+        with mts.Client() as c:
+            snapshot = c.snapshot()
+            mts.set_note_tuning(441.0, 69)
+            changed = c.refresh()
+            new_snapshot = c.snapshot()
+    assert changed
+    assert new_snapshot.generation == 1
+    assert new_snapshot.frequencies[0, 69] == 441.0
+    assert snapshot.frequencies[0, 69] == 440.0
+
+
+def test_refresh_map_size():
+    with mts.Master():
+        with mts.Client() as c:
+            c.snapshot()
+            mts.set_map_size(12)
+            assert c.refresh()
+            assert not c.refresh()
+            snapshot = c.snapshot()
+    assert snapshot.map_size == 12
+    assert snapshot.generation == 1
+
+
 def test_frequency_to_note():
     with mts.Client() as c:
         note = mts.frequency_to_note(c, 441.0, 0)
@@ -327,6 +800,150 @@ def test_frequency_to_note_and_channel_3():
     assert channel == 1
 
 
+def test_frequency_to_note_array():
+    frequencies = np.geomspace(10.0, 12000.0, 1000)
+    with mts.Master():
+        mts.set_note_tunings(440.0 * 2 ** ((np.arange(128) - 69) / 19))
+        mts.filter_note(True, 69, 0)
+        with mts.Client() as c:
+            notes, cents = mts.frequency_to_note_array(c, frequencies, 0)
+            expected = [mts.frequency_to_note(c, f, 0) for f in frequencies]
+            tuning = mts.note_to_frequency_array(c, channels=0)
+    assert notes.tolist() == expected
+    assert 69 not in notes
+    assert np.allclose(cents, 1200 * np.log2(frequencies / tuning[notes]))
+
+
+def test_frequency_to_note_array_exact():
+    with mts.Master():
+        mts.set_note_tuning(441.0, 80)
+        with mts.Client() as c:
+            notes, cents = mts.frequency_to_note_array(c, [441.0, 440.0], 0)
+    assert notes.tolist() == [80, 69]
+    assert cents.tolist() == [0.0, 0.0]
+
+
+def test_frequency_to_note_and_channel_array():
+    with mts.Master():
+        mts.set_multi_channel(True, 1)
+        mts.set_multi_channel_note_tuning(441.0, 80, 1)
+        with mts.Client() as c:
+            notes, channels, cents = mts.frequency_to_note_and_channel_array(
+                c, [441.0, 440.0, 261.0]
+            )
+    assert notes.tolist() == [80, 69, 60]
+    assert channels.tolist() == [1, 1, 1]
+    assert cents[0] == 0.0
+
+
+def test_frequency_to_note_and_channel_array_matches_scalar():
+    freqs = [440.0, 441.0, 300.0, 1000.0]
+    with mts.Master():
+        with mts.Client() as c:
+            notes, channels, _ = mts.frequency_to_note_and_channel_array(c, freqs)
+            assert list(zip(notes.tolist(), channels.tolist())) == [
+                mts.frequency_to_note_and_channel(c, f) for f in freqs
+            ]
+            assert channels.tolist() == [0, 0, 0, 0]
+            mts.set_multi_channel(True, 3)
+            notes, channels, _ = mts.frequency_to_note_and_channel_array(c, freqs)
+            assert c.snapshot().multi_channel.tolist() == [i == 3 for i in range(16)]
+            assert list(zip(notes.tolist(), channels.tolist())) == [
+                mts.frequency_to_note_and_channel(c, f) for f in freqs
+            ]
+            assert channels.tolist() == [3, 3, 3, 3]
+
+
+def test_key_mapping_array():
+    with mts.Master():
+        mts.set_note_tunings(440.0 * 2 ** ((np.arange(128) - 69) / 19))
+        mts.set_map_size(19)
+        mts.set_map_start_key(60)
+        mts.set_ref_key(69)
+        mts.filter_note(True, 61, -1)
+        with mts.Client() as c:
+            periods, degrees, mapped, cents = mts.key_mapping_array(c)
+            expected_cents = [100 * mts.retuning_in_semitones(c, n, 0) for n in range(128)]
+            notes = np.array([[60, 79], [41, 127]])
+            some = mts.key_mapping_array(c, notes, 0)
+    expected = [divmod(n - 60, 19) for n in range(128)]
+    assert periods.tolist() == [p for p, _ in expected]
+    assert degrees.tolist() == [d for _, d in expected]
+    assert mapped.tolist() == [n != 61 for n in range(128)]
+    assert np.allclose(cents, expected_cents)
+    assert [a.shape for a in some] == [(2, 2)] * 4
+    assert some[0].tolist() == [[0, 1], [-1, 3]]
+    assert some[1].tolist() == [[0, 0], [0, 10]]
+    assert np.allclose(some[3], cents[notes])
+
+
+def test_key_mapping_array_no_mapping():
+    with mts.Master():
+        mts.set_multi_channel(True, 2)
+        mts.set_multi_channel_note_tuning(441.0, 69, 2)
+        with mts.Client() as c:
+            periods, degrees, mapped, cents = mts.key_mapping_array(c, midichannel=2)
+            _, _, _, global_cents = mts.key_mapping_array(c)
+    assert (periods == -1).all()
+    assert (degrees == -1).all()
+    assert not mapped.any()
+    assert cents[69] == pytest.approx(1200 * np.log2(441.0 / 440.0))
+    assert global_cents[69] == 0.0
+
+
+def test_key_mapping_cached():
+    with mts.Master():
+        mts.set_map_size(12)
+        mts.set_map_start_key(60)
+        with mts.Client() as c:
+            snapshot = c.snapshot()
+            periods = snapshot.key_mapping()[0]
+            assert snapshot.key_mapping()[0].__array_interface__["data"] == periods.__array_interface__["data"]
+            assert mts.key_mapping_array(c)[0].__array_interface__["data"] == periods.__array_interface__["data"]
+            mts.set_map_start_key(62)
+            new_periods = mts.key_mapping_array(c)[0]
+    assert not periods.flags.writeable
+    with pytest.raises(ValueError):
+        periods[0] = 1
+    assert periods[60] == 0
+    assert new_periods[60] == -1
+    assert new_periods[62] == 0
+
+
+def test_key_mapping_out_of_range():
+    with mts.Master():
+        with mts.Client() as c:
+            with pytest.raises(ValueError, match="midinote"):
+                mts.key_mapping_array(c, [128])
+            with pytest.raises(ValueError, match="midichannel"):
+                mts.key_mapping_array(c, midichannel=16)
+            with pytest.raises(ValueError, match="midichannel"):
+                c.snapshot().key_mapping(midichannel=-1)
+
+
+def test_frequency_to_note_and_channel_array_channels():
+    with mts.Master():
+        mts.set_multi_channel(True, 1)
+        mts.set_multi_channel_note_tunings(np.arange(1.0, 129.0), 1)
+        with mts.Client() as c:
+            notes, channels, cents = mts.frequency_to_note_and_channel_array(
+                c, [440.0], channels=[1]
+            )
+            expected = mts.frequency_to_note_and_channel(c, 440.0)
+    assert (notes[0], channels[0]) == expected == (127, 1)
+
+
+def test_snapshot_frequency_to_note_follows_tuning():
+    with mts.Master():
+        with mts.Client() as c:
+            snapshot = c.snapshot()
+            mts.set_note_tuning(441.0, 80)
+            c.refresh()
+            new_snapshot = c.snapshot()
+    assert snapshot.frequency_to_note([441.0], 0)[0].tolist() == [69]
+    assert new_snapshot.frequency_to_note([441.0], 0)[0].tolist() == [80]
+
+
 def test_parse_midi_data():
     # MTS sysex message to tune midi note 69 up a quarter tone
     msg = bytes.fromhex("F0 7F 00 08 02 00 01" + "45" + "45 40 00" + "F7")
@@ -338,6 +955,395 @@ def test_parse_midi_data():
     assert abs(f_after - 440.0 * 2 ** (1 / 24)) < 1e-3
 
 
+def single_note_tuning_message(note, semitone, fraction):
+    """
+    MTS single note tuning change message retuning one note.
+    """
+    header = [0xF0, 0x7F, 0x00, 0x08, 0x02, 0x00, 0x01]
+    return bytes(header + [note, semitone, fraction >> 7, fraction & 0x7F, 0xF7])
+
+
+def test_sysex_stream_split_message():
+    msg = single_note_tuning_message(69, 69, 8192)
+    with mts.Client() as c:
+        stream = mts.SysExStream(c)
+        counts = [stream.feed(msg[:4]), stream.feed(msg[4:9]), stream.feed(msg[9:])]
+        f = mts.note_to_frequency(c, 69, 0)
+    assert counts == [0, 0, 1]
+    assert abs(f - 440.0 * 2 ** (1 / 24)) < 1e-3
+
+
+def test_sysex_stream_concatenated_and_interleaved():
+    data = (
+        bytes.fromhex("90 45 7F")
+        + single_note_tuning_message(60, 61, 0)
+        + bytes.fromhex("F0 43 10 4C 00 00 7E 00 F7")  # Non-MTS SysEx
+        + bytes.fromhex("B0 07 64 F8")
+        + single_note_tuning_message(69, 70, 0)[:5]
+        + bytes.fromhex("F8")  # Real-time message inside SysEx
+        + single_note_tuning_message(69, 70, 0)[5:]
+        + bytes.fromhex("80 45 00")
+    )
+    with mts.Client() as c:
+        stream = mts.SysExStream(c)
+        count = stream.feed(data)
+        freqs = mts.note_to_frequency_array(c, notes=[60, 69], channels=0)
+    assert count == 2
+    assert stream.message_count == 2
+    assert np.allclose(freqs, [440.0 * 2 ** (-8 / 12), 440.0 * 2 ** (1 / 12)])
+
+
+def test_sysex_stream_interrupted_message():
+    msg = single_note_tuning_message(69, 70, 0)
+    with mts.Client() as c:
+        stream = mts.SysExStream(c)
+        count = stream.feed(msg[:6] + bytes.fromhex("90 45 7F") + msg[6:])
+        f = mts.note_to_frequency(c, 69, 0)
+    assert count == 0
+    assert f == 440.0
+
+
+def test_sysex_stream_feed_all():
+    data = single_note_tuning_message(60, 61, 0) + single_note_tuning_message(69, 70, 0)
+    chunks = [data[i : i + 5] for i in range(0, len(data), 5)]
+    with mts.Client() as c:
+        count = mts.SysExStream(c).feed_all(chunks)
+    assert count == 2
+
+
+def test_sysex_stream_afeed_all():
+    data = single_note_tuning_message(60, 61, 0) + single_note_tuning_message(69, 70, 0)
+
+    async def chunks():
+        for i in range(0, len(data), 3):
+            yield data[i : i + 3]
+
+    with mts.Client() as c:
+        count = asyncio.run(mts.SysExStream(c).afeed_all(chunks()))
+        f = mts.note_to_frequency(c, 69, 0)
+    assert count == 2
+    assert abs(f - 440.0 * 2 ** (1 / 12)) < 1e-9
+
+
+def test_sysex_stream_iter():
+    data = single_note_tuning_message(60, 61, 0) + single_note_tuning_message(69, 70, 0)
+    chunks = [data[i : i + 6] for i in range(0, len(data), 6)]
+    with mts.Client() as c:
+        counts = list(mts.SysExStream(c, chunks))
+        with pytest.raises(TypeError):
+            iter(mts.SysExStream(c)).__next__()
+    assert counts == [0, 1, 0, 1]
+
+
+def test_sysex_stream_aiter():
+    data = single_note_tuning_message(60, 61, 0) + single_note_tuning_message(69, 70, 0)
+
+    async def chunks():
+        for i in range(0, len(data), 6):
+            yield data[i : i + 6]
+
+    async def iterate(stream):
+        return [count async for count in stream]
+
+    with mts.Client() as c:
+        counts = asyncio.run(iterate(mts.SysExStream(c, chunks())))
+        f = mts.note_to_frequency(c, 69, 0)
+    assert counts == [0, 1, 0, 1]
+    assert abs(f - 440.0 * 2 ** (1 / 12)) < 1e-9
+
+
+EDO_19 = 440.0 * 2 ** ((np.arange(128) - 69) / 19)
+
+
+def _bend(frequency, bend_range=2.0):
+    """
+    Nearest 12-TET note and 14-bit pitch bend for a frequency.
+    """
+    semitones = 69 + 12 * np.log2(frequency / 440.0)
+    note = round(semitones)
+    return note, 8192 + round((semitones - note) / bend_range * 8192)
+
+
+def test_voice_allocator():
+    with mts.Master():
+        mts.set_note_tunings(EDO_19)
+        mts.filter_note(True, 50, -1)
+        with mts.Client() as c:
+            voices = mts.VoiceAllocator(c, channels=[1, 2, 3], bend_range=48.0)
+            assert voices.channels == [1, 2, 3]
+            assert voices.bend_range == 48.0
+            assert voices.note_on(70, 0, 100) == (1, *_bend(EDO_19[70], 48.0), -1, -1, -1)
+            assert voices.note_on(71) == (2, *_bend(EDO_19[71], 48.0), -1, -1, -1)
+            assert voices.note_on(72, 5) == (3, *_bend(EDO_19[72], 48.0), -1, -1, -1)
+            assert voices.active == 3
+            # Channel 2 was released longest ago, so is used before channel 1
+            assert voices.note_off(71) == (2, _bend(EDO_19[71])[0])
+            assert voices.note_off(70, 0) == (1, _bend(EDO_19[70])[0])
+            assert voices.note_on(60)[0] == 2
+            assert voices.note_on(61)[0] == 1
+            # The oldest voice, note 72 on channel 3, is stolen
+            stolen = _bend(EDO_19[72])[0]
+            assert voices.note_on(62) == (3, *_bend(EDO_19[62], 48.0), stolen, -1, -1)
+            assert voices.note_off(72, 5) == (-1, -1)
+            assert voices.note_on(50) == (-1, -1, -1, -1, -1, -1)
+            assert voices.note_on(60, 0, 0) == (-1, -1, -1, -1, 2, _bend(EDO_19[60])[0])
+            assert voices.active == 2
+            note_61, note_62 = _bend(EDO_19[61])[0], _bend(EDO_19[62])[0]
+            assert voices.all_notes_off() == bytes([0x81, note_61, 0, 0x83, note_62, 0])
+            assert voices.active == 0
+
+            voices = mts.VoiceAllocator(c, channels=[0], steal=False)
+            assert voices.note_on(60)[0] == 0
+            assert voices.note_on(61) == (-1, -1, -1, -1, -1, -1)
+            assert voices.note_off(61) == (-1, -1)
+
+
+def test_voice_allocator_process():
+    with mts.Master():
+        mts.set_note_tunings(EDO_19)
+        with mts.Client() as c:
+            voices = mts.VoiceAllocator(c, channels=[1, 2])
+            note_70, bend_70 = _bend(EDO_19[70])
+            note_71, bend_71 = _bend(EDO_19[71])
+            out = voices.process(bytes([0x90, 70, 100, 71, 90, 0xB0, 64, 127]))
+            assert out == bytes(
+                [0xE1, bend_70 & 0x7F, bend_70 >> 7, 0x91, note_70, 100]
+                + [0xE2, bend_71 & 0x7F, bend_71 >> 7, 0x92, note_71, 90]
+                + [0xB1, 64, 127, 0xB2, 64, 127]
+            )
+            # Running status, a message split across calls, realtime bytes
+            # within a message and SysEx passed through
+            out = voices.process(bytes([0x80, 70, 64, 0xF8, 71]))
+            out += voices.process(bytes([0, 0xF0, 1, 2, 0xF7]))
+            assert out == bytes(
+                [0x81, note_70, 64, 0xF8, 0x82, note_71, 0, 0xF0, 1, 2, 0xF7]
+            )
+            # Both channels are free, channel 1 released longest ago
+            note_60, bend_60 = _bend(EDO_19[60])
+            note_61, bend_61 = _bend(EDO_19[61])
+            out = voices.process_array([[0x91, 60, 1], [0xC0, 5, 0], [0x92, 61, 1]])
+            assert out.dtype == np.uint8
+            assert out.tolist() == [
+                [0xE1, bend_60 & 0x7F, bend_60 >> 7],
+                [0x91, note_60, 1],
+                [0xC1, 5, 0],
+                [0xC2, 5, 0],
+                [0xE2, bend_61 & 0x7F, bend_61 >> 7],
+                [0x92, note_61, 1],
+            ]
+            with pytest.raises(ValueError):
+                voices.process_array([[0x90, 60]])
+            with pytest.raises(ValueError):
+                voices.process_array([[0x90, 60, 256]])
+            with pytest.raises(TypeError):
+                voices.process(np.zeros((2, 3), dtype=np.uint8))
+
+
+def test_voice_allocator_retrigger():
+    with mts.Master():
+        mts.set_note_tunings(EDO_19)
+        with mts.Client() as c:
+            voices = mts.VoiceAllocator(c, channels=[1, 2])
+            note_70, bend_70 = _bend(EDO_19[70])
+            out = voices.process(bytes([0x90, 70, 100, 70, 90]))
+            assert out == bytes(
+                [0xE1, bend_70 & 0x7F, bend_70 >> 7, 0x91, note_70, 100]
+                + [0x81, note_70, 0]
+                + [0xE2, bend_70 & 0x7F, bend_70 >> 7, 0x92, note_70, 90]
+            )
+            assert voices.active == 1
+            assert voices.note_on(70) == (1, note_70, bend_70, -1, 2, note_70)
+            assert voices.process_array([[0x90, 70, 1]]).tolist()[0] == [0x81, note_70, 0]
+
+
+def test_voice_allocator_realtime_within_message():
+    with mts.Master():
+        mts.set_note_tunings(EDO_19)
+        with mts.Client() as c:
+            voices = mts.VoiceAllocator(c, channels=[1])
+            note_70, bend_70 = _bend(EDO_19[70])
+            # Clock bytes between the status and data bytes and within running
+            # status leave the messages whole
+            out = voices.process(bytes([0x90, 0xF8, 70, 0xF8, 100, 70, 0xFE, 0]))
+            assert out == bytes(
+                [0xF8, 0xF8, 0xE1, bend_70 & 0x7F, bend_70 >> 7, 0x91, note_70, 100]
+                + [0xFE, 0x81, note_70, 0]
+            )
+            assert voices.active == 0
+            # System common messages end running status
+            out = voices.process(bytes([0x90, 70, 100, 0xF6, 70, 0]))
+            assert out[-1:] == b"\xf6"
+            assert voices.active == 1
+
+
+def test_voice_allocator_channel_messages():
+    with mts.Master():
+        mts.set_note_tunings(EDO_19)
+        with mts.Client() as c:
+            voices = mts.VoiceAllocator(c, channels=[1, 2])
+            note_70, bend_70 = _bend(EDO_19[70])
+            voices.note_on(70, 3)
+            out = voices.process(bytes([0xA3, 70, 50, 0xA3, 71, 50, 0xD3, 40, 0xE3, 0, 64, 0xC3, 7]))
+            assert out == bytes([0xA1, note_70, 50, 0xD1, 40, 0xD2, 40, 0xC1, 7, 0xC2, 7])
+            out = voices.process_array([[0xA3, 70, 50], [0xD3, 40, 0], [0xE3, 0, 64], [0xF8, 0, 0]])
+            assert out.tolist() == [[0xA1, note_70, 50], [0xD1, 40, 0], [0xD2, 40, 0], [0xF8, 0, 0]]
+
+
+def test_voice_allocator_sends_changed_bends():
+    with mts.Master():
+        mts.set_note_tunings(EDO_19)
+        with mts.Client() as c:
+            voices = mts.VoiceAllocator(c, channels=[0])
+            note_70, bend_70 = _bend(EDO_19[70])
+            out = voices.process(bytes([0x90, 70, 1, 0x80, 70, 0, 0x90, 70, 2]))
+            assert out == bytes(
+                [0xE0, bend_70 & 0x7F, bend_70 >> 7, 0x90, note_70, 1]
+                + [0x80, note_70, 0, 0x90, note_70, 2]
+            )
+
+def test_voice_allocator_errors():
+    with mts.Client() as c:
+        with pytest.raises(ValueError):
+            mts.VoiceAllocator(c, channels=[])
+        with pytest.raises(ValueError):
+            mts.VoiceAllocator(c, channels=[1, 1])
+        with pytest.raises(ValueError):
+            mts.VoiceAllocator(c, channels=[16])
+        with pytest.raises(ValueError):
+            mts.VoiceAllocator(c, bend_range=0.0)
+        voices = mts.VoiceAllocator(c)
+        with pytest.raises(ValueError):
+            voices.note_on(128)
+        with pytest.raises(ValueError):
+            voices.note_on(60, 16)
+        with pytest.raises(ValueError):
+            voices.note_off(60, -1)
+
+
+def test_voice_allocator_bend_range_messages():
+    with mts.Client() as c:
+        voices = mts.VoiceAllocator(c, channels=range(1, 3), bend_range=12.5)
+        rpn = voices.bend_range_messages()
+    for channel, messages in zip([1, 2], [rpn[:18], rpn[18:]]):
+        cc = 0xB0 | channel
+        assert messages == bytes(
+            [cc, 101, 0, cc, 100, 0, cc, 6, 12, cc, 38, 50, cc, 101, 127, cc, 100, 127]
+        )
+    assert len(rpn) == 36
+
+
+def test_encode_single_note_tuning():
+    msg = mts.encode_single_note_tuning([69], [440.0 * 2 ** (1 / 24)], device_id=0)
+    assert msg == bytes.fromhex("F0 7F 00 08 02 00 01" + "45" + "45 40 00" + "F7")
+
+
+def test_encode_single_note_tuning_non_realtime():
+    freq = 440.0 * 2 ** (1 / 24)
+    msg = mts.encode_single_note_tuning([69], [freq], device_id=0, realtime=False)
+    assert msg == bytes.fromhex("F0 7E 00 08 07 00 00 01" + "45" + "45 40 00" + "F7")
+    msg = mts.encode_single_note_tuning([69], [freq], device_id=0, realtime=False, bank=3)
+    assert msg == bytes.fromhex("F0 7E 00 08 07 03 00 01" + "45" + "45 40 00" + "F7")
+    msg = mts.encode_single_note_tuning([69], [freq], device_id=0, bank=3)
+    assert msg == bytes.fromhex("F0 7F 00 08 07 03 00 01" + "45" + "45 40 00" + "F7")
+
+
+def test_encode_single_note_tuning_many_notes():
+    notes = np.arange(128)
+    freqs = 440.0 * 2 ** ((notes - 69) / 19)
+    data = mts.encode_single_note_tuning(notes, freqs)
+    assert data.count(0xF0) == 2
+    assert np.allclose(mts.decode_mts_sysex(data)[-1], freqs)
+
+
+def test_encode_bulk_tuning_dump():
+    freqs = 440.0 * 2 ** ((np.arange(128) - 69) / 19)
+    msg = mts.encode_bulk_tuning_dump(freqs, program=3, name="19-EDO")
+    assert len(msg) == 408
+    assert msg[:6] == bytes.fromhex("F0 7E 7F 08 01 03")
+    assert msg[6:22] == b"19-EDO          "
+    checksum = 0
+    for b in msg[1:-2]:
+        checksum ^= b
+    assert msg[-2] == checksum & 0x7F
+    with mts.Client() as c:
+        mts.parse_midi_data(c, msg)
+        client_freqs = mts.note_to_frequency_array(c, channels=0)
+        name = mts.get_scale_name(c)
+    assert np.allclose(client_freqs, freqs, rtol=1e-5)
+    assert name == "19-EDO          "
+
+
+def test_encode_bulk_tuning_dump_many():
+    freqs = np.stack([440.0 * 2 ** ((np.arange(128) - 69) / n) for n in (12, 19, 31)])
+    data = mts.encode_bulk_tuning_dump(freqs, program=10)
+    assert len(data) == 3 * 408
+    assert [data[408 * i + 5] for i in range(3)] == [10, 11, 12]
+    assert np.allclose(mts.decode_mts_sysex(data), freqs, rtol=1e-5)
+
+
+def test_encode_bulk_tuning_dump_bank():
+    msg = mts.encode_bulk_tuning_dump(np.full(128, 440.0), bank=2)
+    assert len(msg) == 409
+    assert msg[4:6] == bytes.fromhex("04 02")
+    assert np.all(mts.decode_mts_sysex(msg) == 440.0)
+
+
+def test_encode_bulk_tuning_dump_no_change():
+    freqs = np.full(128, np.nan)
+    freqs[69] = 441.0
+    decoded = mts.decode_mts_sysex(mts.encode_bulk_tuning_dump(freqs))
+    assert abs(decoded[0, 69] - 441.0) < 1e-3
+    assert decoded[0, 60] == 440.0 * 2 ** (-9 / 12)
+
+
+@pytest.mark.parametrize("two_byte", [False, True])
+def test_encode_scale_octave_tuning(two_byte):
+    cents = np.array([0, -10, 4, -16, 2, -2, -12, 2, -14, 0, -18, -12], dtype=float)
+    msg = mts.encode_scale_octave_tuning(cents, channels=[0, 9], two_byte=two_byte)
+    assert msg[4:8] == bytes([0x09 if two_byte else 0x08, 0x00, 0x04, 0x01])
+    expected = 440.0 * 2 ** ((np.arange(128) + cents[np.arange(128) % 12] / 100 - 69) / 12)
+    with mts.Client() as c:
+        mts.parse_midi_data(c, msg)
+        client_freqs = mts.note_to_frequency_array(c, channels=0)
+    assert np.allclose(client_freqs, expected, rtol=1e-5)
+    assert np.allclose(mts.decode_mts_sysex(msg)[0], client_freqs)
+
+
+def test_decode_mts_sysex_channel_mask():
+    cents = np.full(12, 10.0)
+    msg = mts.encode_scale_octave_tuning(cents, channels=[1, 9])
+    assert len(mts.decode_mts_sysex(msg)) == 0
+    assert len(mts.decode_mts_sysex(msg, midichannel=15)) == 0
+    expected = 440.0 * 2 ** ((np.arange(128) + 0.1 - 69) / 12)
+    for channel in (1, 9):
+        assert np.allclose(mts.decode_mts_sysex(msg, midichannel=channel), expected)
+    # Messages without a channel mask retune every channel
+    msg = mts.encode_single_note_tuning([69], [441.0])
+    assert len(mts.decode_mts_sysex(msg, midichannel=5)) == 1
+    with pytest.raises(ValueError):
+        mts.decode_mts_sysex(msg, midichannel=16)
+
+
+def test_decode_mts_sysex():
+    data = (
+        bytes.fromhex("F0 7F 00 08 02 00 01" + "45" + "45 40 00" + "F7")
+        + bytes.fromhex("90 45 7F")
+        + bytes.fromhex("F0 7F 00 08 02 00 01" + "3C" + "3D 00 00" + "F7")
+    )
+    decoded = mts.decode_mts_sysex(data)
+    assert decoded.shape == (2, 128)
+    assert abs(decoded[0, 69] - 440.0 * 2 ** (8192 / 16383 / 12)) < 1e-9
+    assert decoded[0, 60] == 440.0 * 2 ** (-9 / 12)
+    assert decoded[1, 69] == decoded[0, 69]
+    assert abs(decoded[1, 60] - 440.0 * 2 ** (-8 / 12)) < 1e-9
+
+
+def test_decode_mts_sysex_initial_frequencies():
+    data = bytes.fromhex("F0 7F 00 08 02 00 01" + "3C" + "3D 00 00" + "F7")
+    decoded = mts.decode_mts_sysex(data, frequencies=np.ones(128))
+    assert decoded[0, 0] == 1.0
+
+
 def master_function():
     with mts.Master():
         mts.set_note_tuning(441.0, 69)
@@ -364,6 +1370,135 @@ def test_ipc():
         assert client_task.result() == 441.0
 
 
+def standin_master_function(ready, done):
+    with mts.Master():
+        mts.set_note_tuning(441.0, 69)
+        mts.set_scale_name("stand-in")
+        ready.set()
+        done.wait(10)
+
+
+def standin_client_function(ready, results):
+    with mts.Client() as c:
+        ready.wait(10)
+        results.put(
+            (mts.note_to_frequency(c, 69, 0), mts.get_scale_name(c), mts.get_num_clients())
+        )
+
+
+@pytest.mark.skipif(
+    not mts._libmts.STANDIN_PATH.exists(), reason="libMTS stand-in not built"
+)
+def test_ipc_standin(monkeypatch):
+    """
+    Test that a master and several clients in separate processes share
+    a tuning through the libMTS stand-in.
+    """
+    name = f"/mtsespy-test-{os.getpid()}"
+    monkeypatch.setenv("MTSESPY_LIBMTS", "standin")
+    monkeypatch.setenv("MTSESPY_LIBMTS_SHM", name)
+    context = get_context("spawn")
+    ready = context.Event()
+    done = context.Event()
+    results = context.Queue()
+    n_clients = 4
+    try:
+        master = context.Process(target=standin_master_function, args=(ready, done))
+        clients = [
+            context.Process(target=standin_client_function, args=(ready, results))
+            for _ in range(n_clients)
+        ]
+        for process in clients:
+            process.start()
+        master.start()
+        received = [results.get(timeout=20) for _ in range(n_clients)]
+        done.set()
+        for process in [master, *clients]:
+            process.join(10)
+            assert process.exitcode == 0
+    finally:
+        done.set()
+        Path("/dev/shm", name.lstrip("/")).unlink(missing_ok=True)
+    for frequency, scale_name, num_clients in received:
+        assert frequency == 441.0
+        assert scale_name == "stand-in"
+        assert 1 <= num_clients <= n_clients
+
+
+def server_producer_function(proxy, midichannel):
+    with proxy:
+        for i in range(100):
+            proxy.set_multi_channel_note_tuning(400.0 + i, 60, midichannel)
+        proxy.set_multi_channel(True, midichannel)
+        proxy.sync()
+
+
+def server_client_function(results):
+    with mts.Client() as c:
+        results.put(
+            (
+                c.note_to_frequency(69, 0),
+                c.scale_name,
+                [c.note_to_frequency(60, channel) for channel in range(1, 5)],
+                c.should_filter_note(61, 0),
+            )
+        )
+
+
+@pytest.mark.skipif(
+    not mts._libmts.STANDIN_PATH.exists(), reason="libMTS stand-in not built"
+)
+def test_master_server_standin(monkeypatch):
+    """
+    Test that commands from producers in several processes reach clients
+    through a master server.
+    """
+    name = f"/mtsespy-test-server-{os.getpid()}"
+    monkeypatch.setenv("MTSESPY_LIBMTS", "standin")
+    monkeypatch.setenv("MTSESPY_LIBMTS_SHM", name)
+    context = get_context("spawn")
+    results = context.Queue()
+    try:
+        with mts.MasterServer() as server:
+            server.set_note_tuning(441.0, 69)
+            server.set_scale_name("first")
+            server.set_scale_name("served")
+            server.filter_note(True, 61, -1)
+            server.set_note_tuning(441.0, 128)
+            producers = [
+                context.Process(target=server_producer_function, args=(server, channel))
+                for channel in range(1, 5)
+            ]
+            for process in producers:
+                process.start()
+            for process in producers:
+                process.join(20)
+                assert process.exitcode == 0
+            server.sync()
+            client = context.Process(target=server_client_function, args=(results,))
+            client.start()
+            received = results.get(timeout=20)
+            client.join(10)
+            with pytest.raises(mts.MasterExistsError):
+                mts.MasterServer()
+            stats = server.stats()
+    finally:
+        Path("/dev/shm", name.lstrip("/")).unlink(missing_ok=True)
+    assert received == (441.0, "served", [499.0] * 4, True)
+    assert stats["commands"] == 5 + 4 * 101
+    assert stats["errors"] == 1
+    assert stats["writes"] < stats["commands"]
+    assert stats["max_queue_depth"] >= 1
+    assert stats["ticks"] > 0
+
+
+def test_master_server_errors():
+    with pytest.raises(ValueError):
+        mts.MasterServer(rate=0)
+    with pytest.raises(ValueError):
+        mts.MasterServer(latency=-1)
+
+
 def test_client_should_update_library():
     with mts.Client() as c:
         should_update = mts.client_should_update_library(c)
@@ -472,3 +1607,899 @@ def test_set_ref_key():
         with mts.Client() as c:
             start_key = mts.get_ref_key(c)
     assert start_key == 69
+
+
+def run_concurrently(writer, reader, n_readers=4):
+    """
+    Run one writer and several readers in parallel threads, started together.
+    """
+    barrier = Barrier(n_readers + 1)
+
+    def wait_then(f):
+        barrier.wait()
+        return f()
+
+    with ThreadPoolExecutor(n_readers + 1) as executor:
+        writer_task = executor.submit(wait_then, writer)
+        reader_tasks = [executor.submit(wait_then, reader) for _ in range(n_readers)]
+        writer_task.result()
+        return [x.result() for x in reader_tasks]
+
+
+@pytest.mark.wheel
+def test_concurrent_parse_midi_data_and_queries():
+    """
+    Test one thread retuning a client with SysEx while others query it.
+    """
+    quarter_tone_up = bytes.fromhex("F0 7F 00 08 02 00 01" + "45" + "45 40 00" + "F7")
+    no_retuning = bytes.fromhex("F0 7F 00 08 02 00 01" + "45" + "45 00 00" + "F7")
+    client = mts.register_client()
+    mts.parse_midi_data(client, quarter_tone_up)
+    ratio_up = mts.retuning_as_ratio(client, 69, 0)
+
+    def writer():
+        for i in range(2000):
+            mts.parse_midi_data(client, no_retuning if i % 2 else quarter_tone_up)
+
+    def reader():
+        ratios = set()
+        for _ in range(2000):
+            ratios.add(mts.retuning_as_ratio(client, 69, 0))
+            mts.note_to_frequency_array(client, channels=0)
+        return ratios
+
+    try:
+        results = run_concurrently(writer, reader)
+        ratio = mts.retuning_as_ratio(client, 69, 0)
+        f = mts.note_to_frequency(client, 69, 0)
+    finally:
+        mts.deregister_client(client)
+    for ratios in results:
+        assert all(abs(x - 1.0) < 1e-12 or x == ratio_up for x in ratios)
+    assert abs(ratio - f / 440.0) < 1e-12
+
+
+def test_concurrent_set_note_tunings_and_queries():
+    """
+    Test one thread setting tunings on the master while others query a client.
+
+    libMTS does not update a table atomically, so a table read during a write
+    can mix the two tunings. Each frequency read must still be one of the
+    values written, never a torn or uninitialised value.
+    """
+    frequencies_a = np.arange(1.0, 129.0)
+    frequencies_b = np.arange(1001.0, 1129.0)
+
+    def writer():
+        for i in range(2000):
+            mts.set_note_tunings(frequencies_b if i % 2 else frequencies_a)
+
+    with mts.Master():
+        mts.set_note_tunings(frequencies_a)
+        with mts.Client() as c:
+
+            def reader():
+                for _ in range(2000):
+                    freqs = mts.note_to_frequency_array(c, channels=0)
+                    assert np.all((freqs == frequencies_a) | (freqs == frequencies_b))
+                    mts.frequency_to_note(c, 500.0, 0)
+
+            run_concurrently(writer, reader)
+
+
+def test_concurrent_set_note_tunings_and_tables_read():
+    """
+    Test that reading the tables while the master sets tunings gives whole
+    tunings, where reading note by note can mix two.
+    """
+    frequencies_a = np.arange(1.0, 129.0)
+    frequencies_b = np.arange(1001.0, 1129.0)
+
+    def writer():
+        for i in range(2000):
+            mts.set_note_tunings(frequencies_b if i % 2 else frequencies_a)
+
+    with mts.Master():
+        mts.set_note_tunings(frequencies_a)
+        with mts.Client() as c:
+            tables = c.tables()
+
+            def reader():
+                out = np.empty((17, 128))
+                for _ in range(2000):
+                    tables.read(out)
+                    assert np.array_equal(out[0], frequencies_a) or np.array_equal(
+                        out[0], frequencies_b
+                    )
+
+            run_concurrently(writer, reader)
+
+
+def test_recorder(tmp_path):
+    path = tmp_path / "set.mtslog"
+    frequencies = 440.0 * 2 ** ((np.arange(128) - 69) / 19)
+    with mts.Master() as master:
+        with mts.Recorder(path) as recorder:
+            mts.set_note_tuning(441.0, 69)
+            mts.set_note_tunings(frequencies)
+            mts.set_multi_channel(True, 2)
+            mts.set_multi_channel_note_tuning(450.0, 60, 2)
+            mts.filter_note(True, 61, -1)
+            mts.set_scale_name("19-EDO")
+            mts.set_period_ratio(3.0)
+            mts.set_ref_key(60)
+            with master.batch() as batch:
+                batch.set_note_tuning(442.0, 70)
+            mts.clear_note_filter()
+        mts.set_note_tuning(443.0, 71)
+    events = list(mts.read_log(path))
+    assert recorder.events == len(events) == 10
+    assert [event.name for event in events] == [
+        "set_note_tuning",
+        "set_note_tunings",
+        "set_multi_channel",
+        "set_multi_channel_note_tuning",
+        "filter_note",
+        "set_scale_name",
+        "set_period_ratio",
+        "set_ref_key",
+        "set_note_tuning",
+        "clear_note_filter",
+    ]
+    assert events[0] == (events[0].time, "set_note_tuning", -1, 69, 441.0)
+    assert np.array_equal(events[1].value, frequencies)
+    assert events[2].value and events[2].midichannel == 2
+    assert events[3][2:] == (2, 60, 450.0)
+    assert events[4][2:] == (-1, 61, True)
+    assert events[5].value == "19-EDO"
+    assert events[6].value == 3.0
+    assert events[7].value == 60
+    assert events[8].value == 442.0
+    assert all(a.time <= b.time for a, b in zip(events, events[1:]))
+
+
+def test_replay(tmp_path):
+    path = tmp_path / "glide.mtslog"
+    target = 440.0 * 2 ** ((np.arange(128) - 69) / 19)
+    with mts.Master():
+        with mts.Recorder(path):
+            mts.set_scale_name("19-EDO")
+            mts.filter_note(True, 61, -1)
+            with mts.GlideScheduler() as glides:
+                glides.glide_to(target, duration=0.05)
+                glides.wait()
+    n_events = len(list(mts.read_log(path)))
+    for speed in [None, 1.0]:
+        with mts.Master():
+            with mts.Client() as c:
+                start = perf_counter()
+                assert mts.replay(path, speed=speed) == n_events
+                elapsed = perf_counter() - start
+                frequencies = mts.note_to_frequency_array(c, channels=0)
+                assert mts.get_scale_name(c) == "19-EDO"
+                assert mts.should_filter_note(c, 61, 5)
+        assert np.array_equal(frequencies, target)
+        if speed:
+            assert elapsed >= 0.04
+
+
+def test_replay_errors(tmp_path):
+    path = tmp_path / "notes.mtslog"
+    with mts.Master():
+        with mts.Recorder(path):
+            mts.set_note_tuning(441.0, 69)
+            mts.set_note_tuning(442.0, 70)
+            with pytest.raises(RuntimeError):
+                with mts.Recorder(tmp_path / "other.mtslog"):
+                    pass
+        data = path.read_bytes()
+        truncated = tmp_path / "truncated.mtslog"
+        truncated.write_bytes(data[:-4])
+        assert mts.replay(truncated, speed=None) == 1
+        assert len(list(mts.read_log(truncated))) == 1
+        not_log = tmp_path / "not.mtslog"
+        not_log.write_bytes(b"not a log at all")
+        with pytest.raises(ValueError):
+            mts.replay(not_log)
+        with pytest.raises(ValueError):
+            list(mts.read_log(not_log))
+        with pytest.raises(ValueError):
+            mts.replay(path, speed=0.0)
+
+
+
+def _preset_bank():
+    bank = mts.PresetBank(3)
+    note_filter = np.zeros((16, 128), dtype=bool)
+    note_filter[3, 61] = True
+    bank.set(
+        1,
+        frequencies=EDO_19,
+        note_filter=note_filter,
+        scale_name="19-EDO",
+        period_ratio=2.0,
+        map_size=19,
+        map_start_key=60,
+        ref_key=69,
+    )
+    multi_channel_frequencies = np.tile(EDO_19, (16, 1))
+    multi_channel_frequencies[2, 69] = 450.0
+    multi_channel_filter = np.zeros(128, dtype=bool)
+    multi_channel_filter[70] = True
+    bank.set(
+        2,
+        multi_channel_frequencies=multi_channel_frequencies,
+        multi_channel_filter=multi_channel_filter,
+        multi_channel=np.arange(16) == 2,
+        scale_name="BP",
+        period_ratio=3.0,
+    )
+    return bank
+
+
+def test_preset_bank():
+    bank = _preset_bank()
+    assert len(bank) == 3
+    with mts.Master():
+        with mts.Client() as c:
+            assert bank.activate(1) > 0
+            assert np.array_equal(mts.note_to_frequency_array(c, channels=0), EDO_19)
+            assert mts.should_filter_note(c, 61, 3)
+            assert not mts.should_filter_note(c, 61, 2)
+            assert mts.get_scale_name(c) == "19-EDO"
+            assert mts.get_map_size(c) == 19
+            assert mts.get_map_start_key(c) == 60
+            assert mts.get_ref_key(c) == 69
+            assert bank.activate(1) == 0
+
+            assert bank.activate(2) > 0
+            assert mts.note_to_frequency(c, 69, 2) == 450.0
+            assert mts.should_filter_note(c, 70, 2)
+            assert not mts.should_filter_note(c, 61, 3)
+            assert mts.get_scale_name(c) == "BP"
+            assert mts.get_period_ratio(c) == 3.0
+            assert bank.activate(-1) == 0
+
+            # 16 multi-channel tables, 16 filtered notes, channel 2, name
+            # and period ratio
+            assert bank.activate(0) == 16 + 16 + 1 + 1 + 1
+            assert mts.note_to_frequency(c, 69, 2) == 440.0
+            assert not mts.should_filter_note(c, 70, 2)
+            assert mts.get_scale_name(c) == "12-TET"
+            assert mts.get_map_size(c) == -1
+
+
+def test_preset_bank_diffs_against_master_writes():
+    bank = _preset_bank()
+    with mts.Master():
+        mts.set_note_tunings(EDO_19)
+        mts.set_note_tuning(441.0, 69)
+        mts.filter_note(True, 61, 3)
+        mts.set_scale_name("19-EDO")
+        mts.set_period_ratio(2.0)
+        mts.set_map_size(19)
+        mts.set_map_start_key(60)
+        mts.set_ref_key(69)
+        assert bank.activate(1) == 1
+        mts.set_multi_channel(True, 2)
+        # Channel 2 already uses multi-channel tuning
+        assert bank.activate(2) == 1 + 16 + 1 + 16 + 2 + 3
+        assert bank.activate(2) == 0
+
+
+def test_preset_bank_save_load(tmp_path):
+    path = tmp_path / "bank.mtsbank"
+    _preset_bank().save(path)
+    assert path.stat().st_size == 16 + 3 * mts.PRESET_DTYPE.itemsize
+    with mts.PresetBank.load(path) as bank:
+        assert len(bank) == 3
+        assert bank.presets["scale_name"].tolist() == [b"12-TET", b"19-EDO", b"BP"]
+        with mts.Master():
+            with mts.Client() as c:
+                bank.activate(2)
+                assert mts.note_to_frequency(c, 69, 2) == 450.0
+        with pytest.raises(ValueError):
+            bank.set(0, scale_name="read-only")
+
+
+def test_preset_bank_recorded(tmp_path):
+    bank = _preset_bank()
+    with mts.Master(), mts.Recorder(tmp_path / "presets.mtslog") as recorder:
+        writes = bank.activate(1)
+    assert recorder.events == writes
+
+
+def test_preset_bank_errors(tmp_path):
+    bank = mts.PresetBank(1)
+    with pytest.raises(IndexError):
+        bank.set(1, scale_name="x")
+    with pytest.raises(ValueError):
+        bank.set(0, frequencies=np.ones(12))
+    with pytest.raises(ValueError):
+        bank.set(0, multi_channel_frequencies=np.ones(128))
+    with pytest.raises(ValueError):
+        bank.set(0, note_filter=np.ones(12, dtype=bool))
+    with pytest.raises(ValueError):
+        bank.set(0, multi_channel=[True])
+    with pytest.raises(ValueError):
+        bank.set(0, scale_name="x" * 256)
+    with pytest.raises(ValueError):
+        bank.set(0, map_size=128)
+    with mts.Master():
+        with pytest.raises(IndexError):
+            bank.activate(1)
+        with pytest.raises(ValueError):
+            mts._mtsespy._activate_preset(b"MTSESPYX" + bytes(8), 0)
+    path = tmp_path / "bank.mtsbank"
+    bank.save(path)
+    truncated = tmp_path / "truncated.mtsbank"
+    truncated.write_bytes(path.read_bytes()[:-8])
+    with pytest.raises(ValueError):
+        mts.PresetBank.load(truncated)
+    not_bank = tmp_path / "not.mtsbank"
+    not_bank.write_bytes(b"not a bank at all")
+    with pytest.raises(ValueError):
+        mts.PresetBank.load(not_bank)
+
+def _varlen(value):
+    out = [value & 0x7F]
+    while value > 0x7F:
+        value >>= 7
+        out.insert(0, (value & 0x7F) | 0x80)
+    return bytes(out)
+
+
+def _midi_file(*tracks, division=480):
+    """
+    Standard MIDI file with tracks of (delta ticks, event bytes).
+    """
+    data = b"MThd" + (6).to_bytes(4, "big")
+    data += (1).to_bytes(2, "big") + len(tracks).to_bytes(2, "big")
+    data += division.to_bytes(2, "big")
+    for track in tracks:
+        body = b"".join(_varlen(delta) + event for delta, event in track)
+        body += b"\x00\xff\x2f\x00"
+        data += b"MTrk" + len(body).to_bytes(4, "big") + body
+    return data
+
+
+def _sysex_event(message):
+    return b"\xf0" + _varlen(len(message) - 1) + message[1:]
+
+
+def test_read_midi_file(tmp_path):
+    sysex = mts.encode_single_note_tuning([69], [441.0])
+    conductor = [
+        (0, b"\xff\x51\x03" + (1000000).to_bytes(3, "big")),
+        (960, b"\xff\x51\x03" + (250000).to_bytes(3, "big")),
+    ]
+    # Running status, and a SysEx split into an F0 and an F7 packet
+    notes = [
+        (0, b"\xf0" + _varlen(4) + sysex[1:5]),
+        (0, b"\xf7" + _varlen(len(sysex) - 5) + sysex[5:]),
+        (480, b"\x90\x45\x64"),
+        (480, b"\x45\x00"),
+        (480, b"\x81\x3c\x40"),
+    ]
+    data = _midi_file(conductor, notes)
+    path = tmp_path / "song.mid"
+    path.write_bytes(data)
+    for source in [path, str(path), data]:
+        events = list(mts.read_midi_file(source))
+        assert events == [
+            (0.0, sysex),
+            (1.0, b"\x90\x45\x64"),
+            (2.0, b"\x90\x45\x00"),
+            (2.25, b"\x81\x3c\x40"),
+        ]
+    with pytest.raises(ValueError):
+        list(mts.read_midi_file(b"RIFF" + data[4:]))
+    # Meta and SysEx events cancel running status
+    for event in [b"\xff\x01\x01a", _sysex_event(sysex)]:
+        data = _midi_file([(0, b"\x90\x45\x64"), (0, event), (480, b"\x45\x00")])
+        with pytest.raises(ValueError, match="without status"):
+            list(mts.read_midi_file(data))
+    (tmp_path / "empty.mid").write_bytes(b"")
+    with pytest.raises(ValueError):
+        list(mts.read_midi_file(tmp_path / "empty.mid"))
+
+
+def test_render_notes():
+    frequencies = 440.0 * 2 ** ((np.arange(128) - 69) / 19)
+    events = [
+        (0.0, b"\x90\x45\x64"),
+        (0.5, b"\x91\x45\x50"),
+        (1.0, b"\x80\x45\x00"),
+        (1.5, b"\x91\x45\x00"),
+        (1.5, b"\x90\x3c\x20"),
+        (2.0, b"\x90\x3c\x30"),
+        (3.0, b"\x90\x40\x10"),
+    ]
+    chunks = list(mts.render_notes(events, frequencies))
+    assert len(chunks) == 1
+    notes = chunks[0]
+    assert notes.dtype == mts.NOTE_DTYPE
+    assert notes["time"].tolist() == [0.0, 0.5, 1.5, 2.0, 3.0]
+    assert notes["duration"].tolist() == [1.0, 1.0, 0.5, 1.0, 0.0]
+    assert notes["channel"].tolist() == [0, 1, 0, 0, 0]
+    assert notes["note"].tolist() == [69, 69, 60, 60, 64]
+    assert notes["velocity"].tolist() == [100, 80, 32, 48, 16]
+    assert np.array_equal(notes["frequency"], frequencies[notes["note"]])
+
+    chunks = list(mts.render_notes(events, frequencies, chunk_size=2))
+    assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+    assert np.array_equal(np.concatenate(chunks), notes)
+    with pytest.raises(ValueError):
+        list(mts.render_notes(events, frequencies, chunk_size=0))
+    with pytest.raises(ValueError):
+        list(mts.render_notes(events, frequencies[:12]))
+
+
+def test_render_notes_channels():
+    frequencies = np.outer(np.arange(1, 17), np.arange(128) + 1.0)
+    events = [(0.0, b"\x90\x45\x64"), (0.0, b"\x93\x45\x64")]
+    (notes,) = mts.render_notes(events, frequencies)
+    assert notes["frequency"].tolist() == [70.0, 280.0]
+
+
+def test_render_notes_scale_octave_channels():
+    sysex = mts.encode_scale_octave_tuning(np.full(12, 10.0), channels=[1])
+    events = [(0.0, sysex), (0.0, b"\x90\x45\x64"), (0.0, b"\x91\x45\x64")]
+    (notes,) = mts.render_notes(events, np.full(128, 440.0))
+    assert notes["frequency"] == pytest.approx([440.0, 440.0 * 2 ** (0.1 / 12)])
+
+
+def test_render_notes_sysex():
+    sysex = mts.encode_single_note_tuning([69], [441.0])
+    data = _midi_file(
+        [
+            (0, b"\x90\x45\x64"),
+            (480, b"\x80\x45\x00"),
+            (0, _sysex_event(sysex)),
+            (0, b"\x92\x45\x64"),
+            (480, b"\x82\x45\x00"),
+        ]
+    )
+    expected = [440.0, mts.decode_mts_sysex(sysex)[0, 69]]
+    (notes,) = mts.render_notes(data, np.full(128, 440.0))
+    assert notes["frequency"] == pytest.approx(expected)
+    assert notes["time"].tolist() == [0.0, 0.5]
+    with mts.Client() as c:
+        before = mts.note_to_frequency_array(c)
+        (notes,) = mts.render_notes(data, c.snapshot())
+        assert notes["frequency"] == pytest.approx(expected)
+        assert np.array_equal(mts.note_to_frequency_array(c), before)
+        (notes,) = mts.render_notes(data, c)
+        assert notes["frequency"] == pytest.approx(expected, rel=1e-6)
+        assert mts.note_to_frequency(c, 69, 0) == pytest.approx(441.0, rel=1e-6)
+
+@pytest.fixture
+def call_stats():
+    mts.reset_stats()
+    mts.enable_stats()
+    try:
+        yield
+    finally:
+        mts.enable_stats(False)
+        mts.set_stats_hook(None)
+        mts.reset_stats()
+
+
+def test_stats(call_stats):
+    assert mts.stats_enabled()
+    with mts.Client() as c:
+        for _ in range(10):
+            mts.note_to_frequency(c, 69, 0)
+        mts.note_to_frequency_array(c)
+    stats = mts.stats()
+    entry = stats["note_to_frequency"]
+    assert entry["calls"] == 10
+    assert entry["histogram"].shape == (64,)
+    assert entry["histogram"].sum() == 10
+    assert 0 < entry["max_ns"] <= entry["total_ns"]
+    assert stats["note_to_frequency_array"]["calls"] == 1
+    assert stats["register_client"]["calls"] == 1
+    assert stats["_SignalHandler.set_handlers"]["calls"] == 1
+    assert "get_scale_name" not in stats
+    mts.reset_stats()
+    assert mts.stats() == {}
+
+
+def test_stats_disabled():
+    mts.reset_stats()
+    assert not mts.stats_enabled()
+    with mts.Client() as c:
+        mts.note_to_frequency(c, 69, 0)
+    assert mts.stats() == {}
+
+
+def test_stats_hook(call_stats):
+    calls = []
+    mts.set_stats_hook(lambda name, elapsed_ns: calls.append((name, elapsed_ns)))
+    with mts.Master():
+        mts.set_note_tuning(441.0, 69)
+    mts.set_stats_hook(None)
+    mts.set_note_tuning(442.0, 69)
+    names = [name for name, _ in calls]
+    assert names.count("set_note_tuning") == 1
+    assert "register_master" in names
+    assert all(elapsed_ns > 0 for _, elapsed_ns in calls)
+    with pytest.raises(TypeError):
+        mts.set_stats_hook(1)
+
+
+SCL_12_TET = "! 12-tet.scl\n12 tone equal temperament\n 12\n!\n" + "".join(
+    f" {100.0 * i:.1f}\n" for i in range(1, 12)
+) + " 2/1\n"
+
+KBM_432 = """! 432.kbm
+12
+0
+127
+60
+69
+432.0
+12
+0
+1
+2
+3
+4
+5
+6
+7
+8
+9
+10
+11
+"""
+
+
+@pytest.mark.wheel
+def test_scala_files_to_frequencies(tmp_path):
+    scl_file = tmp_path / "12-tet.scl"
+    scl_file.write_text(SCL_12_TET)
+    freqs = mts.scala_files_to_frequencies(scl_file)
+    assert freqs.shape == (128,)
+    assert freqs.dtype == np.float64
+    assert np.allclose(freqs, 440.0 * 2 ** ((np.arange(128) - 69) / 12))
+    kbm_file = tmp_path / "432.kbm"
+    kbm_file.write_text(KBM_432)
+    freqs = mts.scala_files_to_frequencies(str(scl_file), str(kbm_file))
+    assert np.allclose(freqs, 432.0 * 2 ** ((np.arange(128) - 69) / 12))
+
+
+@pytest.mark.wheel
+def test_scala_files_to_frequencies_cached(tmp_path):
+    scl_file = tmp_path / "12-tet.scl"
+    scl_file.write_text(SCL_12_TET)
+    freqs = mts.scala_files_to_frequencies(scl_file)
+    assert mts.scala_files_to_frequencies(scl_file) is freqs
+    assert not freqs.flags.writeable
+    scl_file.write_text(SCL_12_TET.replace(" 2/1", " 1200.0").replace("100.0", "50.0"))
+    os.utime(scl_file, ns=(0, os.stat(scl_file).st_mtime_ns + 10**9))
+    edited = mts.scala_files_to_frequencies(scl_file)
+    assert edited is not freqs
+    assert edited[61] != freqs[61]
+
+
+@pytest.mark.wheel
+def test_scala_files_to_frequencies_errors(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        mts.scala_files_to_frequencies(tmp_path / "missing.scl")
+    scl_file = tmp_path / "bad.scl"
+    scl_file.write_text("! bad.scl\nbad\n 3\n!\n 100.0\n")
+    with pytest.raises(ValueError):
+        mts.scala_files_to_frequencies(scl_file)
+
+
+
+def test_edo_scale():
+    assert np.allclose(mts.edo_scale(12), 2 ** (np.arange(1, 13) / 12))
+    assert mts.edo_scale(13, 3.0)[-1] == 3.0
+    assert mts.edo_scale(12) is mts.edo_scale(12)
+    with pytest.raises(ValueError):
+        mts.edo_scale(0)
+
+
+def test_ji_lattice_scale():
+    scale = mts.ji_lattice_scale((3, 5), ((-1, 1), (-1, 1)))
+    ratios = [16 / 15, 6 / 5, 5 / 4, 4 / 3, 3 / 2, 8 / 5, 5 / 3, 15 / 8, 2]
+    assert np.allclose(scale, ratios)
+    assert not scale.flags.writeable
+    assert mts.ji_lattice_scale([3.0, 5.0], [(-1, 1), (-1, 1)]) is scale
+    # Bohlen-Pierce: a lattice of 5 and 7 in a tritave
+    scale = mts.ji_lattice_scale((5, 7), ((0, 1), (0, 1)), period_ratio=3.0)
+    assert np.allclose(scale, [35 / 27, 5 / 3, 7 / 3, 3])
+    with pytest.raises(ValueError):
+        mts.ji_lattice_scale((3, 5), ((-1, 1),))
+    with pytest.raises(ValueError):
+        mts.ji_lattice_scale((3,), ((1, -1),))
+
+
+def test_rank2_scale():
+    meantone = mts.rank2_scale(2 ** (696.578 / 1200), 7, down=1)
+    assert len(meantone) == 7
+    cents = [193.156, 386.312, 503.422, 696.578, 889.734, 1082.89, 1200.0]
+    assert np.allclose(np.log2(meantone) * 1200, cents)
+    pythagorean = mts.rank2_scale(1.5, 5)
+    assert np.allclose(pythagorean, [9 / 8, 81 / 64, 3 / 2, 27 / 16, 2])
+    with pytest.raises(ValueError):
+        mts.rank2_scale(1.5, 5, down=5)
+
+
+def test_keyboard_frequencies():
+    freqs = mts.keyboard_frequencies(mts.edo_scale(12))
+    assert np.allclose(freqs, mts.STANDARD_FREQUENCIES)
+    assert not freqs.flags.writeable
+    assert mts.keyboard_frequencies(list(mts.edo_scale(12))) is freqs
+    freqs = mts.keyboard_frequencies(mts.edo_scale(19), ref_key=60, ref_frequency=261.0)
+    assert np.allclose(freqs, 261.0 * 2 ** ((np.arange(128) - 60) / 19))
+    # A 7 key mapping of a 12 note scale plays its first 7 degrees
+    freqs = mts.keyboard_frequencies(
+        mts.edo_scale(12), map_size=7, ref_key=60, ref_frequency=1.0
+    )
+    assert np.allclose(freqs[60:68], [*(2 ** (np.arange(7) / 12)), 2.0])
+    assert np.allclose(freqs[53], 0.5)
+    with mts.Master():
+        with mts.Client() as c:
+            mts.set_note_tunings(freqs)
+            assert np.array_equal(mts.note_to_frequency_array(c, channels=0), freqs)
+    with pytest.raises(ValueError):
+        mts.keyboard_frequencies(mts.edo_scale(12), map_size=13)
+    with pytest.raises(ValueError):
+        mts.keyboard_frequencies(mts.edo_scale(12), ref_key=128)
+    with pytest.raises(ValueError):
+        mts.keyboard_frequencies([])
+
+
+@pytest.mark.wheel
+def test_keyboard_frequencies_matches_scala(tmp_path):
+    scl_file = tmp_path / "12-tet.scl"
+    scl_file.write_text(SCL_12_TET)
+    kbm_file = tmp_path / "432.kbm"
+    kbm_file.write_text(KBM_432)
+    freqs = mts.keyboard_frequencies(mts.edo_scale(12), ref_frequency=432.0)
+    assert np.allclose(freqs, mts.scala_files_to_frequencies(scl_file, kbm_file))
+
+
+def test_isomorphic_frequencies():
+    notes = 11 + np.arange(8) + 10 * np.arange(8)[:, None]
+    freqs = mts.isomorphic_frequencies(12, (1, 5), notes, base_frequency=100.0)
+    assert freqs.shape == (128,)
+    assert freqs[11] == 100.0
+    assert np.isclose(freqs[12], 100.0 * 2 ** (1 / 12))
+    assert np.isclose(freqs[21], 100.0 * 2 ** (5 / 12))
+    assert np.isclose(freqs[88], 100.0 * 2 ** (42 / 12))
+    assert freqs[0] == mts.STANDARD_FREQUENCIES[0]
+    again = mts.isomorphic_frequencies(12, (1, 5), notes.tolist(), base_frequency=100.0)
+    assert again is freqs
+    scale = mts.ji_lattice_scale((3, 5), ((-1, 1), (-1, 1)))
+    notes = [[60, 61, -1]]
+    freqs = mts.isomorphic_frequencies(scale, (1, 3), notes, base_frequency=1.0)
+    assert freqs[[60, 61, 62]].tolist() == [1.0, scale[0], mts.STANDARD_FREQUENCIES[62]]
+
+    channels = np.repeat([[0], [1]], 3, axis=1)
+    notes = [[60, 61, 62], [60, 61, 62]]
+    freqs = mts.isomorphic_frequencies(12, (2, 1), notes, channels, 1.0)
+    assert freqs.shape == (16, 128)
+    assert np.allclose(freqs[0, 60:63], 2 ** (np.array([0, 2, 4]) / 12))
+    assert np.allclose(freqs[1, 60:63], 2 ** (np.array([1, 3, 5]) / 12))
+    assert np.array_equal(freqs[2], mts.STANDARD_FREQUENCIES)
+    with pytest.raises(ValueError):
+        mts.isomorphic_frequencies(12, (1, 5), [60, 61])
+    with pytest.raises(ValueError):
+        mts.isomorphic_frequencies(12, (1, 5), [[60, 128]])
+    with pytest.raises(ValueError):
+        mts.isomorphic_frequencies(12, (1, 5), [[60, 61]], [[0, 16]])
+    with pytest.raises(ValueError):
+        mts.isomorphic_frequencies(12, (1, 5), [[60, 61]], [[0]])
+
+def test_master_batch():
+    with mts.Master() as master:
+        with mts.Client() as c:
+            with master.batch() as batch:
+                batch.set_note_tuning(441.0, 69)
+                batch.filter_note(True, 60, -1)
+                assert mts.note_to_frequency(c, 69, 0) == 440.0
+                assert not mts.should_filter_note(c, 60, 0)
+            assert mts.note_to_frequency(c, 69, 0) == 441.0
+            assert mts.should_filter_note(c, 60, 0)
+
+
+def test_master_batch_diffs_and_coalesces():
+    freqs = 440.0 * 2 ** ((np.arange(128) - 69) / 12)
+    with mts.Master():
+        with mts.Client() as c:
+            mts.set_note_tunings(freqs)
+            batch = mts.MasterBatch()
+            batch.set_note_tunings(freqs)
+            assert batch.commit() == 0
+            for note in range(3):
+                batch.set_note_tuning(440.0, note)
+            batch.set_note_tuning(freqs[69], 69)
+            assert batch.commit() == 3
+            batch.set_note_tunings(freqs * 1.01)
+            assert batch.commit() == 1
+            assert np.allclose(mts.note_to_frequency_array(c, channels=0), freqs * 1.01)
+            batch.filter_note(True, 60, 0)
+            batch.filter_note(True, 60, 0)
+            assert batch.commit() == 1
+            batch.filter_note(True, 60, 0)
+            assert batch.commit() == 0
+            batch.clear_note_filter()
+            assert batch.commit() == 1
+            assert not mts.should_filter_note(c, 60, 0)
+
+
+def test_master_batch_multi_channel():
+    freqs = 440.0 * 2 ** ((np.arange(128) - 69) / 12)
+    with mts.Master() as master:
+        mts.set_multi_channel(True, 3)
+        with mts.Client() as c:
+            with master.batch() as batch:
+                batch.set_multi_channel_note_tunings(freqs * 1.5, 3)
+                batch.set_multi_channel_note_tuning(441.0, 69, 3)
+                batch.filter_note_multi_channel(True, 61, 3)
+            assert mts.note_to_frequency(c, 69, 3) == 441.0
+            assert mts.note_to_frequency(c, 70, 3) == pytest.approx(freqs[70] * 1.5)
+            assert mts.should_filter_note(c, 61, 3)
+            with master.batch() as batch:
+                batch.clear_note_filter_multi_channel(3)
+            assert not mts.should_filter_note(c, 61, 3)
+
+
+def test_master_batch_discarded_on_error():
+    with mts.Master() as master:
+        with mts.Client() as c:
+            with pytest.raises(RuntimeError):
+                with master.batch() as batch:
+                    batch.set_note_tuning(441.0, 69)
+                    raise RuntimeError
+            assert mts.note_to_frequency(c, 69, 0) == 440.0
+
+
+@pytest.mark.wheel
+def test_master_batch_errors():
+    batch = mts.MasterBatch()
+    with pytest.raises(ValueError):
+        batch.set_note_tuning(440.0, 128)
+    with pytest.raises(ValueError):
+        batch.filter_note(True, 60, 16)
+    with pytest.raises(ValueError):
+        batch.set_multi_channel_note_tunings(np.ones(127), 0)
+
+
+def test_glide_scheduler():
+    freqs = 440.0 * 2 ** ((np.arange(128) - 69) / 12)
+    with mts.Master(), mts.Client() as c, mts.GlideScheduler() as glides:
+        glides.glide_to(freqs * 1.25, duration=0.5)
+        sleep(0.1)
+        f = mts.note_to_frequency(c, 69, 0)
+        assert 440.0 < f < 550.0
+        assert glides.active
+        assert glides.wait(timeout=5.0)
+        assert not glides.active
+        assert mts.note_to_frequency(c, 69, 0) == pytest.approx(550.0)
+        stats = glides.stats()
+        assert stats["ticks"] > 100
+        assert stats["rate"] > 100.0
+
+
+def test_glide_scheduler_retarget_and_cancel():
+    freqs = 440.0 * 2 ** ((np.arange(128) - 69) / 12)
+    with mts.Master(), mts.Client() as c, mts.GlideScheduler(rate=500.0) as glides:
+        glides.glide_to(freqs * 2, duration=10.0, curve="smooth")
+        sleep(0.05)
+        glides.glide_to(freqs * 0.5, duration=0.05, curve="ease_out")
+        assert glides.wait(timeout=5.0)
+        assert mts.note_to_frequency(c, 69, 0) == pytest.approx(220.0)
+        glides.glide_to(freqs, duration=10.0, curve="ease_in")
+        sleep(0.05)
+        glides.cancel()
+        assert glides.wait(timeout=0.0)
+        f = mts.note_to_frequency(c, 69, 0)
+        sleep(0.05)
+        assert mts.note_to_frequency(c, 69, 0) == f
+        assert 220.0 < f < 440.0
+
+
+def test_glide_scheduler_multi_channel():
+    freqs = 440.0 * 2 ** ((np.arange(128) - 69) / 12)
+    with mts.Master(), mts.Client() as c, mts.GlideScheduler() as glides:
+        mts.set_multi_channel(True, 2)
+        glides.glide_to(freqs * 1.5, duration=0.0, midichannel=2)
+        glides.wait()
+        assert mts.note_to_frequency(c, 69, 2) == pytest.approx(660.0)
+        glides.glide_to(np.tile(freqs, (16, 1)), duration=0.0)
+        glides.wait()
+        assert mts.note_to_frequency(c, 69, 2) == pytest.approx(440.0)
+
+
+@pytest.mark.wheel
+def test_glide_scheduler_errors():
+    glides = mts.GlideScheduler()
+    with pytest.raises(ValueError):
+        glides.glide_to(np.ones(128), 1.0, curve="cubic")
+    with pytest.raises(ValueError):
+        glides.glide_to(np.ones(127), 1.0)
+    with pytest.raises(ValueError):
+        glides.glide_to(np.ones(128), -1.0)
+    with pytest.raises(ValueError):
+        glides.glide_to(np.ones(128), 1.0, midichannel=16)
+    with pytest.raises(ValueError):
+        mts.GlideScheduler(rate=0.0)
+    glides.close()
+    with pytest.raises(RuntimeError):
+        glides.glide_to(np.ones(128), 1.0)
+
+
+def test_snapshot_changes_since():
+    with mts.Master():
+        with mts.Client() as c:
+            before = c.snapshot()
+            mts.set_note_tuning(441.0, 69)
+            mts.filter_note(True, 60, 3)
+            mts.set_scale_name("changed")
+            assert c.refresh()
+            notes, filters, renamed, remapped = c.snapshot().changes_since(before)
+    assert notes.shape == filters.shape == (16, 128)
+    assert notes[:, 69].all() and notes.sum() == 16
+    assert filters[3, 60] and filters.sum() == 1
+    assert renamed
+    assert not remapped
+
+
+def test_watch():
+    async def watch_changes(c):
+        changes = mts.watch(c, interval=0.001, max_interval=0.01)
+        mts.set_note_tuning(441.0, 69)
+        change = await asyncio.wait_for(changes.__anext__(), 5.0)
+        assert change.notes[:, 69].all()
+        assert change.channels == tuple(range(16))
+        assert not change.scale_renamed
+        mts.set_scale_name("renamed")
+        change = await asyncio.wait_for(changes.__anext__(), 5.0)
+        assert change.scale_renamed
+        assert not change.notes.any()
+        assert change.channels == ()
+        assert change.snapshot.scale_name == "renamed"
+        await changes.aclose()
+
+    with mts.Master():
+        with mts.Client() as c:
+            asyncio.run(watch_changes(c))
+
+
+@pytest.mark.wheel
+def test_watch_interval_error():
+    with pytest.raises(ValueError):
+        mts.watch(None, interval=1.0, max_interval=0.5)
+
+
+def test_master_batch_partial_table_on_fresh_master():
+    with mts.Master() as master:
+        with mts.Client() as c:
+            with master.batch() as batch:
+                for note in range(36, 100):
+                    batch.set_note_tuning(440.0 * 2 ** ((note - 69) / 19), note)
+                assert batch.commit() == 1
+            assert mts.note_to_frequency(c, 99, 0) == pytest.approx(440.0 * 2 ** (30 / 19))
+            assert mts.note_to_frequency(c, 20, 0) == pytest.approx(440.0 * 2 ** (-49 / 12))
+
+
+def test_glide_scheduler_stops_with_master():
+    freqs = 440.0 * 2 ** ((np.arange(128) - 69) / 12)
+    with mts.GlideScheduler() as glides:
+        with mts.Master():
+            glides.glide_to(freqs * 1.25, duration=2.0)
+            sleep(0.05)
+        assert not glides.active
+        with mts.Master():
+            sleep(0.05)
+            with mts.Client() as c:
+                assert mts.note_to_frequency(c, 69, 0) == 440.0
+        with mts.Master():
+            glides.glide_to(freqs * 1.25, duration=2.0)
+            mts.reinitialize()
+            assert not glides.active